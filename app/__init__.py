@@ -1,16 +1,27 @@
 # Importa o Flask, framework pra criar aplicações web em Python
-from flask import Flask
+from flask import Flask, g, request
 # Importa o LoginManager do Flask-Login, pra gerenciar autenticação de usuários
 from flask_login import LoginManager
 # Importa o blueprint 'main' do arquivo routes.py (contém as rotas da aplicação)
-from app.routes import main
-# Importa a classe Usuario do arquivo models.py (representa um usuário no sistema)
-from app.models import Usuario
-# Importa a função connect_db do arquivo connection.py (conexão com o banco de dados)
-from database.connection import connect_db
+from app.routes import main, UPLOAD_FOLDER
+# Importa a fila do webhook (workers que processam as mensagens do WhatsApp em segundo plano)
+from app import message_queue
+# Importa o motor de relatórios (agregação periódica dos eventos das conversas)
+from reports import generate_reports
+# Importa a configuração de logging (fila em memória + thread que grava em disco)
+from app import logging_config
+# Importa os arquivos estáticos versionados (rota /assets e helpers dos templates)
+from app import assets
+# Importa a classe Usuario e a busca de usuário do arquivo models.py
+from app.models import Usuario, get_usuario_by_id
 # Importa bibliotecas pra carregar variáveis de ambiente do .env
 from dotenv import load_dotenv
+from werkzeug.middleware.proxy_fix import ProxyFix
+import importlib
+import logging
 import os
+import threading
+import uuid
 
 # Carrega as variáveis do arquivo .env
 load_dotenv()
@@ -18,38 +29,74 @@ load_dotenv()
 # Cria uma instância do LoginManager pra gerenciar autenticação
 login_manager = LoginManager()
 
+# Módulos pesados que as rotas importam só no primeiro uso (clientes da IA e da Twilio, pandas).
+# Com STARTUP_PREWARM=1 eles são carregados numa thread logo depois do create_app: o servidor
+# já aceita requisições enquanto isso, e a primeira resposta do WhatsApp não paga a importação.
+PREWARM = os.getenv("STARTUP_PREWARM", "1") == "1"
+PREWARM_MODULES = ("model.gemma_api", "app.twilio_sender", "pandas")
+
+# Quantos proxies reversos (nginx, balanceador) ficam na frente da aplicação. Com 0, request.remote_addr
+# é o endereço da conexão; acima disso, vem do X-Forwarded-For (e o esquema do X-Forwarded-Proto).
+# Só ligue atrás de um proxy que sobrescreve esses cabeçalhos, senão o cliente pode forjar o IP.
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "0"))
+
+def prewarm_imports(modules=PREWARM_MODULES):
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Falha ao pré-carregar {name}: {str(e)}")
+
 # Função que cria e configura a aplicação Flask
 def create_app():
+    # Configura o logging uma única vez por processo, antes de qualquer outra coisa
+    logging_config.setup_logging()
     # Inicializa a aplicação Flask, passando o nome do módulo atual
     app = Flask(__name__)
     # Define a chave secreta da aplicação (usada pra segurança em sessões e cookies)
     app.secret_key = os.getenv("SECRET_KEY")  # ou use os.getenv("SECRET_KEY") pra carregar de variável de ambiente (mais seguro)
+    # Atrás de proxy, usa o IP real do cliente (limite de tentativas de login por IP, logs)
+    if TRUSTED_PROXIES > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
     # Registra o blueprint 'main', que contém as rotas definidas em routes.py
     app.register_blueprint(main)
+    # Registra a rota /assets e os helpers asset_tags/asset_url/image_tag nos templates
+    assets.init_app(app)
 
     # Inicializa o LoginManager na aplicação Flask
     login_manager.init_app(app)
     # Define a rota de login (se o usuário não estiver autenticado, será redirecionado pra essa rota)
     login_manager.login_view = "main.login_page"  # 'main' é o nome do blueprint, 'login_page' é o nome da função da rota
 
+    # Cada requisição recebe um ID (ou usa o X-Request-ID do proxy) que aparece em todos os logs dela
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+
+    @app.after_request
+    def add_request_id_header(response):
+        if getattr(g, "request_id", None):
+            response.headers["X-Request-ID"] = g.request_id
+        return response
+
+    # Pasta dos arquivos de produtos enviados (criada aqui, não na importação das rotas)
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    # Inicia os workers da fila do webhook (retoma mensagens pendentes de execuções anteriores)
+    message_queue.start_workers()
+    # Agrega periodicamente os eventos das conversas nos relatórios por hora/dia
+    generate_reports.start_scheduler()
+    # Carrega os módulos pesados em segundo plano
+    if PREWARM:
+        threading.Thread(target=prewarm_imports, name="import-prewarm", daemon=True).start()
+
     # Retorna a aplicação Flask configurada
     return app
 
 # Decorador do Flask-Login que define como carregar um usuário a partir do ID (usado pra manter a sessão do usuário)
 @login_manager.user_loader
 def load_user(user_id):
-    # Conecta ao banco de dados usando a função connect_db
-    conn = connect_db()
-    # Cria um cursor pra executar comandos SQL (dictionary=True retorna os resultados como dicionários)
-    cursor = conn.cursor(dictionary=True)
-    # Executa uma consulta SQL pra buscar o usuário pelo ID
-    cursor.execute("SELECT * FROM usuarios WHERE id = %s", (user_id,))
-    # Pega o primeiro resultado da consulta (deve ser único, já que o ID é único)
-    user_data = cursor.fetchone()
-    # Fecha o cursor pra liberar recursos
-    cursor.close()
-    # Fecha a conexão com o banco de dados
-    conn.close()
+    # Busca o usuário pelo ID (em cache por requisição e por processo; só vai ao banco quando expira)
+    user_data = get_usuario_by_id(user_id)
 
     # Se o usuário foi encontrado no banco de dados
     if user_data:
@@ -61,4 +108,4 @@ def load_user(user_id):
             plano=user_data["plano"]
         )
     # Se o usuário não foi encontrado, retorna None (indica que o usuário não existe)
-    return None
\ No newline at end of file
+    return None
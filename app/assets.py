@@ -0,0 +1,156 @@
+# Arquivos estáticos versionados. `python -m script.build_assets` junta as bibliotecas de
+# terceiros (Bootstrap, ícones, jQuery, toastr, particles.js e a fonte Inter) em pacotes
+# locais, gera nomes com hash do conteúdo, versões .gz/.br e variantes WebP das imagens, e
+# grava tudo em app/static/dist com um manifest.json. Os templates usam os helpers abaixo:
+# com o manifest, apontam para /assets/<nome com hash> (cache imutável); sem ele (build não
+# executado), caem nas URLs das CDNs e em /static, como antes.
+import json
+import logging
+import mimetypes
+import os
+import threading
+from flask import Blueprint, abort, request, send_file, url_for
+from markupsafe import Markup, escape
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+DIST_DIR = os.getenv("ASSETS_DIST_DIR", os.path.join(STATIC_DIR, 'dist'))
+MANIFEST_NAME = "manifest.json"
+# Prefixo opcional (ex.: uma CDN na frente do /assets); vazio = servido pelo próprio app
+BASE_URL = os.getenv("ASSETS_BASE_URL", "").rstrip("/")
+ENABLED = os.getenv("ASSETS_ENABLED", "1") == "1"
+# Os nomes mudam a cada conteúdo novo, então o navegador pode guardar por um ano
+MAX_AGE = 365 * 24 * 3600
+
+mimetypes.add_type("font/woff2", ".woff2")
+mimetypes.add_type("font/woff", ".woff")
+mimetypes.add_type("image/webp", ".webp")
+
+# Pacotes e seus arquivos de origem, na ordem de concatenação (as mesmas URLs são usadas
+# sem o build). As versões ficam fixas para o build ser reproduzível.
+BUNDLES = {
+    "base.css": (
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css",
+        "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.min.css",
+        "https://fonts.googleapis.com/css2?family=Inter:wght@300;400;600;700;800&display=swap",
+    ),
+    "forms.css": (
+        "https://cdnjs.cloudflare.com/ajax/libs/toastr.js/2.1.4/toastr.min.css",
+    ),
+    "particles.js": (
+        "https://cdn.jsdelivr.net/particles.js/2.0.0/particles.min.js",
+    ),
+    "forms.js": (
+        "https://code.jquery.com/jquery-3.6.0.min.js",
+        "https://cdnjs.cloudflare.com/ajax/libs/toastr.js/2.1.4/toastr.min.js",
+    ),
+    "bootstrap.js": (
+        "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js",
+    ),
+}
+
+assets = Blueprint('assets', __name__)
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def _load_manifest():
+    path = os.path.join(DIST_DIR, MANIFEST_NAME)
+    if not ENABLED or not os.path.isfile(path):
+        logger.info("Manifest de estáticos não encontrado; usando CDNs e /static")
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def get_manifest():
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                try:
+                    _manifest = _load_manifest()
+                except Exception as e:
+                    logger.error(f"Erro ao ler o manifest de estáticos: {str(e)}")
+                    _manifest = {}
+    return _manifest
+
+
+# Relê o manifest (depois de um build com o app no ar)
+def reload_manifest():
+    global _manifest
+    with _manifest_lock:
+        _manifest = None
+    return get_manifest()
+
+
+def _dist_url(name):
+    if BASE_URL:
+        return f"{BASE_URL}/{name}"
+    return url_for('assets.serve', filename=name)
+
+
+# URL de um arquivo de app/static (ex.: "images/logo.svg"), com hash se houver build
+def asset_url(path):
+    hashed = get_manifest().get("files", {}).get(path)
+    if hashed:
+        return _dist_url(hashed)
+    return url_for('static', filename=path)
+
+
+# Tags <link>/<script> de um pacote: um arquivo local com hash ou, sem build, um por CDN
+def asset_tags(bundle, defer=False):
+    hashed = get_manifest().get("bundles", {}).get(bundle)
+    urls = [_dist_url(hashed)] if hashed else BUNDLES[bundle]
+    if bundle.endswith(".css"):
+        return Markup("\n    ".join(f'<link href="{escape(url)}" rel="stylesheet">' for url in urls))
+    attrs = " defer" if defer else ""
+    return Markup("\n    ".join(f'<script src="{escape(url)}"{attrs}></script>' for url in urls))
+
+
+# <picture> com as variantes WebP (srcset) e o arquivo original como fallback.
+# `sizes` descreve a largura exibida (ex.: "40px") para o navegador escolher a variante.
+def image_tag(path, alt, sizes="100vw", lazy=True):
+    image = get_manifest().get("images", {}).get(path)
+    loading = ' loading="lazy" decoding="async"' if lazy else ''
+    if not image:
+        return Markup(f'<img src="{escape(asset_url(path))}" alt="{escape(alt)}"{loading}>')
+    srcset = ", ".join(f"{_dist_url(name)} {width}w" for width, name in image["webp"])
+    return Markup(
+        '<picture style="display: contents">'
+        f'<source type="image/webp" srcset="{escape(srcset)}" sizes="{escape(sizes)}">'
+        f'<img src="{escape(_dist_url(image["src"]))}" alt="{escape(alt)}" '
+        f'width="{image["width"]}" height="{image["height"]}"{loading}>'
+        '</picture>'
+    )
+
+
+# Serve os arquivos do build, preferindo a versão .br/.gz já comprimida quando o cliente aceita
+@assets.route('/assets/<path:filename>')
+def serve(filename):
+    if filename == MANIFEST_NAME:
+        abort(404)
+    path = safe_join(DIST_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for name, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if request.accept_encodings[name] and os.path.isfile(path + suffix):
+            path, encoding = path + suffix, name
+            break
+    response = send_file(path, mimetype=mimetype, conditional=True, max_age=MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    app.register_blueprint(assets)
+    app.jinja_env.globals.update(asset_url=asset_url, asset_tags=asset_tags, image_tag=image_tag)
@@ -0,0 +1,227 @@
+# Hash de senhas do login e do cadastro. O cálculo (bcrypt, pbkdf2 ou scrypt, com custo
+# configurável) roda num pool limitado de threads: uma rajada de logins ocupa no máximo
+# AUTH_HASH_WORKERS núcleos e o excedente é recusado na hora, sem travar os demais requests.
+# Hashes com parâmetros diferentes dos configurados são refeitos no primeiro login correto.
+# Tentativas erradas por e-mail e por IP são contadas e bloqueadas antes de calcular o hash.
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import bcrypt
+from werkzeug.security import generate_password_hash, check_password_hash
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# bcrypt, pbkdf2 ou scrypt (os dois últimos no formato do werkzeug). O padrão é o mesmo do
+# generate_password_hash (scrypt:32768:8:1), para não encarecer o login nem refazer os hashes atuais
+ALGORITHM = os.getenv("AUTH_HASH_ALGORITHM", "scrypt").lower()
+# Custo do algoritmo: rounds do bcrypt, iterações do pbkdf2 ou N do scrypt
+DEFAULT_COSTS = {"bcrypt": 12, "pbkdf2": 600000, "scrypt": 32768}
+COST = int(os.getenv("AUTH_HASH_COST", "0")) or DEFAULT_COSTS.get(ALGORITHM, 0)
+# Hashes calculados ao mesmo tempo (bcrypt e hashlib liberam o GIL) e quantos podem esperar
+WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_PENDING = int(os.getenv("AUTH_HASH_MAX_PENDING", str(WORKERS * 8)))
+# Espera máxima pelo resultado de um hash (fila + cálculo)
+TIMEOUT = float(os.getenv("AUTH_HASH_TIMEOUT", "10"))
+# Tentativas erradas permitidas por e-mail e por IP dentro da janela
+MAX_FAILURES_PER_EMAIL = int(os.getenv("LOGIN_MAX_FAILURES_PER_EMAIL", "5"))
+MAX_FAILURES_PER_IP = int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", "20"))
+FAILURE_WINDOW = float(os.getenv("LOGIN_FAILURE_WINDOW", "900"))
+# Chaves (e-mails/IPs) acompanhadas em memória
+LIMITER_MAX_KEYS = int(os.getenv("LOGIN_LIMITER_MAX_KEYS", "100000"))
+
+# O bcrypt só considera os primeiros 72 bytes da senha
+BCRYPT_MAX_BYTES = 72
+
+if ALGORITHM not in DEFAULT_COSTS:
+    raise ValueError(f"AUTH_HASH_ALGORITHM inválido: {ALGORITHM} (use bcrypt, pbkdf2 ou scrypt)")
+
+# Parâmetros gravados no hash com a configuração atual (comparados no login para decidir o rehash)
+PARAMS = {"bcrypt": (str(COST),), "pbkdf2": ("sha256", str(COST)), "scrypt": (str(COST), "8", "1")}[ALGORITHM]
+
+hash_latency = metrics.Histogram("auth_hash_duration_seconds", "Tempo de cálculo dos hashes de senha", ("operation",))
+hash_rejected = metrics.Counter("auth_hash_rejected_total", "Hashes recusados com o pool cheio", ("operation",))
+login_blocked = metrics.Counter("login_blocked_total", "Logins recusados pelo limite de tentativas", ("reason",))
+rehashed = metrics.Counter("auth_rehash_total", "Hashes de senha refeitos no login", ("from_algorithm",))
+
+
+class AuthError(Exception):
+    pass
+
+
+# Pool de hash cheio: o cliente deve tentar de novo em instantes (HTTP 503)
+class AuthBusy(AuthError):
+    pass
+
+
+# Muitas tentativas erradas: bloqueado por retry_after segundos (HTTP 429)
+class TooManyAttempts(AuthError):
+    def __init__(self, retry_after):
+        super().__init__(f"Muitas tentativas de login; tente novamente em {int(retry_after) + 1} segundos")
+        self.retry_after = retry_after
+
+
+def _bcrypt_password(senha):
+    return senha.encode("utf-8")[:BCRYPT_MAX_BYTES]
+
+
+def _hash(senha):
+    if ALGORITHM == "bcrypt":
+        return bcrypt.hashpw(_bcrypt_password(senha), bcrypt.gensalt(rounds=COST)).decode("ascii")
+    return generate_password_hash(senha, method=":".join((ALGORITHM,) + PARAMS))
+
+
+# (algoritmo, parâmetros) de um hash gravado; formatos: $2b$12$..., pbkdf2:sha256:600000$..., scrypt:32768:8:1$...
+def _parse(senha_hash):
+    if senha_hash.startswith("$2"):
+        return "bcrypt", (senha_hash.split("$")[2],)
+    method = senha_hash.split("$", 1)[0].split(":")
+    return method[0], tuple(method[1:])
+
+
+# Refaz o hash quando o algoritmo ou qualquer parâmetro difere do configurado (mais caro ou mais barato)
+def needs_rehash(senha_hash):
+    return _parse(senha_hash) != (ALGORITHM, PARAMS)
+
+
+def _verify(senha_hash, senha):
+    if senha_hash.startswith("$2"):
+        return bcrypt.checkpw(_bcrypt_password(senha), senha_hash.encode("ascii"))
+    return check_password_hash(senha_hash, senha)
+
+
+class HashPool:
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING, timeout=TIMEOUT):
+        self.pid = os.getpid()
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="auth-hash")
+        # Vagas para hashes em execução ou na fila; sem vaga, recusa em vez de enfileirar
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def _timed(self, operation, fn, args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            hash_latency.observe(time.perf_counter() - start, operation=operation)
+            self._slots.release()
+
+    def run(self, operation, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            hash_rejected.inc(operation=operation)
+            raise AuthBusy("Servidor ocupado, tente novamente em instantes")
+        try:
+            future = self._executor.submit(self._timed, operation, fn, args)
+        except Exception:
+            self._slots.release()
+            raise
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # O cálculo continua no pool e libera a vaga ao terminar
+            hash_rejected.inc(operation=operation)
+            raise AuthBusy("Servidor ocupado, tente novamente em instantes")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Pool do processo atual (recriado após fork, como o pool de conexões)
+def get_pool():
+    global _pool
+    pool = _pool
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = HashPool()
+            pool = _pool
+    return pool
+
+
+def hash_password(senha):
+    return get_pool().run("hash", _hash, senha)
+
+
+# Retorna (senha_correta, precisa_refazer_hash)
+def verify_password(senha_hash, senha):
+    if not senha_hash:
+        return False, False
+    ok = get_pool().run("verify", _verify, senha_hash, senha)
+    return ok, ok and needs_rehash(senha_hash)
+
+
+# Contagem de falhas por chave numa janela fixa; as chaves mais antigas saem quando enche
+class AttemptLimiter:
+    def __init__(self, max_failures, window=FAILURE_WINDOW, max_keys=LIMITER_MAX_KEYS):
+        self.max_failures = max_failures
+        self.window = window
+        self.max_keys = max_keys
+        self._failures = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Segundos até a chave ser liberada (0 se ainda pode tentar)
+    def retry_after(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._failures.get(key)
+            if item is None:
+                return 0
+            count, reset_at = item
+            if reset_at <= now:
+                del self._failures[key]
+                return 0
+            return reset_at - now if count >= self.max_failures else 0
+
+    def record_failure(self, key):
+        now = time.monotonic()
+        with self._lock:
+            count, reset_at = self._failures.pop(key, (0, now + self.window))
+            if reset_at <= now:
+                count, reset_at = 0, now + self.window
+            self._failures[key] = (count + 1, reset_at)
+            while len(self._failures) > self.max_keys:
+                self._failures.popitem(last=False)
+
+    def reset(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+    def __len__(self):
+        return len(self._failures)
+
+
+_email_limiter = AttemptLimiter(MAX_FAILURES_PER_EMAIL)
+_ip_limiter = AttemptLimiter(MAX_FAILURES_PER_IP)
+
+
+def _email_key(email):
+    return (email or "").strip().lower()
+
+
+# Chamado antes de buscar o usuário e calcular o hash; levanta TooManyAttempts se bloqueado
+def check_login_allowed(email, ip=None):
+    for reason, limiter, key in (("email", _email_limiter, _email_key(email)), ("ip", _ip_limiter, ip)):
+        if not key:
+            continue
+        retry_after = limiter.retry_after(key)
+        if retry_after:
+            login_blocked.inc(reason=reason)
+            logger.warning(f"Login bloqueado por excesso de tentativas ({reason}) para {email}")
+            raise TooManyAttempts(retry_after)
+
+
+def record_login(email, ip, ok):
+    if ok:
+        _email_limiter.reset(_email_key(email))
+        return
+    _email_limiter.record_failure(_email_key(email))
+    if ip:
+        _ip_limiter.record_failure(ip)
+
+
+def record_rehash(senha_hash):
+    rehashed.inc(from_algorithm=_parse(senha_hash)[0])
@@ -0,0 +1,289 @@
+# Memória das conversas do WhatsApp por empresa e remetente: as últimas mensagens ficam num
+# buffer circular em memória e são gravadas em SQLite em segundo plano (write-behind), em lote.
+# O histórico enviado à IA respeita um orçamento de tokens; o que sai do buffer vira um resumo
+# curto dos assuntos anteriores. Conversas paradas são gravadas e removidas da memória.
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from database.local_store import connect_local
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("CONVERSATION_MEMORY_ENABLED", "1") == "1"
+CONVERSATIONS_DB = os.getenv("CONVERSATIONS_DB", "conversations.sqlite3")
+# Mensagens (cliente + assistente) guardadas por conversa
+MAX_MESSAGES = int(os.getenv("CONVERSATION_MAX_MESSAGES", "12"))
+MAX_MESSAGE_CHARS = int(os.getenv("CONVERSATION_MAX_MESSAGE_CHARS", "1000"))
+# Tokens de histórico (estimados) enviados à IA junto com a mensagem nova
+TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "600"))
+SUMMARY_MAX_CHARS = int(os.getenv("CONVERSATION_SUMMARY_MAX_CHARS", "400"))
+# Conversas mantidas em memória (LRU) e tempo sem mensagens até sair da memória
+MAX_ACTIVE = int(os.getenv("CONVERSATION_MAX_ACTIVE", "10000"))
+IDLE_TTL = float(os.getenv("CONVERSATION_IDLE_TTL", "1800"))
+# Intervalo da gravação em lote (com vários processos, um valor baixo reduz a janela
+# em que outro processo ainda não vê as últimas mensagens)
+FLUSH_INTERVAL = float(os.getenv("CONVERSATION_FLUSH_INTERVAL", "1.0"))
+# Conversas apagadas do SQLite depois desse tempo sem mensagens
+RETENTION = float(os.getenv("CONVERSATION_RETENTION", str(30 * 24 * 3600)))
+
+_schema_ready = set()
+
+
+def _db():
+    conn = connect_local(CONVERSATIONS_DB)
+    if os.getpid() not in _schema_ready:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                key TEXT PRIMARY KEY,
+                messages TEXT NOT NULL,
+                summary TEXT NOT NULL DEFAULT '',
+                version INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations (updated_at)")
+        _schema_ready.add(os.getpid())
+    return conn
+
+
+# Estimativa grosseira (~4 caracteres por token), suficiente para o orçamento do histórico
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def conversation_key(empresa_id, sender):
+    return f"{empresa_id if empresa_id is not None else '-'}:{sender}"
+
+
+class Conversation:
+    __slots__ = ("messages", "summary", "version", "last_active", "dirty")
+
+    def __init__(self, messages=(), summary="", version=0):
+        self.messages = deque(messages, maxlen=MAX_MESSAGES)
+        self.summary = summary
+        self.version = version
+        self.last_active = time.monotonic()
+        self.dirty = False
+
+    def append(self, role, content):
+        if len(self.messages) == self.messages.maxlen:
+            self._summarize(self.messages[0])
+        self.messages.append({"role": role, "content": content[:MAX_MESSAGE_CHARS]})
+        self.version += 1
+        self.dirty = True
+        self.last_active = time.monotonic()
+
+    # Guarda só as perguntas do cliente que saem do buffer, como uma lista curta de assuntos
+    def _summarize(self, message):
+        if message["role"] != "user":
+            return
+        assunto = " ".join(message["content"].split())[:80]
+        summary = f"{self.summary}; {assunto}" if self.summary else assunto
+        self.summary = summary[-SUMMARY_MAX_CHARS:]
+
+    # Mensagens mais recentes que cabem no orçamento de tokens (em ordem cronológica), com o
+    # resumo dos assuntos anteriores na frente se ainda couber
+    def history(self, token_budget=TOKEN_BUDGET):
+        selected = []
+        used = 0
+        for message in reversed(self.messages):
+            cost = estimate_tokens(message["content"])
+            if used + cost > token_budget:
+                break
+            selected.append(dict(message))
+            used += cost
+        selected.reverse()
+        # Não começa o histórico por uma resposta sem a pergunta correspondente
+        while selected and selected[0]["role"] != "user":
+            used -= estimate_tokens(selected.pop(0)["content"])
+        if self.summary:
+            resumo = f"Assuntos anteriores desta conversa: {self.summary}"
+            if used + estimate_tokens(resumo) <= token_budget:
+                selected.insert(0, {"role": "system", "content": resumo})
+        return selected
+
+
+class ConversationStore:
+    def __init__(self, max_active=MAX_ACTIVE, idle_ttl=IDLE_TTL, flush_interval=FLUSH_INTERVAL):
+        self.max_active = max_active
+        self.idle_ttl = idle_ttl
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self._active = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"loads": 0, "reloads": 0, "flushes": 0, "written": 0, "evicted_idle": 0, "evicted_lru": 0}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="conversation-flusher", daemon=True)
+        self._thread.start()
+
+    def _load(self, key):
+        row = _db().execute("SELECT messages, summary, version FROM conversations WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return Conversation()
+        return Conversation(json.loads(row["messages"]), row["summary"], row["version"])
+
+    def _persisted_version(self, key):
+        row = _db().execute("SELECT version FROM conversations WHERE key = ?", (key,)).fetchone()
+        return row["version"] if row else 0
+
+    # Conversa do remetente (carregada do SQLite se não estiver em memória ou se outro
+    # processo gravou uma versão mais nova)
+    def get(self, key):
+        with self._lock:
+            conversation = self._active.get(key)
+            if conversation is not None:
+                self._active.move_to_end(key)
+                if conversation.dirty:
+                    return conversation
+        if conversation is not None and self._persisted_version(key) <= conversation.version:
+            return conversation
+        loaded = self._load(key)
+        evicted = []
+        with self._lock:
+            current = self._active.get(key)
+            if current is not None and (current.dirty or current.version >= loaded.version):
+                return current
+            self._active[key] = loaded
+            self._active.move_to_end(key)
+            self._stats["reloads" if current is not None else "loads"] += 1
+            while len(self._active) > self.max_active:
+                old_key, old = self._active.popitem(last=False)
+                self._stats["evicted_lru"] += 1
+                if old.dirty:
+                    evicted.append((old_key, old))
+        if evicted:
+            self._write(evicted)
+        return loaded
+
+    def history(self, key, token_budget=TOKEN_BUDGET):
+        conversation = self.get(key)
+        with self._lock:
+            return conversation.history(token_budget)
+
+    def append(self, key, *messages):
+        conversation = self.get(key)
+        with self._lock:
+            for role, content in messages:
+                conversation.append(role, content)
+
+    def _write(self, items):
+        now = time.time()
+        rows = []
+        for key, conversation in items:
+            rows.append((key, json.dumps(list(conversation.messages), ensure_ascii=False), conversation.summary, conversation.version, now))
+        conn = _db()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT INTO conversations (key, messages, summary, version, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET messages = excluded.messages, summary = excluded.summary, "
+                "version = excluded.version, updated_at = excluded.updated_at "
+                "WHERE excluded.version >= conversations.version",
+                rows
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._stats["flushes"] += 1
+            self._stats["written"] += len(rows)
+
+    # Grava as conversas alteradas e tira da memória as paradas há mais de idle_ttl
+    def flush(self, evict_idle=True):
+        now = time.monotonic()
+        with self._lock:
+            dirty = []
+            for key, conversation in self._active.items():
+                if conversation.dirty:
+                    conversation.dirty = False
+                    dirty.append((key, conversation))
+            idle = [key for key, conversation in self._active.items() if evict_idle and now - conversation.last_active > self.idle_ttl]
+            # Snapshot dentro do lock: as mensagens podem mudar enquanto o lote é gravado
+            snapshot = [(key, Conversation(conversation.messages, conversation.summary, conversation.version)) for key, conversation in dirty]
+        if snapshot:
+            try:
+                self._write(snapshot)
+            except Exception as e:
+                logger.error(f"Erro ao gravar conversas: {str(e)}")
+                with self._lock:
+                    for key, conversation in dirty:
+                        conversation.dirty = True
+                return
+        with self._lock:
+            for key in idle:
+                conversation = self._active.get(key)
+                if conversation is not None and not conversation.dirty and now - conversation.last_active > self.idle_ttl:
+                    del self._active[key]
+                    self._stats["evicted_idle"] += 1
+
+    def _run(self):
+        last_cleanup = time.monotonic()
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            if time.monotonic() - last_cleanup > 3600:
+                last_cleanup = time.monotonic()
+                try:
+                    _db().execute("DELETE FROM conversations WHERE updated_at < ?", (time.time() - RETENTION,))
+                except Exception as e:
+                    logger.error(f"Erro ao apagar conversas antigas: {str(e)}")
+
+    def close(self):
+        self._stop.set()
+        self.flush(evict_idle=False)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data["active"] = len(self._active)
+            data["dirty"] = sum(1 for c in self._active.values() if c.dirty)
+        return data
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# Store do processo atual (recriado após fork, como o pool de conexões)
+def get_store():
+    global _store
+    store = _store
+    if store is None or store.pid != os.getpid():
+        with _store_lock:
+            if _store is None or _store.pid != os.getpid():
+                _store = ConversationStore()
+                atexit.register(_store.close)
+            store = _store
+    return store
+
+
+# Histórico recente da conversa (lista de mensagens no formato da API de chat)
+def history(empresa_id, sender):
+    if not ENABLED or not sender:
+        return []
+    try:
+        return get_store().history(conversation_key(empresa_id, sender))
+    except Exception as e:
+        logger.error(f"Erro ao ler a conversa de {sender}: {str(e)}")
+        return []
+
+
+def record_turn(empresa_id, sender, message, response):
+    if not ENABLED or not sender:
+        return
+    try:
+        get_store().append(conversation_key(empresa_id, sender), ("user", message), ("assistant", response))
+    except Exception as e:
+        logger.error(f"Erro ao gravar a conversa de {sender}: {str(e)}")
+
+
+def conversation_stats():
+    if not ENABLED:
+        return {"enabled": False}
+    data = get_store().stats()
+    data["enabled"] = True
+    return data
@@ -0,0 +1,66 @@
+# Versões dos dados de cada empresa (persona, produtos). Cada alteração incrementa a versão;
+# caches usam a versão na chave, então uma alteração num worker invalida os caches de todos.
+import os
+import threading
+import time
+from database.local_store import connect_local
+
+# Compartilha as versões entre os processos via SQLite (senão valem só para o processo atual)
+SHARED = os.getenv("DATA_VERSIONS_SHARED", "1") == "1"
+VERSIONS_DB = os.getenv("DATA_VERSIONS_DB", "data_versions.sqlite3")
+# Por quanto tempo (segundos) um processo confia na versão lida antes de relê-la
+CHECK_INTERVAL = float(os.getenv("DATA_VERSIONS_CHECK_INTERVAL", "1.0"))
+# Escopo usado quando os dados não são de uma empresa específica (ex.: catálogo global)
+GLOBAL_SCOPE = "global"
+
+_lock = threading.Lock()
+_versions = {}
+_schema_ready = set()
+
+
+def _db():
+    conn = connect_local(VERSIONS_DB)
+    if os.getpid() not in _schema_ready:
+        conn.execute("CREATE TABLE IF NOT EXISTS versions (scope TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        _schema_ready.add(os.getpid())
+    return conn
+
+
+def scope_for(empresa_id):
+    return str(empresa_id) if empresa_id is not None else GLOBAL_SCOPE
+
+
+# Versão atual dos dados da empresa (empresa_id=None: escopo global)
+def current(empresa_id=None):
+    scope = scope_for(empresa_id)
+    now = time.monotonic()
+    with _lock:
+        cached = _versions.get(scope)
+    if cached and (cached[1] > now or not SHARED):
+        return cached[0]
+    version = 0
+    if SHARED:
+        row = _db().execute("SELECT version FROM versions WHERE scope = ?", (scope,)).fetchone()
+        version = row["version"] if row else 0
+    with _lock:
+        _versions[scope] = (version, now + CHECK_INTERVAL)
+    return version
+
+
+# Incrementa a versão (chamado depois de salvar persona, produtos etc.)
+def bump(empresa_id=None):
+    scope = scope_for(empresa_id)
+    if SHARED:
+        row = _db().execute(
+            "INSERT INTO versions (scope, version) VALUES (?, 1) "
+            "ON CONFLICT(scope) DO UPDATE SET version = version + 1 RETURNING version",
+            (scope,)
+        ).fetchone()
+        version = row["version"]
+        with _lock:
+            _versions[scope] = (version, time.monotonic() + CHECK_INTERVAL)
+        return version
+    with _lock:
+        version = _versions.get(scope, (0, 0))[0] + 1
+        _versions[scope] = (version, float("inf"))
+    return version
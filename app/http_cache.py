@@ -0,0 +1,109 @@
+# Respostas reaproveitáveis: arquivos gerados uma vez em memória (modelos de download) e
+# páginas renderizadas por empresa, ambos com ETag/Last-Modified e resposta 304 quando o
+# navegador já tem a versão atual. As páginas ficam num cache por empresa + versão dos dados
+# (app.data_versions) + usuário, então salvar a persona ou os produtos gera uma página nova.
+import hashlib
+import logging
+import os
+import threading
+import time
+from flask import Response, request
+from app import data_versions
+from app.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("PAGE_CACHE_ENABLED", "1") == "1"
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "1000"))
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "600"))
+# Tempo que o navegador pode usar um arquivo gerado sem revalidar
+ARTIFACT_MAX_AGE = int(os.getenv("ARTIFACT_MAX_AGE", "3600"))
+
+_artifacts = {}
+_artifacts_lock = threading.Lock()
+_pages = TTLCache(maxsize=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL)
+
+
+def _etag(body):
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+class Artifact:
+    __slots__ = ("body", "etag", "last_modified", "mimetype", "download_name")
+
+    def __init__(self, body, mimetype, download_name=None):
+        self.body = body
+        self.etag = _etag(body)
+        self.last_modified = time.time()
+        self.mimetype = mimetype
+        self.download_name = download_name
+
+
+# Arquivo gerado por build() na primeira chamada e mantido em memória pelo resto do processo
+def artifact(name, build, mimetype, download_name=None):
+    item = _artifacts.get(name)
+    if item is None:
+        with _artifacts_lock:
+            item = _artifacts.get(name)
+            if item is None:
+                body = build()
+                if isinstance(body, str):
+                    body = body.encode('utf-8')
+                item = _artifacts[name] = Artifact(body, mimetype, download_name)
+                logger.info(f"Arquivo {name} gerado em memória ({len(body)} bytes)")
+    return item
+
+
+def send_artifact(item):
+    response = Response(item.body, mimetype=item.mimetype)
+    response.set_etag(item.etag)
+    response.last_modified = item.last_modified
+    response.cache_control.private = True
+    response.cache_control.max_age = ARTIFACT_MAX_AGE
+    if item.download_name:
+        response.headers.set('Content-Disposition', 'attachment', filename=item.download_name)
+    return response.make_conditional(request)
+
+
+# Parte da chave de uma página que mostra dados do usuário: o ID e uma versão tirada dos campos
+# exibidos (nome, e-mail, plano), para a página de um usuário nunca ser servida a outro e mudar
+# junto com o perfil
+def _user_key(usuario):
+    fields = "\0".join(str(getattr(usuario, field, "")) for field in ("nome", "email", "plano"))
+    return f"u{usuario.id}:{hashlib.sha256(fields.encode('utf-8')).hexdigest()[:12]}"
+
+
+# Página (ou trecho) da empresa renderizada por render(), reaproveitada enquanto a versão dos
+# dados não mudar. Se render() usa o usuário logado, passe-o em usuario. Retorna (html, etag).
+def cached_page(name, empresa_id, render, usuario=None):
+    if not ENABLED:
+        html = render()
+        return html, _etag(html.encode('utf-8'))
+    version = data_versions.current(empresa_id)
+    key = f"{data_versions.scope_for(empresa_id)}:{version}:{name}"
+    if usuario is not None:
+        key = f"{key}:{_user_key(usuario)}"
+    item = _pages.get(key)
+    if item is None:
+        html = render()
+        item = (html, _etag(f"{key}:{html}".encode('utf-8')))
+        _pages.set(key, item)
+    return item
+
+
+# Resposta de página autenticada: o navegador sempre revalida (no-cache), mas recebe 304
+# sem corpo se a página não mudou
+def send_page(html, etag):
+    response = Response(html, mimetype='text/html')
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
+
+
+def page_cache_stats():
+    data = _pages.stats()
+    data["enabled"] = ENABLED
+    data["artifacts"] = len(_artifacts)
+    return data
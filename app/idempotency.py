@@ -0,0 +1,50 @@
+# Entregas repetidas do /webhook. A Twilio reenvia a mesma mensagem (mesmo MessageSid) quando
+# a resposta demora ou a conexão cai; sem isso, cada reenvio virava outra chamada à IA e outra
+# resposta no WhatsApp. Camadas: LRU com TTL no processo (repetição respondida sem tocar em
+# disco) e a tabela de chaves da fila em SQLite, compartilhada entre os workers do gunicorn e
+# gravada na mesma transação do job (app.message_queue.enqueue_unique).
+import logging
+import os
+import threading
+from app import message_queue
+from app.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("WEBHOOK_DEDUP_ENABLED", "1") == "1"
+# MessageSids lembrados em memória por processo
+MEMORY_SIZE = int(os.getenv("WEBHOOK_DEDUP_MEMORY_SIZE", "100000"))
+TTL = message_queue.DEDUP_TTL
+
+_memory = TTLCache(maxsize=MEMORY_SIZE, ttl=TTL)
+_lock = threading.Lock()
+_stats = {"unique": 0, "duplicates_memory": 0, "duplicates_shared": 0, "without_key": 0}
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+# Enfileira a mensagem uma única vez por chave; retorna (job_id, duplicada). Uma repetição
+# recebe o job da primeira entrega, esteja ele na fila, em andamento ou concluído.
+def enqueue_once(key, sender, payload):
+    if not ENABLED or not key:
+        _count("without_key")
+        return message_queue.enqueue(sender, payload), False
+    job_id = _memory.get(key)
+    if job_id is not None:
+        _count("duplicates_memory")
+        return job_id, True
+    job_id, created = message_queue.enqueue_unique(key, sender, payload)
+    _memory.set(key, job_id)
+    _count("unique" if created else "duplicates_shared")
+    return job_id, not created
+
+
+def dedup_stats():
+    with _lock:
+        data = dict(_stats)
+    data["enabled"] = ENABLED
+    data["memory"] = _memory.stats()
+    return data
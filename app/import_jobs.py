@@ -0,0 +1,326 @@
+# Importação de produtos em segundo plano: o upload retorna um ID de job na hora e um pool de
+# processos executa as etapas de leitura, validação e gravação. O estado fica em SQLite pra que
+# qualquer worker do gunicorn responda a consulta em /jobs/<id>.
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from database.local_store import connect_local
+from app import logging_config
+from app.models import save_produtos, sync_produtos, remover_produtos_ausentes
+from app.utils import open_produtos_file, iter_chunks, IngestError, INGEST_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB = os.getenv("IMPORT_JOBS_DB", "import_jobs.sqlite3")
+# Processos dedicados às importações (por worker do gunicorn)
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+# Quantos códigos duplicados e linhas de pré-visualização guardar no resultado
+MAX_REPORTED_DUPLICATES = 1000
+PREVIEW_ROWS = 200
+TERMINAL_STATUSES = ('done', 'failed')
+# Importação em andamento sem atualização há mais tempo que isso é dada como perdida
+STALE_AFTER = float(os.getenv("IMPORT_JOB_STALE_SECONDS", "300"))
+
+_COLUMNS = {
+    "usuario_id": "TEXT NOT NULL DEFAULT ''",
+    "empresa_id": "INTEGER",
+    "filename": "TEXT NOT NULL DEFAULT ''",
+    "update_mode": "INTEGER NOT NULL DEFAULT 0",
+    "sync_mode": "INTEGER NOT NULL DEFAULT 0",
+    "status": "TEXT NOT NULL DEFAULT 'queued'",
+    "stage": "TEXT NOT NULL DEFAULT 'queued'",
+    "progress": "REAL NOT NULL DEFAULT 0",
+    "parsed": "INTEGER NOT NULL DEFAULT 0",
+    "validated": "INTEGER NOT NULL DEFAULT 0",
+    "written": "INTEGER NOT NULL DEFAULT 0",
+    "failed": "INTEGER NOT NULL DEFAULT 0",
+    "inserted": "INTEGER NOT NULL DEFAULT 0",
+    "updated": "INTEGER NOT NULL DEFAULT 0",
+    "unchanged": "INTEGER NOT NULL DEFAULT 0",
+    "deleted": "INTEGER NOT NULL DEFAULT 0",
+    "duplicates": "TEXT NOT NULL DEFAULT '[]'",
+    "duplicates_count": "INTEGER NOT NULL DEFAULT 0",
+    "preview": "TEXT NOT NULL DEFAULT '[]'",
+    "parse_seconds": "REAL NOT NULL DEFAULT 0",
+    "write_seconds": "REAL NOT NULL DEFAULT 0",
+    "throughput": "REAL NOT NULL DEFAULT 0",
+    "message": "TEXT",
+    "created_at": "REAL NOT NULL DEFAULT 0",
+    "started_at": "REAL",
+    "finished_at": "REAL",
+    "updated_at": "REAL NOT NULL DEFAULT 0",
+    # Processo dono do job: o worker que o enfileirou e, depois, o processo do pool que o executa
+    "owner_pid": "INTEGER",
+}
+
+_schema_ready = set()
+
+
+def _db():
+    conn = connect_local(JOBS_DB)
+    if os.getpid() not in _schema_ready:
+        conn.execute("CREATE TABLE IF NOT EXISTS import_jobs (id TEXT PRIMARY KEY)")
+        # Acrescenta colunas que faltarem (arquivos criados por versões anteriores)
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(import_jobs)")}
+        for name, definition in _COLUMNS.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE import_jobs ADD COLUMN {name} {definition}")
+        _schema_ready.add(os.getpid())
+    return conn
+
+
+def create_job(usuario_id, empresa_id, filename, update, sync=False):
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    _db().execute(
+        "INSERT INTO import_jobs (id, usuario_id, empresa_id, filename, update_mode, sync_mode, status, stage, created_at, updated_at, owner_pid) "
+        "VALUES (?, ?, ?, ?, ?, ?, 'queued', 'queued', ?, ?, ?)",
+        (job_id, str(usuario_id), empresa_id, filename, int(bool(update)), int(bool(sync)), now, now, os.getpid())
+    )
+    return job_id
+
+
+def _process_alive(pid):
+    if not pid:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Motivo para dar um job não concluído como perdido (processo dono encerrado, ex.: worker do
+# gunicorn reiniciado, ou sem atualização há STALE_AFTER segundos), ou None se ele segue vivo
+def _stale_reason(row, now):
+    if row["status"] in TERMINAL_STATUSES:
+        return None
+    if not _process_alive(row["owner_pid"]):
+        return "o processo da importação foi encerrado"
+    if row["status"] == "running" and row["updated_at"] < now - STALE_AFTER:
+        return f"sem progresso há mais de {STALE_AFTER:g} segundos"
+    return None
+
+
+def _fail_stale(row, reason, now):
+    # Só marca se o job não mudou desde a leitura (o processo pode ter acabado de atualizar)
+    cur = _db().execute(
+        "UPDATE import_jobs SET status = 'failed', stage = 'failed', message = ?, finished_at = ?, updated_at = ? "
+        "WHERE id = ? AND status = ? AND updated_at = ?",
+        (f"Importação interrompida: {reason}", now, now, row["id"], row["status"], row["updated_at"])
+    )
+    if cur.rowcount:
+        logger.warning(f"Importação {row['id']} marcada como falha: {reason}")
+    return cur.rowcount
+
+
+# Marca como falha os jobs perdidos de todos os usuários; retorna quantos
+def reap_stale_jobs():
+    now = time.time()
+    rows = _db().execute(
+        "SELECT id, status, owner_pid, updated_at FROM import_jobs WHERE status NOT IN ('done', 'failed')"
+    ).fetchall()
+    reaped = 0
+    for row in rows:
+        reason = _stale_reason(row, now)
+        if reason:
+            reaped += _fail_stale(row, reason, now)
+    return reaped
+
+
+def _update_job(job_id, **fields):
+    fields["updated_at"] = time.time()
+    for key in ("duplicates", "preview"):
+        if key in fields:
+            fields[key] = json.dumps(fields[key])
+    columns = ", ".join(f"{key} = ?" for key in fields)
+    _db().execute(f"UPDATE import_jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+
+# Retorna o estado do job (apenas para o usuário que o criou)
+def get_job(job_id, usuario_id):
+    query = "SELECT * FROM import_jobs WHERE id = ? AND usuario_id = ?"
+    row = _db().execute(query, (job_id, str(usuario_id))).fetchone()
+    if row is None:
+        return None
+    now = time.time()
+    reason = _stale_reason(row, now)
+    if reason and _fail_stale(row, reason, now):
+        row = _db().execute(query, (job_id, str(usuario_id))).fetchone()
+    job = dict(row)
+    job.pop("owner_pid", None)
+    job["duplicates"] = json.loads(job["duplicates"])
+    job["preview"] = json.loads(job["preview"])
+    job["update"] = bool(job.pop("update_mode"))
+    job["sync"] = bool(job.pop("sync_mode"))
+    job["progress"] = round(job["progress"] * 100, 1)
+    return job
+
+
+# Executa a importação (roda num processo do pool): ler -> validar -> gravar, lote a lote,
+# no catálogo da empresa. sync: grava só os produtos novos ou alterados (sync_produtos) e, com
+# delete_missing, no fim apaga os que não estavam no arquivo
+def run_import(job_id, empresa_id, path, extension, update, sync=False, delete_missing=False):
+    logging_config.set_request_id(job_id)
+    counters = {"parsed": 0, "validated": 0, "written": 0, "failed": 0, "inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+    enviados = set()
+    timings = {"parse_seconds": 0.0, "write_seconds": 0.0}
+    duplicates = []
+    duplicates_count = 0
+    preview = []
+    started_at = time.time()
+
+    def throughput():
+        elapsed = time.time() - started_at
+        return round(counters["parsed"] / elapsed, 1) if elapsed > 0 else 0.0
+
+    try:
+        _update_job(job_id, status="running", stage="parsing", started_at=started_at, owner_pid=os.getpid())
+        rows, progress = open_produtos_file(path, extension)
+        chunks = iter_chunks(rows, INGEST_CHUNK_SIZE)
+        while True:
+            parse_start = time.perf_counter()
+            chunk = next(chunks, None)
+            timings["parse_seconds"] += time.perf_counter() - parse_start
+            if chunk is None:
+                break
+            counters["parsed"] += len(chunk)
+            _update_job(job_id, stage="writing")
+            write_start = time.perf_counter()
+            if sync:
+                result = sync_produtos(empresa_id, chunk)
+                timings["write_seconds"] += time.perf_counter() - write_start
+                if not result["success"]:
+                    raise IngestError(result.get("message") or "Erro ao sincronizar produtos")
+                enviados.update(str(row.get("codigo")) for row in chunk if isinstance(row, dict) and row.get("codigo") is not None)
+                counters["validated"] += result["inserted"] + result["updated"] + result["unchanged"]
+                counters["written"] += result["inserted"] + result["updated"]
+                counters["failed"] += result["ignored"]
+                for key in ("inserted", "updated", "unchanged"):
+                    counters[key] += result[key]
+                _update_job(job_id, stage="parsing", progress=progress(), throughput=throughput(), **counters, **timings)
+                continue
+            # save_produtos valida o lote inteiro de uma vez e grava em lotes
+            result = save_produtos(empresa_id, chunk, update, skip_duplicates=not update)
+            timings["write_seconds"] += time.perf_counter() - write_start
+            if not result["success"]:
+                raise IngestError(result.get("message") or "Erro ao salvar produtos")
+            data = result.get("data") or []
+            chunk_duplicates = result["duplicates"]
+            counters["validated"] += len(data) + len(chunk_duplicates)
+            counters["written"] += result["inserted"] + result["updated"]
+            counters["failed"] += max(len(chunk) - len(data) - len(chunk_duplicates), 0)
+            counters["inserted"] += result["inserted"]
+            counters["updated"] += result["updated"]
+            duplicates_count += len(chunk_duplicates)
+            duplicates.extend(chunk_duplicates[:MAX_REPORTED_DUPLICATES - len(duplicates)])
+            preview.extend(data[:PREVIEW_ROWS - len(preview)])
+            _update_job(
+                job_id, stage="parsing", progress=progress(), duplicates_count=duplicates_count,
+                throughput=throughput(), **counters, **timings
+            )
+        if sync and delete_missing and counters["parsed"]:
+            _update_job(job_id, stage="deleting")
+            counters["deleted"] = len(remover_produtos_ausentes(empresa_id, enviados))
+        message = f"{counters['inserted']} produtos inseridos e {counters['updated']} produtos atualizados com sucesso!"
+        if sync:
+            message += f" {counters['unchanged']} sem alteração."
+        if sync and delete_missing:
+            message += f" {counters['deleted']} removido(s)."
+        if duplicates_count:
+            message += f" {duplicates_count} produto(s) já existente(s) não foram alterados."
+        if counters["failed"]:
+            message += f" {counters['failed']} linha(s) inválida(s) ignorada(s)."
+        _update_job(
+            job_id, status="done", stage="done", progress=1.0, message=message, duplicates=duplicates,
+            duplicates_count=duplicates_count, preview=preview, throughput=throughput(),
+            finished_at=time.time(), **counters, **timings
+        )
+        logger.info(f"Importação {job_id} concluída: {counters['parsed']} linhas em {time.time() - started_at:.1f}s, {message}")
+    except Exception as e:
+        logger.error(f"Erro na importação {job_id}: {str(e)}")
+        _update_job(
+            job_id, status="failed", stage="failed", message=f"Erro ao processar arquivo: {str(e)}",
+            duplicates=duplicates, duplicates_count=duplicates_count, preview=preview,
+            throughput=throughput(), finished_at=time.time(), **counters, **timings
+        )
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+# Pool de processos do worker atual; "spawn" evita herdar threads e conexões do processo pai
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(
+                max_workers=IMPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                initializer=logging_config.setup_logging
+            )
+            _executor_pid = os.getpid()
+            # Um worker novo (ex.: reiniciado pelo gunicorn) encerra o que o anterior deixou pela metade
+            try:
+                reap_stale_jobs()
+            except Exception as e:
+                logger.error(f"Erro ao verificar importações interrompidas: {str(e)}")
+    return _executor
+
+
+# Envia a importação para o pool de processos e retorna imediatamente
+def start_import(job_id, empresa_id, path, extension, update, sync=False, delete_missing=False):
+    def on_done(future):
+        error = future.exception()
+        if error is not None:
+            # O processo do pool morreu ou falhou antes de registrar o erro
+            logger.error(f"Importação {job_id} interrompida: {str(error)}")
+            _update_job(job_id, status="failed", stage="failed", message=f"Importação interrompida: {str(error)}", finished_at=time.time())
+
+    future = _get_executor().submit(run_import, job_id, empresa_id, path, extension, update, sync, delete_missing)
+    future.add_done_callback(on_done)
+    return future
+
+
+# Grava a lista de produtos recebida em JSON num arquivo e importa em segundo plano
+def start_import_from_list(usuario_id, empresa_id, produtos, update, folder, sync=False, delete_missing=False):
+    os.makedirs(folder, exist_ok=True)
+    job_id = create_job(usuario_id, empresa_id, "upload_produtos.json", update, sync)
+    path = os.path.join(folder, f"{job_id}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(produtos, f)
+    start_import(job_id, empresa_id, path, "json", update, sync, delete_missing)
+    return job_id
+
+
+# Gera eventos SSE com o estado do job até ele terminar (ou até timeout segundos). É assíncrono:
+# só o modo ASGI (asgi.py) oferece o stream, que espera no event loop sem ocupar um worker;
+# no gunicorn síncrono a página consulta /jobs/<id> periodicamente
+async def job_events(job_id, usuario_id, interval=0.5, timeout=600):
+    deadline = time.monotonic() + timeout
+    last = None
+    while time.monotonic() < deadline:
+        job = await asyncio.to_thread(get_job, job_id, usuario_id)
+        if job is None:
+            yield "event: error\ndata: {\"message\": \"Importação não encontrada\"}\n\n"
+            return
+        if job["updated_at"] != last:
+            last = job["updated_at"]
+            yield f"data: {json.dumps(job)}\n\n"
+        if job["status"] in TERMINAL_STATUSES:
+            return
+        await asyncio.sleep(interval)
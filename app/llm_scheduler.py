@@ -0,0 +1,466 @@
+# Agendador das chamadas à IA por empresa. Todas as empresas dividem as mesmas
+# LLM_MAX_CONCURRENCY chamadas simultâneas do processo (e o limite de taxa do provedor); sem
+# isso, uma campanha de marketing de uma empresa ocupava os workers e atrasava as demais.
+# - Fila justa ponderada (start-time fair queuing): cada empresa recebe uma fatia das vagas
+#   proporcional ao peso do plano (usuarios.plano); quem mandou muito fica atrás de quem
+#   mandou pouco, sem esperar a fila inteira da campanha.
+# - Limite de chamadas simultâneas e de chamadas esperando por empresa, conforme o plano.
+# - Cota de tokens por período (LLM_QUOTA_PERIOD), desligada por padrão (ligue por plano em
+#   LLM_PLAN_LIMITS). A conta fica em memória e é gravada num SQLite compartilhado a cada
+#   LLM_QUOTA_SYNC_INTERVAL segundos, quando também se lê o uso dos outros processos.
+# Acima da cota ou com a fila da empresa cheia, a chamada é recusada na hora, sem esperar vaga.
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from app import data_versions, metrics
+from database.local_store import connect_local
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("LLM_SCHEDULER_ENABLED", "1") == "1"
+# Chamadas à IA em andamento ao mesmo tempo no processo, somando todas as empresas
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+# Espera máxima por uma vaga; depois disso a chamada é recusada (a fila do webhook tenta de novo)
+QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+# Período da cota de tokens (segundos; padrão: um dia, contado em UTC)
+QUOTA_PERIOD = int(os.getenv("LLM_QUOTA_PERIOD", "86400"))
+# Intervalo de gravação do uso no SQLite (e leitura do uso dos outros processos)
+SYNC_INTERVAL = float(os.getenv("LLM_QUOTA_SYNC_INTERVAL", "10"))
+QUOTA_DB = os.getenv("LLM_QUOTA_DB", "llm_quota.sqlite3")
+# Plano usado quando a empresa não é encontrada ou o plano não está na tabela
+DEFAULT_PLAN = os.getenv("LLM_DEFAULT_PLAN", "free")
+# Uso guardado no SQLite: períodos mais antigos que isso são apagados
+RETENTION_PERIODS = 31
+# Resposta enviada ao cliente quando a cota da empresa acabou (vazio: a mensagem fica sem resposta)
+QUOTA_MESSAGE = os.getenv(
+    "LLM_QUOTA_MESSAGE",
+    "No momento não conseguimos responder automaticamente. Sua mensagem foi recebida e retornaremos em breve."
+)
+
+# peso: fatia das vagas; concorrencia: chamadas simultâneas; fila: chamadas esperando;
+# tokens: cota por período (0 = sem limite). Sem cota por padrão: um limite de tokens precisa
+# ser dimensionado pelo uso real de cada plano antes de ser ligado
+PLANOS = {
+    "free": {"peso": 1, "concorrencia": 4, "fila": 32, "tokens": 0},
+    "basico": {"peso": 1, "concorrencia": 4, "fila": 32, "tokens": 0},
+    "plus": {"peso": 4, "concorrencia": 16, "fila": 128, "tokens": 0},
+    "enterprise": {"peso": 10, "concorrencia": 32, "fila": 256, "tokens": 0},
+}
+# Ajustes por plano em JSON, ex.: LLM_PLAN_LIMITS='{"plus": {"tokens": 1000000}}'
+for _nome, _limites in json.loads(os.getenv("LLM_PLAN_LIMITS", "{}")).items():
+    PLANOS.setdefault(_nome, dict(PLANOS["free"])).update(_limites)
+
+shed_total = metrics.Counter("llm_scheduler_shed_total", "Chamadas à IA recusadas pelo agendador", ("plano", "reason"))
+wait_latency = metrics.Histogram("llm_scheduler_wait_seconds", "Espera por uma vaga para chamar a IA", ("plano",))
+
+
+class SchedulerError(Exception):
+    pass
+
+
+# Cota de tokens do período esgotada: não adianta tentar antes de retry_after segundos
+class QuotaExceeded(SchedulerError):
+    def __init__(self, plano, retry_after):
+        super().__init__(f"Cota de uso da IA do plano {plano} esgotada; renova em {int(retry_after) + 1} segundos")
+        self.retry_after = retry_after
+
+
+# Fila da empresa cheia ou sem vaga a tempo: pode tentar de novo em instantes
+class TenantBusy(SchedulerError):
+    pass
+
+
+# "Básico" -> "basico", "Enterprise" -> "enterprise"
+def plan_name(plano):
+    name = unicodedata.normalize("NFKD", (plano or "").strip().lower())
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return name if name in PLANOS else DEFAULT_PLAN
+
+
+# Aproximação de ~4 caracteres por token (o cliente não recebe a contagem do provedor)
+def estimate_tokens(text):
+    return max(1, len(text or "") // 4)
+
+
+def estimate_messages(messages):
+    return sum(estimate_tokens(message.get("content")) for message in messages)
+
+
+def _period(now=None):
+    return int((now if now is not None else time.time()) // QUOTA_PERIOD)
+
+
+class _Tenant:
+    __slots__ = ("key", "plano", "limits", "in_flight", "waiters", "finish", "reserved",
+                 "period", "persisted", "local", "requests", "shed")
+
+    def __init__(self, key):
+        self.key = key
+        self.plano = None
+        self.limits = None
+        self.in_flight = 0
+        self.waiters = deque()
+        # Tag virtual de término da última chamada admitida (fila justa)
+        self.finish = 0.0
+        # Tokens estimados das chamadas admitidas e ainda não concluídas
+        self.reserved = 0
+        self.period = _period()
+        # Uso do período gravado no SQLite (todos os processos) + uso local ainda não gravado
+        self.persisted = 0
+        self.local = 0
+        self.requests = 0
+        self.shed = 0
+
+    def used(self):
+        return self.persisted + self.local
+
+
+class _Waiter:
+    __slots__ = ("tenant", "ticket", "tag", "granted", "loop", "future", "event")
+
+    def __init__(self, tenant, ticket, tag, loop=None):
+        self.tenant = tenant
+        self.ticket = ticket
+        self.tag = tag
+        self.granted = False
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+
+    # Acorda quem espera a vaga (em outra thread ou em outro event loop); False se não deu
+    def wake(self):
+        if self.future is None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+            return True
+        except RuntimeError:
+            return False
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+
+# Vaga concedida: `record(resposta)` informa o que foi gasto; sem isso (erro), nada é cobrado
+class Ticket:
+    __slots__ = ("tenant", "cost", "prompt_tokens", "tokens")
+
+    def __init__(self, tenant, cost, prompt_tokens):
+        self.tenant = tenant
+        self.cost = cost
+        self.prompt_tokens = prompt_tokens
+        self.tokens = 0
+
+    def record(self, response):
+        self.tokens = self.prompt_tokens + estimate_tokens(response)
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, queue_timeout=QUEUE_TIMEOUT):
+        self.pid = os.getpid()
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        # Tempo virtual: tag da última chamada liberada
+        self.virtual = 0.0
+        self._tenants = {}
+        # Tokens usados e ainda não gravados: (empresa, período) -> tokens
+        self._unflushed = {}
+        self._lock = threading.Lock()
+        self._sync_thread = None
+
+    def _tenant(self, key, plano):
+        tenant = self._tenants.get(key)
+        if tenant is None:
+            tenant = self._tenants[key] = _Tenant(key)
+        name = plan_name(plano)
+        if tenant.plano != name:
+            tenant.plano, tenant.limits = name, PLANOS[name]
+        period = _period()
+        if tenant.period != period:
+            tenant.period, tenant.persisted, tenant.local = period, 0, 0
+        return tenant
+
+    def _shed(self, tenant, reason, error):
+        tenant.shed += 1
+        shed_total.inc(plano=tenant.plano, reason=reason)
+        return error
+
+    # Admite a chamada ou a põe na fila da empresa; levanta QuotaExceeded/TenantBusy na hora
+    def _admit(self, empresa_id, plano, prompt_tokens, max_tokens, loop=None):
+        cost = prompt_tokens + max_tokens
+        with self._lock:
+            tenant = self._tenant(data_versions.scope_for(empresa_id), plano)
+            limits = tenant.limits
+            if limits["tokens"] and tenant.used() + tenant.reserved + cost > limits["tokens"]:
+                retry_after = (tenant.period + 1) * QUOTA_PERIOD - time.time()
+                raise self._shed(tenant, "quota", QuotaExceeded(tenant.plano, retry_after))
+            ticket = Ticket(tenant, cost, prompt_tokens)
+            # Start-time fair queuing: a chamada começa no tempo virtual atual ou no término da
+            # anterior da mesma empresa; o custo conta dividido pelo peso do plano
+            start = max(self.virtual, tenant.finish)
+            if self.in_flight < self.max_concurrency and tenant.in_flight < limits["concorrencia"]:
+                # Vaga livre e a empresa abaixo do limite: se houvesse alguém apto esperando,
+                # já teria sido liberado, então não fura a fila de ninguém
+                tenant.finish = start + cost / limits["peso"]
+                self.virtual = max(self.virtual, start)
+                self._grant(tenant, ticket)
+                return ticket, None
+            if len(tenant.waiters) >= limits["fila"]:
+                raise self._shed(tenant, "pending", TenantBusy(f"Muitas chamadas à IA em espera para o plano {tenant.plano}"))
+            tenant.finish = start + cost / limits["peso"]
+            waiter = _Waiter(tenant, ticket, start, loop)
+            tenant.waiters.append(waiter)
+            return ticket, waiter
+
+    def _grant(self, tenant, ticket):
+        tenant.reserved += ticket.cost
+        tenant.in_flight += 1
+        tenant.requests += 1
+        self.in_flight += 1
+
+    # Libera as chamadas em espera enquanto houver vagas: sempre a de menor tag entre as
+    # empresas abaixo do próprio limite. Retorna quem deve ser acordado (fora do lock)
+    def _dispatch(self):
+        woken = []
+        while self.in_flight < self.max_concurrency:
+            best = None
+            for tenant in self._tenants.values():
+                if tenant.waiters and tenant.in_flight < tenant.limits["concorrencia"]:
+                    if best is None or tenant.waiters[0].tag < best.waiters[0].tag:
+                        best = tenant
+            if best is None:
+                break
+            waiter = best.waiters.popleft()
+            waiter.granted = True
+            self.virtual = max(self.virtual, waiter.tag)
+            self._grant(best, waiter.ticket)
+            woken.append(waiter)
+        return woken
+
+    def _wake(self, woken):
+        for waiter in woken:
+            if not waiter.wake():
+                # Event loop encerrado: ninguém vai usar a vaga
+                self._release(waiter.ticket)
+
+    def _release(self, ticket):
+        with self._lock:
+            tenant = ticket.tenant
+            tenant.in_flight -= 1
+            tenant.reserved -= ticket.cost
+            self.in_flight -= 1
+            if ticket.tokens:
+                if tenant.period == _period():
+                    tenant.local += ticket.tokens
+                key = (tenant.key, tenant.period)
+                self._unflushed[key] = self._unflushed.get(key, 0) + ticket.tokens
+            woken = self._dispatch()
+        self._wake(woken)
+
+    # Tira da fila quem desistiu de esperar; False se a vaga foi concedida nesse meio tempo
+    def _abandon(self, waiter):
+        with self._lock:
+            if waiter.granted:
+                return False
+            waiter.tenant.waiters.remove(waiter)
+            return True
+
+    def _timeout(self, waiter):
+        tenant = waiter.tenant
+        with self._lock:
+            self._shed(tenant, "timeout", None)
+        return TenantBusy(f"Sem vaga para chamar a IA em {self.queue_timeout:g} segundos (plano {tenant.plano})")
+
+    @contextmanager
+    def slot(self, empresa_id, plano, prompt_tokens, max_tokens):
+        if not ENABLED:
+            yield Ticket(None, 0, prompt_tokens)
+            return
+        self._ensure_sync()
+        ticket, waiter = self._admit(empresa_id, plano, prompt_tokens, max_tokens)
+        if waiter is not None:
+            start = time.perf_counter()
+            if not waiter.event.wait(self.queue_timeout) and self._abandon(waiter):
+                raise self._timeout(waiter)
+            wait_latency.observe(time.perf_counter() - start, plano=ticket.tenant.plano)
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    @asynccontextmanager
+    async def slot_async(self, empresa_id, plano, prompt_tokens, max_tokens):
+        if not ENABLED:
+            yield Ticket(None, 0, prompt_tokens)
+            return
+        self._ensure_sync()
+        ticket, waiter = self._admit(empresa_id, plano, prompt_tokens, max_tokens, asyncio.get_running_loop())
+        if waiter is not None:
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                if self._abandon(waiter):
+                    raise self._timeout(waiter)
+            except BaseException:
+                # Cancelado: devolve a vaga se ela chegou junto com o cancelamento
+                if not self._abandon(waiter):
+                    self._release(ticket)
+                raise
+            wait_latency.observe(time.perf_counter() - start, plano=ticket.tenant.plano)
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    def _ensure_sync(self):
+        if SYNC_INTERVAL > 0 and (self._sync_thread is None or not self._sync_thread.is_alive()):
+            with self._lock:
+                if self._sync_thread is None or not self._sync_thread.is_alive():
+                    self._sync_thread = threading.Thread(target=self._sync_loop, name="llm-quota-sync", daemon=True)
+                    self._sync_thread.start()
+
+    def _sync_loop(self):
+        while True:
+            time.sleep(SYNC_INTERVAL)
+            try:
+                self.sync()
+            except Exception as e:
+                logger.error(f"Erro ao gravar o uso da IA: {str(e)}")
+
+    # Grava o uso local no SQLite e traz o total do período (todos os processos) para a memória
+    def sync(self):
+        with self._lock:
+            pending, self._unflushed = self._unflushed, {}
+            period = _period()
+            keys = [key for key, tenant in self._tenants.items() if tenant.period == period]
+        try:
+            totals = _store_usage(pending, keys, period)
+        except Exception:
+            with self._lock:
+                for key, tokens in pending.items():
+                    self._unflushed[key] = self._unflushed.get(key, 0) + tokens
+            raise
+        with self._lock:
+            for key, total in totals.items():
+                tenant = self._tenants.get(key)
+                if tenant is None or tenant.period != period:
+                    continue
+                # O que acabou de ser gravado passa a fazer parte do total persistido
+                tenant.local -= pending.get((key, period), 0)
+                tenant.persisted = total
+        return len(pending)
+
+    def stats(self):
+        with self._lock:
+            tenants = [
+                {
+                    "empresa": tenant.key, "plano": tenant.plano, "em_andamento": tenant.in_flight,
+                    "esperando": len(tenant.waiters), "tokens_usados": tenant.used(),
+                    "cota_tokens": tenant.limits["tokens"], "chamadas": tenant.requests, "recusadas": tenant.shed,
+                }
+                for tenant in self._tenants.values()
+            ]
+            return {
+                "enabled": ENABLED, "in_flight": self.in_flight, "max_concurrency": self.max_concurrency,
+                "waiting": sum(item["esperando"] for item in tenants), "pending_sync": len(self._unflushed),
+                # As empresas com mais uso no período
+                "tenants": sorted(tenants, key=lambda item: item["tokens_usados"], reverse=True)[:20],
+            }
+
+
+_schema_ready = set()
+
+
+def _db():
+    conn = connect_local(QUOTA_DB)
+    if os.getpid() not in _schema_ready:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS llm_usage (
+                empresa TEXT NOT NULL,
+                period INTEGER NOT NULL,
+                tokens INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (empresa, period)
+            );
+        """)
+        _schema_ready.add(os.getpid())
+    return conn
+
+
+# Soma o uso local aos totais gravados e retorna {empresa: tokens do período} para `keys`
+def _store_usage(pending, keys, period):
+    conn = _db()
+    now = time.time()
+    if pending:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("""
+                INSERT INTO llm_usage (empresa, period, tokens, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (empresa, period) DO UPDATE SET tokens = tokens + excluded.tokens, updated_at = excluded.updated_at
+            """, [(key, key_period, tokens, now) for (key, key_period), tokens in pending.items()])
+            conn.execute("DELETE FROM llm_usage WHERE period < ?", (period - RETENTION_PERIODS,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    totals = {}
+    for row in conn.execute("SELECT empresa, tokens FROM llm_usage WHERE period = ?", (period,)):
+        if row["empresa"] in keys:
+            totals[row["empresa"]] = row["tokens"]
+    return totals
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+# Agendador do processo atual (recriado após fork: as vagas e filas são por processo)
+def get_scheduler():
+    global _scheduler
+    scheduler = _scheduler
+    if scheduler is None or scheduler.pid != os.getpid():
+        with _scheduler_lock:
+            scheduler = _scheduler
+            if scheduler is None or scheduler.pid != os.getpid():
+                scheduler = _scheduler = LLMScheduler()
+    return scheduler
+
+
+def slot(empresa_id, plano, prompt_tokens, max_tokens):
+    return get_scheduler().slot(empresa_id, plano, prompt_tokens, max_tokens)
+
+
+def slot_async(empresa_id, plano, prompt_tokens, max_tokens):
+    return get_scheduler().slot_async(empresa_id, plano, prompt_tokens, max_tokens)
+
+
+def scheduler_stats():
+    return get_scheduler().stats()
+
+
+def _collector():
+    scheduler = get_scheduler()
+    with scheduler._lock:
+        samples = [("llm_scheduler_in_flight", "gauge", "Chamadas à IA em andamento", {}, scheduler.in_flight)]
+        by_plan = {}
+        for tenant in scheduler._tenants.values():
+            by_plan[tenant.plano] = by_plan.get(tenant.plano, 0) + len(tenant.waiters)
+    samples.extend(
+        ("llm_scheduler_waiting", "gauge", "Chamadas à IA esperando vaga", {"plano": plano}, waiting)
+        for plano, waiting in by_plan.items()
+    )
+    return samples
+
+
+metrics.register_collector(_collector)
@@ -0,0 +1,164 @@
+# Logging da aplicação, configurado uma única vez por processo (create_app e processos de importação).
+# Os módulos só usam logging.getLogger(__name__): os registros vão para uma fila em memória
+# (QueueHandler) e uma thread (QueueListener) grava no disco, então quem atende a requisição
+# nunca espera pela escrita. Cada processo grava e rotaciona o próprio arquivo, em JSON por linha.
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import g, has_request_context
+
+LOG_DIR = os.getenv("LOG_DIR", os.path.join(os.path.dirname(__file__), '..', 'log'))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# 1: um arquivo por processo (system-<pid>.log); 0: só system.log (apenas com um processo)
+LOG_PER_PROCESS = os.getenv("LOG_PER_PROCESS", "1") == "1"
+# Amostragem dos registros até LOG_SAMPLE_LEVEL (padrão: só DEBUG; INFO como logins, uploads e
+# mensagens enviadas nunca é descartado): no máximo LOG_SAMPLE_BURST registros por ponto do código
+# a cada LOG_SAMPLE_INTERVAL segundos; os descartados são somados no próximo registro (0 desativa)
+LOG_SAMPLE_LEVEL = os.getenv("LOG_SAMPLE_LEVEL", "DEBUG").upper()
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "20"))
+LOG_SAMPLE_INTERVAL = float(os.getenv("LOG_SAMPLE_INTERVAL", "1.0"))
+# Tamanho máximo da fila em memória (cheia, os registros novos são descartados e contados)
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# ID da requisição fora do contexto do Flask (ex.: job da fila do webhook)
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+_listener = None
+_listener_pid = None
+_setup_lock = threading.Lock()
+_dropped = 0
+
+
+def current_request_id():
+    if has_request_context() and getattr(g, "request_id", None):
+        return g.request_id
+    return _request_id.get()
+
+
+# Define o ID usado nos logs do contexto atual (retorna o token para reset_request_id)
+def set_request_id(request_id):
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+            "request_id": getattr(record, "request_id", None),
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Limita os registros repetidos do mesmo ponto do código até o nível `level` (DEBUG em laços etc.)
+class SamplingFilter(logging.Filter):
+    def __init__(self, burst=LOG_SAMPLE_BURST, interval=LOG_SAMPLE_INTERVAL, level=LOG_SAMPLE_LEVEL):
+        super().__init__()
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+        self.burst = burst
+        self.interval = interval
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.burst <= 0 or record.levelno > self.level:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            started, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - started >= self.interval:
+                started, count = now, 0
+            if count >= self.burst:
+                self._windows[key] = (started, count, suppressed + 1)
+                return False
+            self._windows[key] = (started, count + 1, 0)
+        record.suppressed = suppressed
+        return True
+
+
+# Anexa o ID da requisição na thread que gerou o registro (antes de ir para a fila)
+class _RequestQueueHandler(QueueHandler):
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.request_id = current_request_id()
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+
+def _file_handler():
+    os.makedirs(LOG_DIR, exist_ok=True)
+    filename = f"system-{os.getpid()}.log" if LOG_PER_PROCESS else "system.log"
+    handler = RotatingFileHandler(
+        os.path.join(LOG_DIR, filename), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+# Configura o logger raiz do processo atual (chamadas repetidas no mesmo processo não fazem nada)
+def setup_logging():
+    global _listener, _listener_pid
+    with _setup_lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            return
+        root = logging.getLogger()
+        # Processo filho (fork): descarta o handler herdado, cuja thread não existe aqui
+        for handler in list(root.handlers):
+            if isinstance(handler, _RequestQueueHandler):
+                root.removeHandler(handler)
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        queue_handler = _RequestQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter())
+        root.addHandler(queue_handler)
+        root.setLevel(LOG_LEVEL)
+        _listener = QueueListener(log_queue, _file_handler(), respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+        atexit.register(_stop_listener, _listener)
+
+
+def _stop_listener(listener):
+    try:
+        listener.stop()
+    except Exception:
+        pass
+
+
+def logging_stats():
+    return {"dropped": _dropped, "pid": os.getpid(), "per_process": LOG_PER_PROCESS, "level": LOG_LEVEL}
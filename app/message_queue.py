@@ -0,0 +1,407 @@
+# Fila durável (SQLite) das mensagens recebidas pelo /webhook e pool de workers assíncronos
+import asyncio
+import contextvars
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from database.local_store import connect_local
+from app import logging_config
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DB = os.getenv("WEBHOOK_QUEUE_DB", "webhook_queue.sqlite3")
+# Quantidade de workers assíncronos por processo, ou seja, conversas atendidas ao mesmo tempo:
+# cada worker é uma corrotina que passa quase todo o tempo esperando a IA e a Twilio
+WORKERS = int(os.getenv("WEBHOOK_WORKERS", "32"))
+# Tentativas antes de marcar a mensagem como falha definitiva
+MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+# Backoff exponencial: base * 2^(tentativa - 1), limitado a RETRY_MAX segundos
+RETRY_BASE = float(os.getenv("WEBHOOK_RETRY_BASE", "2"))
+RETRY_MAX = float(os.getenv("WEBHOOK_RETRY_MAX", "300"))
+# Mensagens em processamento há mais tempo que isso voltam pra fila (worker que morreu no meio)
+VISIBILITY_TIMEOUT = float(os.getenv("WEBHOOK_VISIBILITY_TIMEOUT", "300"))
+# Mensagens concluídas ficam guardadas por esse tempo (segundos) antes da limpeza
+RETENTION = float(os.getenv("WEBHOOK_QUEUE_RETENTION", "86400"))
+# Por quanto tempo a chave de uma mensagem (MessageSid da Twilio) impede que ela seja enfileirada de novo
+DEDUP_TTL = float(os.getenv("WEBHOOK_DEDUP_TTL", "86400"))
+# Intervalo entre leituras da fila sem aviso de mensagem nova; com a fila vazia ele dobra a cada
+# leitura sem resultado até POLL_MAX (mensagens enfileiradas por este processo acordam na hora)
+POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", "0.5"))
+POLL_MAX = float(os.getenv("WEBHOOK_POLL_MAX", "5"))
+
+
+# Erro que não adianta tentar de novo (ex.: credenciais ausentes): a mensagem falha sem retry
+class PermanentJobError(Exception):
+    pass
+
+
+_schema_ready = set()
+
+
+def _db():
+    conn = connect_local(QUEUE_DB)
+    if os.getpid() not in _schema_ready:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sender TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                enqueued_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                locked_by TEXT,
+                last_error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, available_at);
+            CREATE INDEX IF NOT EXISTS idx_jobs_sender ON jobs (sender, status, id);
+            CREATE TABLE IF NOT EXISTS message_keys (
+                key TEXT PRIMARY KEY,
+                job_id INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_message_keys_created ON message_keys (created_at);
+        """)
+        # Filas criadas antes da coluna de progresso (resposta gerada e partes já enviadas)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "progress" not in columns:
+            try:
+                conn.execute("ALTER TABLE jobs ADD COLUMN progress TEXT")
+            except sqlite3.OperationalError:
+                pass  # outro processo adicionou ao mesmo tempo
+        _schema_ready.add(os.getpid())
+    return conn
+
+
+# Métricas locais do processo (latência entre enfileirar e concluir)
+_metrics_lock = threading.Lock()
+_metrics = {"enqueued": 0, "duplicates": 0, "processed": 0, "retried": 0, "failed": 0}
+_latencies = deque(maxlen=1000)
+
+
+def _count(name, value=1):
+    with _metrics_lock:
+        _metrics[name] += value
+
+
+def enqueue(sender, payload):
+    now = time.time()
+    cur = _db().execute(
+        "INSERT INTO jobs (sender, payload, available_at, enqueued_at) VALUES (?, ?, ?, ?)",
+        (sender, json.dumps(payload), now, now)
+    )
+    _count("enqueued")
+    _wake_workers()
+    return cur.lastrowid
+
+
+# Enfileira só se a chave (ex.: MessageSid) não foi vista nos últimos DEDUP_TTL segundos.
+# A chave e a mensagem são gravadas na mesma transação, então dois workers do gunicorn que
+# recebem a mesma entrega ao mesmo tempo não criam dois jobs. Retorna (job_id, criado).
+def enqueue_unique(key, sender, payload):
+    now = time.time()
+    conn = _db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT job_id FROM message_keys WHERE key = ? AND created_at > ?", (key, now - DEDUP_TTL)
+        ).fetchone()
+        if row:
+            conn.execute("COMMIT")
+            _count("duplicates")
+            return row["job_id"], False
+        cur = conn.execute(
+            "INSERT INTO jobs (sender, payload, available_at, enqueued_at) VALUES (?, ?, ?, ?)",
+            (sender, json.dumps(payload), now, now)
+        )
+        job_id = cur.lastrowid
+        conn.execute(
+            "INSERT OR REPLACE INTO message_keys (key, job_id, created_at) VALUES (?, ?, ?)", (key, job_id, now)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    _count("enqueued")
+    _wake_workers()
+    return job_id, True
+
+
+# Retira a próxima mensagem disponível; só a mensagem mais antiga ainda não concluída
+# de cada remetente pode ser retirada, o que garante a ordem por remetente
+def claim(worker_id):
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("""
+            SELECT j.id, j.sender, j.payload, j.attempts, j.enqueued_at, j.progress FROM jobs j
+            WHERE j.status = 'pending' AND j.available_at <= ?
+              AND j.id = (SELECT MIN(o.id) FROM jobs o
+                          WHERE o.sender = j.sender AND o.status IN ('pending', 'processing'))
+            ORDER BY j.available_at, j.id LIMIT 1
+        """, (now,)).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE jobs SET status = 'processing', started_at = ?, locked_by = ? WHERE id = ?",
+                (now, worker_id, row["id"])
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if row is None:
+        return None
+    return {
+        "id": row["id"],
+        "sender": row["sender"],
+        "payload": json.loads(row["payload"]),
+        "attempts": row["attempts"],
+        "enqueued_at": row["enqueued_at"],
+        "progress": json.loads(row["progress"]) if row["progress"] else {},
+    }
+
+
+# Job em execução na tarefa atual (definido pelo worker em volta do handler)
+_current_job = contextvars.ContextVar("webhook_job", default=None)
+
+
+# Progresso gravado por uma tentativa anterior do job atual (vazio na primeira tentativa)
+def job_progress():
+    job = _current_job.get()
+    return dict(job["progress"]) if job else {}
+
+
+# Grava o progresso do job atual; se ele falhar no meio, a próxima tentativa continua daqui
+# em vez de refazer o que já foi feito (ex.: gerar a resposta de novo, reenviar partes)
+def save_progress(**fields):
+    job = _current_job.get()
+    if job is None:
+        return
+    job["progress"].update(fields)
+    _db().execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(job["progress"]), job["id"]))
+
+
+def complete(job):
+    now = time.time()
+    _db().execute(
+        "UPDATE jobs SET status = 'done', finished_at = ?, locked_by = NULL WHERE id = ?",
+        (now, job["id"])
+    )
+    _count("processed")
+    with _metrics_lock:
+        _latencies.append(now - job["enqueued_at"])
+
+
+def fail(job, error, permanent=False):
+    attempts = job["attempts"] + 1
+    now = time.time()
+    if permanent or attempts >= MAX_ATTEMPTS:
+        _db().execute(
+            "UPDATE jobs SET status = 'failed', attempts = ?, finished_at = ?, locked_by = NULL, last_error = ? WHERE id = ?",
+            (attempts, now, str(error), job["id"])
+        )
+        _count("failed")
+        logger.error(f"Mensagem {job['id']} de {job['sender']} falhou definitivamente após {attempts} tentativa(s): {error}")
+        return
+    delay = min(RETRY_BASE * (2 ** (attempts - 1)), RETRY_MAX)
+    delay *= random.uniform(0.8, 1.2)
+    _db().execute(
+        "UPDATE jobs SET status = 'pending', attempts = ?, available_at = ?, locked_by = NULL, last_error = ? WHERE id = ?",
+        (attempts, now + delay, str(error), job["id"])
+    )
+    _count("retried")
+    logger.warning(f"Mensagem {job['id']} de {job['sender']} será reprocessada em {delay:.1f}s: {error}")
+
+
+# Devolve à fila mensagens travadas em 'processing' e apaga as concluídas antigas. Uma mensagem
+# travada conta como tentativa: se ela derruba ou trava o worker, falha ao chegar em MAX_ATTEMPTS
+def housekeeping():
+    now = time.time()
+    conn = _db()
+    error = f"Sem conclusão em {VISIBILITY_TIMEOUT:g} segundos (worker travado ou encerrado)"
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        failed = conn.execute("""
+            UPDATE jobs SET status = 'failed', attempts = attempts + 1, finished_at = ?, locked_by = NULL, last_error = ?
+            WHERE status = 'processing' AND started_at < ? AND attempts + 1 >= ?
+        """, (now, error, now - VISIBILITY_TIMEOUT, MAX_ATTEMPTS)).rowcount
+        requeued = conn.execute("""
+            UPDATE jobs SET status = 'pending', attempts = attempts + 1, available_at = ?, locked_by = NULL, last_error = ?
+            WHERE status = 'processing' AND started_at < ?
+        """, (now, error, now - VISIBILITY_TIMEOUT)).rowcount
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if failed:
+        _count("failed", failed)
+        logger.error(f"{failed} mensagem(ns) travada(s) falharam definitivamente após {MAX_ATTEMPTS} tentativas")
+    if requeued:
+        _count("retried", requeued)
+        logger.warning(f"{requeued} mensagem(ns) travada(s) voltaram para a fila")
+    conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (now - RETENTION,))
+    conn.execute("DELETE FROM message_keys WHERE created_at < ?", (now - DEDUP_TTL,))
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+# Profundidade da fila (compartilhada) e latências/contadores (deste processo)
+def queue_stats():
+    counts = {"pending": 0, "processing": 0, "done": 0, "failed": 0}
+    for row in _db().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+        counts[row["status"]] = row["n"]
+    oldest = _db().execute("SELECT MIN(enqueued_at) AS t FROM jobs WHERE status = 'pending'").fetchone()["t"]
+    with _metrics_lock:
+        data = dict(_metrics)
+        latencies = list(_latencies)
+    data.update({
+        "depth": counts["pending"],
+        "processing": counts["processing"],
+        "failed_total": counts["failed"],
+        "oldest_pending_age_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+        "latency_p50_seconds": round(_percentile(latencies, 50), 3),
+        "latency_p95_seconds": round(_percentile(latencies, 95), 3),
+        "latency_max_seconds": round(max(latencies), 3) if latencies else 0.0,
+        "workers": WORKERS,
+    })
+    return data
+
+
+# Pool de workers: um event loop asyncio numa thread daemon. Uma única corrotina lê a fila (só
+# quando há worker livre) e entrega as mensagens às WORKERS corrotinas que as processam, então a
+# fila ociosa custa uma leitura por intervalo, não uma transação de escrita por worker
+class WorkerPool:
+    def __init__(self, handler, concurrency=WORKERS):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.pid = os.getpid()
+        self.loop = asyncio.new_event_loop()
+        self._wakeup = None
+        self._thread = threading.Thread(target=self._run, name="webhook-workers", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def wake(self):
+        if self._wakeup is not None:
+            self.loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._main())
+
+    async def _main(self):
+        self._serving = asyncio.create_task(self._serve())
+        while True:
+            try:
+                await asyncio.to_thread(housekeeping)
+            except Exception as e:
+                logger.error(f"Erro na manutenção da fila do webhook: {str(e)}")
+            await asyncio.sleep(60)
+
+    # Leitor da fila + workers; roda até ser cancelado
+    async def _serve(self):
+        self._wakeup = asyncio.Event()
+        self._jobs = asyncio.Queue()
+        self._idle = asyncio.Semaphore(self.concurrency)
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        try:
+            await self._dispatcher(f"{self.pid}-{uuid.uuid4().hex[:6]}")
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def _dispatcher(self, worker_id):
+        interval = POLL_INTERVAL
+        while True:
+            await self._idle.acquire()
+            self._wakeup.clear()
+            try:
+                job = await asyncio.to_thread(claim, worker_id)
+            except Exception as e:
+                logger.error(f"Erro ao ler a fila do webhook: {str(e)}")
+                job = None
+            if job is None:
+                self._idle.release()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), interval)
+                    interval = POLL_INTERVAL
+                except asyncio.TimeoutError:
+                    interval = min(interval * 2, POLL_MAX)
+                continue
+            interval = POLL_INTERVAL
+            self._jobs.put_nowait(job)
+
+    async def _worker(self):
+        while True:
+            job = await self._jobs.get()
+            try:
+                await self._process(job)
+            finally:
+                self._idle.release()
+                # A próxima mensagem do mesmo remetente pode ter sido liberada agora
+                self._wakeup.set()
+
+    async def _process(self, job):
+        # Os logs do job usam o ID da requisição que o enfileirou
+        token = logging_config.set_request_id(job["payload"].get("request_id") or f"job-{job['id']}")
+        job_token = _current_job.set(job)
+        try:
+            if asyncio.iscoroutinefunction(self.handler):
+                await self.handler(job["payload"])
+            else:
+                await asyncio.to_thread(self.handler, job["payload"])
+            await asyncio.to_thread(complete, job)
+        except PermanentJobError as e:
+            await asyncio.to_thread(fail, job, e, True)
+        except Exception as e:
+            await asyncio.to_thread(fail, job, e)
+        finally:
+            _current_job.reset(job_token)
+            logging_config.reset_request_id(token)
+
+
+_handler = None
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Define a função que processa cada mensagem (chamada pelas rotas na importação)
+def register_handler(handler):
+    global _handler
+    _handler = handler
+
+
+# Inicia os workers deste processo (uma vez por processo, inclusive após fork do gunicorn)
+def start_workers():
+    global _pool
+    # Processos filhos (ex.: pool de importação) não consomem a fila
+    if _handler is None or WORKERS <= 0 or multiprocessing.parent_process() is not None:
+        return None
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = WorkerPool(_handler, WORKERS)
+            _pool.start()
+            logger.info(f"{WORKERS} workers do webhook iniciados no processo {os.getpid()}")
+    return _pool
+
+
+def _wake_workers():
+    pool = start_workers()
+    if pool is not None:
+        pool.wake()
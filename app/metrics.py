@@ -0,0 +1,242 @@
+# Métricas da aplicação no formato texto do Prometheus (/metrics): latência por rota, consultas
+# ao banco (quantidade e tempo, inclusive por requisição), chamadas à IA e envios pela Twilio.
+# Os valores são do processo atual (cada worker do gunicorn expõe os seus).
+# Com PROFILE_SLOW_REQUESTS=1 cada requisição roda sob o cProfile e as mais lentas que
+# PROFILE_SLOW_THRESHOLD segundos têm o perfil gravado em PROFILE_DIR.
+import bisect
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from database import connection
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+PROFILE_SLOW_REQUESTS = os.getenv("PROFILE_SLOW_REQUESTS", "0") == "1"
+PROFILE_SLOW_THRESHOLD = float(os.getenv("PROFILE_SLOW_THRESHOLD", "1.0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(__file__), '..', 'log', 'profiles'))
+
+_registry = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_items(items))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_items(self, items):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+
+    def _render_items(self, items):
+        lines = []
+        for key, (counts, count, total) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+        return lines
+
+
+# Métricas calculadas na hora da coleta: fn() retorna [(nome, tipo, ajuda, {labels}, valor), ...]
+def register_collector(fn):
+    _collectors.append(fn)
+
+
+http_requests = Counter("http_requests_total", "Requisições atendidas", ("endpoint", "method", "status"))
+http_latency = Histogram("http_request_duration_seconds", "Latência das requisições", ("endpoint", "method"))
+db_queries = Counter("db_queries_total", "Consultas executadas no MySQL", ("operation", "outcome"))
+db_latency = Histogram("db_query_duration_seconds", "Tempo das consultas no MySQL", ("operation",))
+db_queries_per_request = Histogram(
+    "db_queries_per_request", "Consultas ao MySQL por requisição", ("endpoint",), buckets=QUERY_COUNT_BUCKETS
+)
+llm_latency = Histogram("llm_request_duration_seconds", "Tempo das chamadas ao modelo de IA", ("outcome",))
+twilio_latency = Histogram("twilio_send_duration_seconds", "Tempo dos envios pela Twilio", ("outcome",))
+slow_profiles = Counter("slow_request_profiles_total", "Perfis gravados de requisições lentas", ("endpoint",))
+
+
+# Mede o bloco e registra no histograma com outcome=ok/error
+@contextmanager
+def timed(histogram, **labels):
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        histogram.observe(time.perf_counter() - start, outcome=outcome, **labels)
+
+
+def _observe_query(operation, seconds, error):
+    db_queries.inc(operation=operation, outcome="error" if error else "ok")
+    db_latency.observe(seconds, operation=operation)
+    if has_request_context():
+        g.metrics_db_queries = g.get("metrics_db_queries", 0) + 1
+        g.metrics_db_seconds = g.get("metrics_db_seconds", 0.0) + seconds
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_db_queries = 0
+    g.metrics_db_seconds = 0.0
+    if PROFILE_SLOW_REQUESTS:
+        g.metrics_profiler = cProfile.Profile()
+        g.metrics_profiler.enable()
+
+
+def _dump_profile(profiler, endpoint, elapsed):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    request_id = g.get("request_id") or "-"
+    filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint.replace('.', '_')}-{int(elapsed * 1000)}ms-{request_id}.prof"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+    slow_profiles.inc(endpoint=endpoint)
+
+
+def _after_request(response):
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    endpoint = request.endpoint or "unknown"
+    http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    http_latency.observe(elapsed, endpoint=endpoint, method=request.method)
+    db_queries_per_request.observe(g.get("metrics_db_queries", 0), endpoint=endpoint)
+    response.headers["Server-Timing"] = (
+        f"app;dur={elapsed * 1000:.1f}, db;dur={g.get('metrics_db_seconds', 0.0) * 1000:.1f};desc=\"{g.get('metrics_db_queries', 0)} queries\""
+    )
+    profiler = g.pop("metrics_profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        if elapsed >= PROFILE_SLOW_THRESHOLD:
+            _dump_profile(profiler, endpoint, elapsed)
+    return response
+
+
+def _teardown_request(error):
+    # Requisição encerrada sem passar pelo after_request (exceção não tratada)
+    profiler = g.pop("metrics_profiler", None)
+    if profiler is not None:
+        profiler.disable()
+    start = g.pop("metrics_start", None)
+    if start is not None and error is not None:
+        endpoint = request.endpoint or "unknown"
+        http_requests.inc(endpoint=endpoint, method=request.method, status=500)
+        http_latency.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+
+
+# Instrumenta as rotas do blueprint e passa a medir as consultas feitas por database.connection
+def instrument_blueprint(blueprint):
+    blueprint.before_request(_before_request)
+    blueprint.after_request(_after_request)
+    blueprint.teardown_request(_teardown_request)
+    connection.add_query_observer(_observe_query)
+
+
+# Contadores do pool que só crescem (o resto, como in_use e idle, é o estado atual)
+_POOL_COUNTERS = {"created", "checkouts", "discarded", "timeouts", "health_check_failures", "wait_seconds_total"}
+
+
+def _pool_collector():
+    samples = []
+    for name, value in connection.pool_stats().items():
+        if not isinstance(value, (int, float)):
+            continue
+        if name in _POOL_COUNTERS:
+            metric = f"db_pool_{name}" if name.endswith("_total") else f"db_pool_{name}_total"
+            samples.append((metric, "counter", f"Pool de conexões: {name}", {}, value))
+        else:
+            samples.append((f"db_pool_{name}", "gauge", f"Pool de conexões: {name}", {}, value))
+    return samples
+
+
+register_collector(_pool_collector)
+
+
+# Texto no formato de exposição do Prometheus
+def render():
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    for collector in list(_collectors):
+        try:
+            samples = collector()
+        except Exception:
+            continue
+        seen = set()
+        for name, kind, documentation, labels, value in samples:
+            if name not in seen:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                seen.add(name)
+            names = tuple(labels)
+            lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
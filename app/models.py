@@ -1,22 +1,15 @@
+from flask import g, has_request_context
 from flask_login import UserMixin
-from database.connection import connect_db
-from werkzeug.security import generate_password_hash, check_password_hash
+from database.connection import connect_db, run_db
+from app import auth, data_versions, response_cache
+from app.product_index import ProductIndex
+from app.cache import TTLCache
+import hashlib
 import logging
 import os
-from logging.handlers import RotatingFileHandler
-
-# Configuração de logging
-log_dir = os.path.join(os.path.dirname(__file__), '..', 'log')
-os.makedirs(log_dir, exist_ok=True)
-log_handler = RotatingFileHandler(
-    os.path.join(log_dir, 'system.log'),
-    maxBytes=1024*1024,
-    backupCount=5
-)
-log_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+import threading
+
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-logger.addHandler(log_handler)
 
 class Usuario(UserMixin):
     def __init__(self, id, nome, email, plano):
@@ -25,8 +18,8 @@ class Usuario(UserMixin):
         self.email = email
         self.plano = plano
 
+# Levanta auth.AuthBusy se o pool de hash estiver cheio
 def registrar_usuario(nome, email, senha):
-    senha_hash = generate_password_hash(senha)
     conn = None
     cursor = None
     try:
@@ -39,6 +32,8 @@ def registrar_usuario(nome, email, senha):
         if cursor.fetchone():
             logger.error(f"E-mail {email} já está registrado")
             return False
+        # Hash só depois de confirmar que o e-mail está livre
+        senha_hash = auth.hash_password(senha)
         cursor.execute("""
             INSERT INTO usuarios (nome, email, senha_hash)
             VALUES (%s, %s, %s)
@@ -46,6 +41,8 @@ def registrar_usuario(nome, email, senha):
         conn.commit()
         logger.info(f"Usuário {email} registrado com sucesso")
         return True
+    except auth.AuthError:
+        raise
     except Exception as e:
         logger.error(f"Erro ao registrar usuário: {str(e)}")
         return False
@@ -55,7 +52,9 @@ def registrar_usuario(nome, email, senha):
         if conn:
             conn.close()
 
-def login_usuario(email, senha):
+# Levanta auth.TooManyAttempts (bloqueado antes de qualquer consulta ou hash) e auth.AuthBusy
+def login_usuario(email, senha, ip=None):
+    auth.check_login_allowed(email, ip)
     conn = None
     cursor = None
     try:
@@ -68,12 +67,19 @@ def login_usuario(email, senha):
         usuario = cursor.fetchone()
         if usuario is None:
             logger.warning(f"Usuário com e-mail {email} não encontrado")
+            auth.record_login(email, ip, False)
             return None
-        if not check_password_hash(usuario['senha_hash'], senha):
+        ok, rehash = auth.verify_password(usuario['senha_hash'], senha)
+        auth.record_login(email, ip, ok)
+        if not ok:
             logger.warning(f"Senha incorreta para {email}")
             return None
+        if rehash:
+            _atualizar_hash_senha(cursor, conn, usuario, senha)
         logger.info(f"Usuário {email} autenticado com sucesso")
         return usuario
+    except auth.AuthError:
+        raise
     except Exception as e:
         logger.error(f"Erro ao autenticar usuário: {str(e)}")
         return None
@@ -83,8 +89,24 @@ def login_usuario(email, senha):
         if conn:
             conn.close()
 
-def login_usuario_web(email, senha):
-    usuario_data = login_usuario(email, senha)
+# Refaz o hash com o algoritmo/custo atual; se falhar, o login segue com o hash antigo
+def _atualizar_hash_senha(cursor, conn, usuario, senha):
+    try:
+        novo_hash = auth.hash_password(senha)
+        # Só troca se ninguém alterou a senha desde a leitura
+        cursor.execute(
+            "UPDATE usuarios SET senha_hash = %s WHERE id = %s AND senha_hash = %s",
+            (novo_hash, usuario['id'], usuario['senha_hash'])
+        )
+        conn.commit()
+        auth.record_rehash(usuario['senha_hash'])
+        usuario['senha_hash'] = novo_hash
+        logger.info(f"Hash da senha de {usuario['email']} atualizado para {auth.ALGORITHM}")
+    except Exception as e:
+        logger.error(f"Erro ao atualizar o hash da senha de {usuario['email']}: {str(e)}")
+
+def login_usuario_web(email, senha, ip=None):
+    usuario_data = login_usuario(email, senha, ip)
     if usuario_data:
         return Usuario(
             id=usuario_data['id'],
@@ -94,11 +116,11 @@ def login_usuario_web(email, senha):
         )
     return None
 
+# Levanta auth.AuthBusy se o pool de hash estiver cheio
 def cadastrar_usuario_empresa(dados_usuario, dados_empresa):
     conn = None
     cursor = None
     try:
-        senha_hash = generate_password_hash(dados_usuario['senha'])
         conn = connect_db()
         if conn is None:
             logger.error("Falha ao conectar ao banco de dados")
@@ -108,6 +130,13 @@ def cadastrar_usuario_empresa(dados_usuario, dados_empresa):
         cursor.execute("SELECT id FROM usuarios WHERE email = %s", (dados_usuario['email'],))
         if cursor.fetchone():
             return False, f"E-mail {dados_usuario['email']} já está registrado"
+        # O número do WhatsApp identifica a empresa nas mensagens recebidas: um por empresa
+        telefone_e164 = normalize_telefone(dados_empresa['telefone'])
+        if telefone_e164:
+            cursor.execute("SELECT id FROM empresas WHERE telefone_e164 = %s", (telefone_e164,))
+            if cursor.fetchone():
+                return False, f"Telefone {dados_empresa['telefone']} já está registrado para outra empresa"
+        senha_hash = auth.hash_password(dados_usuario['senha'])
         cursor.execute("""
             INSERT INTO usuarios (nome, email, senha_hash, cpf, data_nascimento, cep, endereco, plano)
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
@@ -119,18 +148,24 @@ def cadastrar_usuario_empresa(dados_usuario, dados_empresa):
         ))
         usuario_id = cursor.lastrowid
         cursor.execute("""
-            INSERT INTO empresas (usuario_id, razao_social, nome_fantasia, cnpj, tipo_empresa, cep, endereco, telefone, email_empresarial, inscricao_estadual, inscricao_municipal)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            INSERT INTO empresas (usuario_id, razao_social, nome_fantasia, cnpj, tipo_empresa, cep, endereco, telefone, telefone_e164, email_empresarial, inscricao_estadual, inscricao_municipal)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """, (
             usuario_id, dados_empresa['razao_social'], dados_empresa['nome_fantasia'],
             dados_empresa['cnpj'], dados_empresa['tipo_empresa'],
             dados_empresa.get('cep_empresa', ''), dados_empresa.get('endereco_empresa', ''),
-            dados_empresa['telefone'], dados_empresa['email_empresarial'],
+            dados_empresa['telefone'], telefone_e164, dados_empresa['email_empresarial'],
             dados_empresa.get('inscricao_estadual', ''), dados_empresa.get('inscricao_municipal', '')
         ))
         conn.commit()
+        invalidate_lookup('usuario', str(usuario_id))
+        invalidate_lookup('empresa', str(usuario_id))
+        _entity_caches['telefone'].clear()
         logger.info(f"Usuário {dados_usuario['email']} e empresa {dados_empresa['razao_social']} cadastrados com sucesso")
         return True, f"Cadastro realizado com sucesso para {dados_usuario['nome']} ({dados_usuario['plano']})!"
+    except auth.AuthError:
+        conn.rollback()
+        raise
     except Exception as e:
         conn.rollback()
         logger.error(f"Erro ao cadastrar usuário/empresa: {str(e)}")
@@ -141,66 +176,261 @@ def cadastrar_usuario_empresa(dados_usuario, dados_empresa):
         if conn:
             conn.close()
 
-def get_empresa_id_by_usuario(usuario_id):
-    conn = None
+# Cache das consultas de usuário, empresa e persona: por requisição (flask.g) e por processo (LRU com TTL).
+# A persona usa a versão dos dados da empresa na chave, então save_persona invalida todos os workers.
+ENTITY_CACHE_TTL = float(os.getenv("ENTITY_CACHE_TTL", "300"))
+ENTITY_CACHE_SIZE = int(os.getenv("ENTITY_CACHE_SIZE", "10000"))
+_entity_caches = {kind: TTLCache(maxsize=ENTITY_CACHE_SIZE, ttl=ENTITY_CACHE_TTL) for kind in ('usuario', 'empresa', 'persona', 'telefone', 'plano')}
+_MISS = object()
+
+def _cached_lookup(kind, key, loader):
+    request_cache = None
+    if has_request_context():
+        request_cache = g.setdefault('_entity_lookups', {})
+        if (kind, key) in request_cache:
+            return request_cache[(kind, key)]
+    cache = _entity_caches[kind]
+    value = cache.get(key, _MISS)
+    if value is _MISS:
+        # Erros de banco propagam e não são guardados; "não encontrado" (None) é guardado
+        value = loader()
+        cache.set(key, value)
+    if request_cache is not None:
+        request_cache[(kind, key)] = value
+    return value
+
+def invalidate_lookup(kind, key):
+    _entity_caches[kind].delete(key)
+    if has_request_context():
+        g.setdefault('_entity_lookups', {}).pop((kind, key), None)
+
+def _fetch_one(sql, params):
+    conn = connect_db()
     cursor = None
     try:
-        conn = connect_db()
-        if conn is None:
-            logger.error("Falha ao conectar ao banco de dados")
-            return None
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id FROM empresas WHERE usuario_id = %s", (usuario_id,))
-        empresa = cursor.fetchone()
-        if empresa:
-            logger.info(f"Empresa encontrada para usuario_id {usuario_id}: empresa_id {empresa['id']}")
-            return empresa['id']
-        logger.warning(f"Empresa não encontrada para usuario_id {usuario_id}")
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+    finally:
+        if cursor:
+            cursor.close()
+        conn.close()
+
+def _fetch_usuario(user_id):
+    usuario = _fetch_one("SELECT id, nome, email, plano FROM usuarios WHERE id = %s", (user_id,))
+    return dict(usuario) if usuario else None
+
+def get_usuario_by_id(user_id):
+    try:
+        return _cached_lookup('usuario', str(user_id), lambda: _fetch_usuario(user_id))
+    except Exception as e:
+        logger.error(f"Erro ao buscar usuário: {str(e)}")
         return None
+
+def _fetch_empresa_id(usuario_id):
+    empresa = _fetch_one("SELECT id FROM empresas WHERE usuario_id = %s", (usuario_id,))
+    if empresa:
+        logger.info(f"Empresa encontrada para usuario_id {usuario_id}: empresa_id {empresa['id']}")
+        return empresa['id']
+    logger.warning(f"Empresa não encontrada para usuario_id {usuario_id}")
+    return None
+
+def get_empresa_id_by_usuario(usuario_id):
+    try:
+        return _cached_lookup('empresa', str(usuario_id), lambda: _fetch_empresa_id(usuario_id))
     except Exception as e:
         logger.error(f"Erro ao buscar empresa: {str(e)}")
         return None
+
+def _fetch_persona(empresa_id):
+    persona = _fetch_one("SELECT * FROM persona_ia WHERE empresa_id = %s", (empresa_id,))
+    if persona:
+        logger.info(f"Persona encontrada para empresa_id {empresa_id}")
+        return persona
+    logger.warning(f"Persona não encontrada para empresa_id {empresa_id}")
+    return None
+
+# use_cache=False lê direto do banco (usado por save_persona pra decidir entre INSERT e UPDATE)
+def get_persona_by_empresa(empresa_id, use_cache=True):
+    try:
+        if not use_cache:
+            return _fetch_persona(empresa_id)
+        key = (str(empresa_id), data_versions.current(empresa_id))
+        return _cached_lookup('persona', key, lambda: _fetch_persona(empresa_id))
+    except Exception as e:
+        logger.error(f"Erro ao buscar persona: {str(e)}")
+        return None
+
+# DDI usado nos telefones cadastrados sem código do país
+DDI_PADRAO = os.getenv("TELEFONE_DDI_PADRAO", "55")
+
+# Telefone no formato E.164 ("+5511987654321"), ou None se não for um número válido. Números com
+# "+" ou "00" já trazem o DDI (é o caso da Twilio); os demais são nacionais: perdem o 0 de
+# operadora/tronco e ganham o DDI_PADRAO ("(011) 98765-4321" -> "+5511987654321")
+def normalize_telefone(telefone):
+    texto = (telefone or '').strip()
+    if texto.startswith('whatsapp:'):
+        texto = texto[len('whatsapp:'):]
+    digitos = ''.join(c for c in texto if c.isdigit())
+    if texto.startswith('+'):
+        pass
+    elif digitos.startswith('00'):
+        digitos = digitos[2:]
+    else:
+        digitos = DDI_PADRAO + digitos.lstrip('0')
+    if not 10 <= len(digitos) <= 15:
+        return None
+    return '+' + digitos
+
+def _fetch_empresa_id_by_telefone(telefone_e164):
+    # Igualdade exata na coluna indexada (gravada já normalizada no cadastro)
+    empresa = _fetch_one("SELECT id FROM empresas WHERE telefone_e164 = %s", (telefone_e164,))
+    return empresa['id'] if empresa else None
+
+# Empresa dona do número de WhatsApp que recebeu a mensagem
+def get_empresa_id_by_telefone(telefone):
+    telefone_e164 = normalize_telefone(telefone)
+    if telefone_e164 is None:
+        return None
+    try:
+        return _cached_lookup('telefone', telefone_e164, lambda: _fetch_empresa_id_by_telefone(telefone_e164))
+    except Exception as e:
+        logger.error(f"Erro ao buscar empresa pelo telefone: {str(e)}")
+        return None
+
+async def get_empresa_id_by_telefone_async(telefone):
+    return await run_db(get_empresa_id_by_telefone, telefone)
+
+# Preenche telefone_e164 das empresas cadastradas antes da coluna (ver a migração em init_db.sql).
+# Números inválidos ficam NULL; um número repetido fica só na empresa mais antiga e é avisado no log
+def preencher_telefones_e164():
+    conn = connect_db()
+    cursor = None
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT id, telefone FROM empresas WHERE telefone_e164 IS NULL ORDER BY id")
+        empresas = cursor.fetchall()
+        cursor.execute("SELECT telefone_e164 FROM empresas WHERE telefone_e164 IS NOT NULL")
+        usados = {row['telefone_e164'] for row in cursor.fetchall()}
+        preenchidos = 0
+        for empresa in empresas:
+            telefone_e164 = normalize_telefone(empresa['telefone'])
+            if telefone_e164 is None:
+                continue
+            if telefone_e164 in usados:
+                logger.warning(f"Telefone {telefone_e164} da empresa {empresa['id']} já pertence a outra empresa")
+                continue
+            cursor.execute("UPDATE empresas SET telefone_e164 = %s WHERE id = %s", (telefone_e164, empresa['id']))
+            usados.add(telefone_e164)
+            preenchidos += 1
+        conn.commit()
+        _entity_caches['telefone'].clear()
+        logger.info(f"Telefones normalizados: {preenchidos} de {len(empresas)} empresas")
+        return preenchidos
     finally:
         if cursor:
             cursor.close()
-        if conn:
-            conn.close()
+        conn.close()
+
+def _fetch_plano_empresa(empresa_id):
+    usuario = _fetch_one("""
+        SELECT u.plano FROM empresas e JOIN usuarios u ON u.id = e.usuario_id WHERE e.id = %s
+    """, (empresa_id,))
+    return usuario['plano'] if usuario else None
+
+# Plano do dono da empresa (define a prioridade e os limites de uso da IA, ver app.llm_scheduler)
+def get_plano_by_empresa(empresa_id):
+    if empresa_id is None:
+        return None
+    try:
+        return _cached_lookup('plano', str(empresa_id), lambda: _fetch_plano_empresa(empresa_id))
+    except Exception as e:
+        logger.error(f"Erro ao buscar plano da empresa: {str(e)}")
+        return None
+
+async def get_plano_by_empresa_async(empresa_id):
+    if empresa_id is None:
+        return None
+    return await run_db(get_plano_by_empresa, empresa_id)
 
-def get_persona_by_empresa(empresa_id):
+# Índices de busca do catálogo (um por escopo de empresa), reconstruídos quando a versão
+# dos dados muda fora deste processo
+PRODUCT_INDEX_MAX = int(os.getenv("PRODUCT_INDEX_MAX", "100"))
+PRODUCT_INDEX_TTL = float(os.getenv("PRODUCT_INDEX_TTL", "86400"))
+_product_indexes = TTLCache(maxsize=PRODUCT_INDEX_MAX, ttl=PRODUCT_INDEX_TTL)
+_product_index_lock = threading.Lock()
+
+def _build_product_index(empresa_id, version):
+    index = ProductIndex()
     conn = None
     cursor = None
     try:
         conn = connect_db()
-        if conn is None:
-            logger.error("Falha ao conectar ao banco de dados")
-            return None
         cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM persona_ia WHERE empresa_id = %s", (empresa_id,))
-        persona = cursor.fetchone()
-        if persona:
-            logger.info(f"Persona encontrada para empresa_id {empresa_id}")
-            return persona
-        logger.warning(f"Persona não encontrada para empresa_id {empresa_id}")
-        return None
-    except Exception as e:
-        logger.error(f"Erro ao buscar persona: {str(e)}")
-        return None
+        # Lê só o catálogo da empresa (prefixo do índice único empresa_id, codigo)
+        cursor.execute("SELECT codigo, produto, unidade_medida, valor_venda FROM produtos WHERE empresa_id = %s", (empresa_id,))
+        while True:
+            rows = cursor.fetchmany(PRODUTOS_CHUNK_SIZE)
+            if not rows:
+                break
+            index.upsert(rows)
     finally:
         if cursor:
             cursor.close()
         if conn:
             conn.close()
+    index.version = version
+    logger.info(f"Índice de produtos construído para empresa_id {empresa_id}: {len(index)} produtos")
+    return index
+
+# Cada empresa tem seu catálogo, versionado junto com os demais dados dela
+def _product_index_scope(empresa_id):
+    return data_versions.scope_for(empresa_id)
+
+def get_product_index(empresa_id):
+    scope = _product_index_scope(empresa_id)
+    version = data_versions.current(empresa_id)
+    index = _product_indexes.get(scope)
+    if index is not None and index.version == version:
+        return index
+    with _product_index_lock:
+        index = _product_indexes.get(scope)
+        if index is None or index.version != version:
+            index = _build_product_index(empresa_id, version)
+            _product_indexes.set(scope, index)
+    return index
+
+# Produtos do catálogo mais relevantes para a mensagem do cliente (usados no prompt da IA)
+def get_produtos_relevantes(empresa_id, message, limit):
+    try:
+        return get_product_index(empresa_id).search(message, limit)
+    except Exception as e:
+        logger.error(f"Erro ao buscar produtos relevantes para empresa_id {empresa_id}: {str(e)}")
+        return []
+
+async def get_produtos_relevantes_async(empresa_id, message, limit):
+    return await run_db(get_produtos_relevantes, empresa_id, message, limit)
+
+# Aplica os produtos gravados (e removidos) ao índice em memória, se ele estava em dia até a
+# gravação; senão a próxima busca reconstrói o índice a partir do banco
+def _atualizar_indice_produtos(empresa_id, indice, produtos, version, removidos=()):
+    if indice is None or version is None or indice.version != version - 1:
+        return
+    indice.upsert(produtos)
+    indice.remove(removidos)
+    indice.version = version
 
 def save_persona(empresa_id, dados_persona):
     conn = None
     cursor = None
     try:
+        # Consulta a persona antes de retirar a conexão, pra não ocupar duas conexões do pool
+        persona = get_persona_by_empresa(empresa_id, use_cache=False)
         conn = connect_db()
         if conn is None:
             logger.error("Falha ao conectar ao banco de dados")
             return False
         cursor = conn.cursor()
-        persona = get_persona_by_empresa(empresa_id)
         diretrizes = (dados_persona.get('diretrizes') or [])[:8]
         diretrizes += [''] * (8 - len(diretrizes))
         nome_agente = dados_persona.get('nome_agente', '')
@@ -239,6 +469,8 @@ def save_persona(empresa_id, dados_persona):
                 diretrizes[6] or None, diretrizes[7] or None
             ))
         conn.commit()
+        # Nova versão dos dados da empresa: invalida a persona em cache e as respostas da IA
+        response_cache.invalidate(empresa_id)
         logger.info(f"Persona salva para empresa_id {empresa_id}")
         return True
     except Exception as e:
@@ -250,31 +482,140 @@ def save_persona(empresa_id, dados_persona):
         if conn:
             conn.close()
 
-def save_produtos(produtos=None, update=False):
+# Tamanho dos lotes de escrita/consulta na importação de produtos
+PRODUTOS_CHUNK_SIZE = int(os.getenv("PRODUTOS_CHUNK_SIZE", "1000"))
+PRODUTO_COLUMNS = ['codigo', 'produto', 'valor_unitario', 'desconto', 'valor_venda', 'unidade_medida', 'quantidade']
+# Códigos listados por tipo de diferença no resumo da sincronização
+SYNC_DIFF_MAX_CODIGOS = int(os.getenv("SYNC_DIFF_MAX_CODIGOS", "200"))
+
+_INSERT_PRODUTOS_SQL = """
+    INSERT INTO produtos (
+        empresa_id, codigo, produto, valor_unitario, desconto, valor_venda,
+        unidade_medida, quantidade, hash_linha
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+# A chave do ON DUPLICATE KEY é o índice único (empresa_id, codigo)
+_UPSERT_PRODUTOS_SQL = _INSERT_PRODUTOS_SQL + """
+    ON DUPLICATE KEY UPDATE
+        produto = VALUES(produto), valor_unitario = VALUES(valor_unitario),
+        desconto = VALUES(desconto), valor_venda = VALUES(valor_venda),
+        unidade_medida = VALUES(unidade_medida), quantidade = VALUES(quantidade),
+        hash_linha = VALUES(hash_linha)
+"""
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _texto_valido(serie):
+    return serie.map(lambda v: isinstance(v, str) and bool(v.strip()))
+
+# Valida e converte todos os produtos de uma vez (vetorizado com pandas); retorna (DataFrame válido, qtd. ignorada)
+def _preparar_produtos(produtos):
+    # pandas só é carregado no primeiro upload (deixa a inicialização do app mais rápida)
+    import pandas as pd
+    df = pd.DataFrame.from_records([p for p in produtos if isinstance(p, dict)])
+    for coluna in PRODUTO_COLUMNS:
+        if coluna not in df.columns:
+            df[coluna] = None
+    df = df[PRODUTO_COLUMNS]
+    valido = _texto_valido(df['codigo']) & _texto_valido(df['produto']) & _texto_valido(df['unidade_medida'])
+
+    def numero(coluna, padrao=0):
+        # Ausente/None assume o padrão; texto que não é número invalida a linha
+        ausente = df[coluna].isna()
+        convertido = pd.to_numeric(df[coluna].where(~ausente, padrao), errors='coerce')
+        return convertido, convertido.isna()
+
+    valor_unitario, erro_unitario = numero('valor_unitario')
+    desconto, erro_desconto = numero('desconto')
+    ausente_venda = df['valor_venda'].isna()
+    valor_venda = pd.to_numeric(df['valor_venda'].where(~ausente_venda, 0), errors='coerce')
+    valor_venda = valor_venda.where(~ausente_venda, valor_unitario - desconto)
+    erro_venda = valor_venda.isna()
+    quantidade, erro_quantidade = numero('quantidade')
+    valido &= ~(erro_unitario | erro_desconto | erro_venda | erro_quantidade)
+
+    resultado = pd.DataFrame({
+        'codigo': df['codigo'],
+        'produto': df['produto'],
+        'valor_unitario': valor_unitario.astype(float),
+        'desconto': desconto.astype(float),
+        'valor_venda': valor_venda.astype(float),
+        'unidade_medida': df['unidade_medida'],
+        'quantidade': quantidade.fillna(0).astype('int64'),
+    })[valido]
+    ignorados = len(produtos) - len(resultado)
+    if ignorados:
+        exemplos = ', '.join(str(c) for c in df.loc[~valido, 'codigo'].head(5).tolist())
+        logger.warning(f"{ignorados} produto(s) ignorado(s) por código, nome, unidade ou valores inválidos (ex.: {exemplos})")
+    return resultado, ignorados
+
+# Hash de cada produto já normalizado (valores com 2 casas, como ficam gravados); a sincronização
+# compara só o hash pra saber se o produto mudou
+def _hash_linhas(df):
+    def valor(coluna):
+        return df[coluna].map('{:.2f}'.format)
+    linhas = (
+        df['produto'].astype(str) + '\x1f' + valor('valor_unitario') + '\x1f' + valor('desconto') + '\x1f'
+        + valor('valor_venda') + '\x1f' + df['unidade_medida'].astype(str) + '\x1f' + df['quantidade'].astype(str)
+    )
+    return [hashlib.md5(linha.encode('utf-8'), usedforsecurity=False).hexdigest() for linha in linhas]
+
+def _linhas_produtos(empresa_id, df):
+    if 'hash_linha' not in df.columns:
+        df = df.assign(hash_linha=_hash_linhas(df))
+    return [(empresa_id,) + linha for linha in df[PRODUTO_COLUMNS + ['hash_linha']].itertuples(index=False, name=None)]
+
+# Consulta, em lotes, quais códigos já existem no catálogo da empresa (busca pelo índice único
+# empresa_id, codigo: o custo não depende de quantas empresas existem)
+def _codigos_existentes(cursor, empresa_id, codigos):
+    existentes = set()
+    for lote in _chunks(codigos, PRODUTOS_CHUNK_SIZE):
+        cursor.execute(
+            "SELECT codigo FROM produtos WHERE empresa_id = %%s AND codigo IN (%s)" % ", ".join(["%s"] * len(lote)),
+            [empresa_id] + list(lote)
+        )
+        existentes.update(row[0] for row in cursor.fetchall())
+    return existentes
+
+# Grava produtos no catálogo da empresa. skip_duplicates: sem update, grava os produtos novos
+# e apenas relata os já existentes (usado na importação de arquivos em lotes)
+def save_produtos(empresa_id, produtos=None, update=False, skip_duplicates=False):
     conn = None
     cursor = None
     try:
         # Validar entrada
+        if empresa_id is None:
+            logger.error("Empresa não informada ao salvar produtos")
+            return {"success": False, "message": "Empresa não encontrada", "inserted": 0, "updated": 0, "duplicates": []}
         if not produtos or not isinstance(produtos, list):
             logger.error("Lista de produtos inválida ou vazia")
             return {"success": False, "message": "Nenhum produto válido fornecido", "inserted": 0, "updated": 0, "duplicates": []}
 
+        # Validar e converter tipos em uma única passada
+        df, _ = _preparar_produtos(produtos)
+
         conn = connect_db()
         if conn is None:
             logger.error("Falha ao conectar ao banco de dados")
             return {"success": False, "message": "Erro ao conectar ao banco de dados", "inserted": 0, "updated": 0, "duplicates": []}
-        
+
         cursor = conn.cursor()
-        
-        # Verificar duplicatas
-        codigos = [produto.get('codigo', '') for produto in produtos if produto.get('codigo')]
-        cursor.execute("""
-            SELECT codigo FROM produtos WHERE codigo IN (%s)
-        """ % ", ".join(["%s"] * len(codigos)), codigos)
-        duplicates = [row[0] for row in cursor.fetchall()]
-        
-        if duplicates and not update:
-            logger.warning(f"Produtos duplicados encontrados: {', '.join(duplicates)}")
+        indice = _product_indexes.get(_product_index_scope(empresa_id))
+
+        # Verificar duplicatas (uma consulta por lote de códigos)
+        codigos = list(dict.fromkeys(
+            p.get('codigo') for p in produtos
+            if isinstance(p, dict) and isinstance(p.get('codigo'), str) and p.get('codigo')
+        ))
+        existentes = _codigos_existentes(cursor, empresa_id, codigos)
+        duplicates = [codigo for codigo in codigos if codigo in existentes]
+
+        if duplicates and not update and skip_duplicates:
+            df = df[~df['codigo'].isin(existentes)]
+        elif duplicates and not update:
+            logger.warning(f"{len(duplicates)} produto(s) duplicado(s) encontrado(s): {', '.join(duplicates[:20])}")
             return {
                 "success": False,
                 "message": "Produtos duplicados encontrados",
@@ -283,90 +624,29 @@ def save_produtos(produtos=None, update=False):
                 "duplicates": duplicates
             }
 
-        # Processar inserções e atualizações
-        inserted_count = 0
-        updated_count = 0
-        processed_products = []
-        
-        for produto in produtos:
-            codigo = produto.get('codigo', '')
-            if not codigo or not isinstance(codigo, str) or not codigo.strip():
-                logger.warning(f"Produto sem código válido ignorado: {produto}")
-                continue
-            
-            # Validar e converter tipos
-            try:
-                valor_unitario = float(produto.get('valor_unitario', 0))
-                desconto = float(produto.get('desconto', 0))
-                # Calcular valor_venda se não fornecido
-                valor_venda = float(produto.get('valor_venda', valor_unitario - desconto))
-                quantidade = int(produto.get('quantidade', 0))
-                produto_nome = produto.get('produto', '')
-                unidade_medida = produto.get('unidade_medida', '')
-                
-                # Validar campos obrigatórios
-                if not produto_nome or not isinstance(produto_nome, str) or not produto_nome.strip():
-                    logger.warning(f"Produto {codigo} ignorado: nome do produto ausente ou inválido")
-                    continue
-                if not unidade_medida or not isinstance(unidade_medida, str) or not unidade_medida.strip():
-                    logger.warning(f"Produto {codigo} ignorado: unidade_medida ausente ou inválida")
-                    continue
-            except (ValueError, TypeError) as e:
-                logger.error(f"Erro de tipo no produto {codigo}: {str(e)}")
-                continue
-            
-            # Verificar se o produto já existe
-            cursor.execute("""
-                SELECT id FROM produtos WHERE codigo = %s
-            """, (codigo,))
-            existing_product = cursor.fetchone()
-            
-            if existing_product and update:
-                # Atualizar produto existente
-                logger.debug(f"Atualizando produto {codigo}")
-                cursor.execute("""
-                    UPDATE produtos
-                    SET produto = %s, valor_unitario = %s, desconto = %s, valor_venda = %s,
-                        unidade_medida = %s, quantidade = %s
-                    WHERE codigo = %s
-                """, (
-                    produto_nome, valor_unitario, desconto, valor_venda,
-                    unidade_medida, quantidade, codigo
-                ))
-                updated_count += 1
-            elif not existing_product:
-                # Inserir novo produto
-                logger.debug(f"Inserindo produto {codigo}")
-                cursor.execute("""
-                    INSERT INTO produtos (
-                        codigo, produto, valor_unitario, desconto, valor_venda,
-                        unidade_medida, quantidade
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    codigo, produto_nome, valor_unitario, desconto, valor_venda,
-                    unidade_medida, quantidade
-                ))
-                inserted_count += 1
-            
-            # Adicionar produto processado à lista
-            processed_products.append({
-                'codigo': codigo,
-                'produto': produto_nome,
-                'valor_unitario': valor_unitario,
-                'desconto': desconto,
-                'valor_venda': valor_venda,
-                'unidade_medida': unidade_medida,
-                'quantidade': quantidade
-            })
-        
+        # Códigos repetidos no próprio arquivo: com update vale a última linha, sem update a primeira
+        unicos = df.drop_duplicates(subset='codigo', keep='last' if update else 'first')
+        inserted_count = int((~unicos['codigo'].isin(existentes)).sum())
+        updated_count = len(unicos) - inserted_count if update else 0
+
+        linhas = _linhas_produtos(empresa_id, unicos)
+        sql = _UPSERT_PRODUTOS_SQL if update else _INSERT_PRODUTOS_SQL
+        # executemany agrupa cada lote em um único INSERT com várias linhas
+        for lote in _chunks(linhas, PRODUTOS_CHUNK_SIZE):
+            cursor.executemany(sql, lote)
+
         conn.commit()
-        logger.info(f"Produtos processados: {inserted_count} inseridos, {updated_count} atualizados, {len(processed_products)} retornados")
+        # Só as respostas e o índice da própria empresa ficam desatualizados
+        version = response_cache.invalidate(empresa_id)
+        _atualizar_indice_produtos(empresa_id, indice, unicos.to_dict('records'), version)
+        processed_products = df.to_dict('records')
+        logger.info(f"Produtos processados para empresa_id {empresa_id}: {inserted_count} inseridos, {updated_count} atualizados, {len(processed_products)} retornados")
         return {
             "success": True,
             "inserted": inserted_count,
             "updated": updated_count,
             "message": f"{inserted_count} produtos inseridos e {updated_count} produtos atualizados com sucesso!",
-            "duplicates": [],
+            "duplicates": duplicates if skip_duplicates else [],
             "data": processed_products
         }
     except Exception as e:
@@ -385,4 +665,144 @@ def save_produtos(produtos=None, update=False):
         if cursor:
             cursor.close()
         if conn:
-            conn.close()
\ No newline at end of file
+            conn.close()
+
+# Hashes gravados dos produtos da empresa: o catálogo inteiro numa consulta (codigos=None)
+# ou só os códigos informados, em lotes pelo índice único
+def _hashes_gravados(cursor, empresa_id, codigos=None):
+    if codigos is None:
+        cursor.execute("SELECT codigo, hash_linha FROM produtos WHERE empresa_id = %s", (empresa_id,))
+        return dict(cursor.fetchall())
+    gravados = {}
+    for lote in _chunks(codigos, PRODUTOS_CHUNK_SIZE):
+        cursor.execute(
+            "SELECT codigo, hash_linha FROM produtos WHERE empresa_id = %%s AND codigo IN (%s)" % ", ".join(["%s"] * len(lote)),
+            [empresa_id] + list(lote)
+        )
+        gravados.update(cursor.fetchall())
+    return gravados
+
+def _remover_produtos(cursor, empresa_id, codigos):
+    for lote in _chunks(codigos, PRODUTOS_CHUNK_SIZE):
+        cursor.execute(
+            "DELETE FROM produtos WHERE empresa_id = %%s AND codigo IN (%s)" % ", ".join(["%s"] * len(lote)),
+            [empresa_id] + list(lote)
+        )
+
+def _codigos_enviados(produtos):
+    return {str(p.get('codigo')) for p in produtos if isinstance(p, dict) and p.get('codigo') is not None}
+
+# Resultado vazio da sincronização (erros e validação)
+def _sync_vazio(message):
+    return {
+        "success": False, "message": message, "inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0,
+        "ignored": 0, "diff": {"inserted": [], "updated": [], "deleted": []}
+    }
+
+# Modo de sincronização para reenvios do catálogo completo: compara o hash de cada produto com o
+# gravado e escreve só os novos e os alterados (com delete_missing, também apaga os que não vieram).
+# Retorna o resumo das diferenças; sem diferenças, os caches da empresa continuam valendo
+def sync_produtos(empresa_id, produtos=None, delete_missing=False):
+    conn = None
+    cursor = None
+    try:
+        if empresa_id is None:
+            logger.error("Empresa não informada ao sincronizar produtos")
+            return _sync_vazio("Empresa não encontrada")
+        if not produtos or not isinstance(produtos, list):
+            logger.error("Lista de produtos inválida ou vazia")
+            return _sync_vazio("Nenhum produto válido fornecido")
+
+        df, ignorados = _preparar_produtos(produtos)
+        # Códigos repetidos na lista: vale a última linha, como no update
+        unicos = df.drop_duplicates(subset='codigo', keep='last')
+        unicos = unicos.assign(hash_linha=_hash_linhas(unicos))
+
+        conn = connect_db()
+        cursor = conn.cursor()
+        indice = _product_indexes.get(_product_index_scope(empresa_id))
+        # Com delete_missing é preciso conhecer o catálogo todo; senão só os códigos enviados
+        gravados = _hashes_gravados(cursor, empresa_id, None if delete_missing else list(unicos['codigo']))
+
+        novos, alterados, escrever = [], [], []
+        for posicao, (codigo, hash_linha) in enumerate(zip(unicos['codigo'], unicos['hash_linha'])):
+            if codigo not in gravados:
+                novos.append(codigo)
+            elif gravados[codigo] != hash_linha:
+                # Sem hash gravado (produto salvo antes da sincronização) conta como alterado
+                alterados.append(codigo)
+            else:
+                continue
+            escrever.append(posicao)
+        mudancas = unicos.iloc[escrever]
+        removidos = []
+        if delete_missing:
+            # Linhas inválidas não apagam o produto: só some o que não veio de forma alguma
+            enviados = _codigos_enviados(produtos)
+            removidos = [codigo for codigo in gravados if codigo not in enviados]
+
+        for lote in _chunks(_linhas_produtos(empresa_id, mudancas), PRODUTOS_CHUNK_SIZE):
+            cursor.executemany(_UPSERT_PRODUTOS_SQL, lote)
+        _remover_produtos(cursor, empresa_id, removidos)
+        conn.commit()
+
+        if escrever or removidos:
+            version = response_cache.invalidate(empresa_id)
+            _atualizar_indice_produtos(empresa_id, indice, mudancas.to_dict('records'), version, removidos)
+        inalterados = len(unicos) - len(escrever)
+        message = (
+            f"{len(novos)} produtos inseridos, {len(alterados)} atualizados, {inalterados} sem alteração"
+            + (f" e {len(removidos)} removidos" if delete_missing else "")
+        )
+        logger.info(f"Sincronização do catálogo da empresa_id {empresa_id}: {message}")
+        return {
+            "success": True,
+            "message": message,
+            "inserted": len(novos),
+            "updated": len(alterados),
+            "unchanged": inalterados,
+            "deleted": len(removidos),
+            "ignored": ignorados,
+            "diff": {
+                "inserted": novos[:SYNC_DIFF_MAX_CODIGOS],
+                "updated": alterados[:SYNC_DIFF_MAX_CODIGOS],
+                "deleted": removidos[:SYNC_DIFF_MAX_CODIGOS],
+            }
+        }
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Erro ao sincronizar produtos: {str(e)}")
+        return _sync_vazio(f"Erro ao sincronizar produtos: {str(e)}")
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+# Apaga do catálogo da empresa os produtos fora de `enviados` (fim da sincronização em lotes
+# da importação de arquivos, quando só no final se conhece a lista completa)
+def remover_produtos_ausentes(empresa_id, enviados):
+    conn = None
+    cursor = None
+    try:
+        conn = connect_db()
+        cursor = conn.cursor()
+        indice = _product_indexes.get(_product_index_scope(empresa_id))
+        cursor.execute("SELECT codigo FROM produtos WHERE empresa_id = %s", (empresa_id,))
+        removidos = [row[0] for row in cursor.fetchall() if row[0] not in enviados]
+        _remover_produtos(cursor, empresa_id, removidos)
+        conn.commit()
+        if removidos:
+            version = response_cache.invalidate(empresa_id)
+            _atualizar_indice_produtos(empresa_id, indice, [], version, removidos)
+        return removidos
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
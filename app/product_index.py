@@ -0,0 +1,131 @@
+# Índice de busca (BM25) sobre o catálogo de produtos, em memória: a cada mensagem só os
+# produtos mais relevantes entram no prompt da IA, em vez do catálogo inteiro.
+# O índice é atualizado produto a produto (upsert), sem precisar ser reconstruído.
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)?")
+# Palavras comuns nas perguntas dos clientes que não ajudam a achar produtos
+STOPWORDS = frozenset("""
+    a o as os um uma uns umas de do da dos das no na nos nas em para pra por com sem e ou que
+    qual quais quanto quanta quantos quantas custa custam preco valor tem voce voces vcs me
+    meu minha eu quero queria gostaria saber tipo isso esse essa este esta ai la ja mais
+""".split())
+# Campos indexados (o nome do produto pesa mais que a unidade)
+FIELDS = (('codigo', 2), ('produto', 1), ('unidade_medida', 1))
+
+
+def _fold(text):
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+# "Cafés" -> "cafe": minúsculas, sem acento e sem o plural simples
+def tokenize(text):
+    tokens = []
+    for token in _TOKEN_RE.findall(_fold(text)):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token[-2].isdigit():
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class ProductIndex:
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        # Versão dos dados (app.data_versions) que o índice reflete
+        self.version = None
+        self._docs = {}
+        self._doc_len = {}
+        self._postings = {}
+        self._total_len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _terms(self, produto):
+        terms = Counter()
+        for field, weight in FIELDS:
+            value = produto.get(field)
+            if value is None or value == '':
+                continue
+            for token in tokenize(value):
+                terms[token] += weight
+        codigo = _fold(produto.get('codigo') or '').strip()
+        if codigo:
+            # O código inteiro também vale como termo (ex.: "ab-123")
+            terms[codigo] += 2
+        return terms
+
+    def _remove(self, codigo):
+        if codigo not in self._docs:
+            return
+        for term in self._terms(self._docs.pop(codigo)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(codigo, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_len -= self._doc_len.pop(codigo)
+
+    # Insere ou substitui produtos (chave: codigo)
+    def upsert(self, produtos):
+        with self._lock:
+            for produto in produtos:
+                codigo = produto.get('codigo')
+                if not codigo:
+                    continue
+                codigo = str(codigo)
+                self._remove(codigo)
+                doc = {
+                    'codigo': codigo,
+                    'produto': produto.get('produto'),
+                    'unidade_medida': produto.get('unidade_medida'),
+                    'valor_venda': produto.get('valor_venda'),
+                }
+                terms = self._terms(doc)
+                self._docs[codigo] = doc
+                self._doc_len[codigo] = sum(terms.values())
+                self._total_len += self._doc_len[codigo]
+                for term, tf in terms.items():
+                    self._postings.setdefault(term, {})[codigo] = tf
+
+    def remove(self, codigos):
+        with self._lock:
+            for codigo in codigos:
+                self._remove(str(codigo))
+
+    # Os k produtos mais relevantes para o texto (lista vazia se nenhum termo bater)
+    def search(self, query, k=8):
+        terms = set(tokenize(query))
+        folded = _fold(query).strip()
+        if folded:
+            terms.add(folded)
+        with self._lock:
+            n = len(self._docs)
+            if not n or not terms:
+                return []
+            avg_len = self._total_len / n or 1
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for codigo, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[codigo] / avg_len)
+                    scores[codigo] = scores.get(codigo, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [dict(self._docs[codigo]) for codigo, _ in best]
+
+    def stats(self):
+        with self._lock:
+            return {"produtos": len(self._docs), "termos": len(self._postings), "version": self.version}
@@ -0,0 +1,126 @@
+# Montagem do prompt de sistema de cada empresa a partir da persona (persona_ia).
+# O prompt é compilado uma vez e fica em cache; só é recompilado quando a versão dos dados da
+# empresa muda (app.data_versions). Os produtos entram por mensagem: só os mais relevantes
+# para a pergunta, buscados no índice do catálogo (app.product_index).
+import logging
+import os
+from collections import namedtuple
+from app import data_versions
+from app.cache import TTLCache
+from app.models import get_persona_by_empresa, get_produtos_relevantes, get_produtos_relevantes_async
+from database.connection import run_db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYSTEM_PROMPT = "Você é um assistente prestativo."
+DEFAULT_MAX_TOKENS = 150
+# tamanho_resposta escolhido na página de persona -> limite de tokens da resposta
+MAX_TOKENS_BY_TAMANHO = {
+    'Minimalistas': 60,
+    'Curta': 120,
+    'Longa': 400,
+}
+# Quantos produtos (os mais relevantes para a mensagem) entram no prompt
+PROMPT_MAX_PRODUTOS = int(os.getenv("PROMPT_MAX_PRODUTOS", "8"))
+
+CompiledPrompt = namedtuple('CompiledPrompt', ['system_prompt', 'max_tokens', 'temperature'])
+
+_compiled = TTLCache(maxsize=int(os.getenv("PROMPT_CACHE_SIZE", "1000")), ttl=float(os.getenv("PROMPT_CACHE_TTL", "3600")))
+_stats = {"compilations": 0}
+
+
+def _format_preco(valor):
+    try:
+        return f"R$ {float(valor):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    except (TypeError, ValueError):
+        return ""
+
+
+def format_produtos(produtos):
+    linhas = []
+    for p in produtos:
+        linha = f"- {p.get('codigo', '')}: {p.get('produto', '')}"
+        preco = _format_preco(p.get('valor_venda'))
+        if preco:
+            linha += f" — {preco}"
+        if p.get('unidade_medida'):
+            linha += f"/{p['unidade_medida']}"
+        linhas.append(linha)
+    return "\n".join(linhas)
+
+
+# Monta o prompt de sistema e os parâmetros de geração a partir da persona
+def compile_prompt(persona):
+    if not persona:
+        partes = [DEFAULT_SYSTEM_PROMPT]
+        max_tokens = DEFAULT_MAX_TOKENS
+    else:
+        nome = persona.get('nome_agente') or 'Assistente'
+        funcao = persona.get('funcao_agente') or 'Assistente Virtual'
+        partes = [f"Você é {nome}, {funcao} que atende clientes pelo WhatsApp."]
+        if persona.get('idioma'):
+            partes.append(f"Responda sempre em {persona['idioma']}.")
+        if persona.get('tom_voz'):
+            partes.append(f"Use um tom de voz {persona['tom_voz'].lower()}.")
+        tamanho = persona.get('tamanho_resposta')
+        if tamanho:
+            partes.append(f"Dê respostas de tamanho: {tamanho.lower()}.")
+        diretrizes = [persona.get(f'diretrizes_{i}') for i in range(1, 9)]
+        diretrizes = [d.strip() for d in diretrizes if d and d.strip()]
+        if diretrizes:
+            partes.append("Siga estas diretrizes:\n" + "\n".join(f"- {d}" for d in diretrizes))
+        max_tokens = MAX_TOKENS_BY_TAMANHO.get(tamanho, DEFAULT_MAX_TOKENS)
+    return CompiledPrompt("\n\n".join(partes), max_tokens, 0.7)
+
+
+# Prompt compilado da empresa (empresa_id=None: prompt padrão)
+def get_prompt(empresa_id):
+    if empresa_id is None:
+        return CompiledPrompt(DEFAULT_SYSTEM_PROMPT, DEFAULT_MAX_TOKENS, 0.7)
+    key = (str(empresa_id), data_versions.current(empresa_id))
+    compiled = _compiled.get(key)
+    if compiled is None:
+        compiled = compile_prompt(get_persona_by_empresa(empresa_id))
+        _compiled.set(key, compiled)
+        _stats["compilations"] += 1
+        logger.info(f"Prompt da empresa_id {empresa_id} compilado ({len(compiled.system_prompt)} caracteres, max_tokens {compiled.max_tokens})")
+    return compiled
+
+
+# Produtos do catálogo relevantes para a mensagem (poucos, pra manter o prompt curto)
+def produtos_para_mensagem(empresa_id, message):
+    if empresa_id is None or PROMPT_MAX_PRODUTOS <= 0:
+        return []
+    return get_produtos_relevantes(empresa_id, message, PROMPT_MAX_PRODUTOS)
+
+
+# Versões assíncronas (workers do webhook): a compilação e a busca podem ir ao banco
+async def get_prompt_async(empresa_id):
+    return await run_db(get_prompt, empresa_id)
+
+
+async def produtos_para_mensagem_async(empresa_id, message):
+    if empresa_id is None or PROMPT_MAX_PRODUTOS <= 0:
+        return []
+    return await get_produtos_relevantes_async(empresa_id, message, PROMPT_MAX_PRODUTOS)
+
+
+# history: mensagens anteriores da conversa (app.conversations), já dentro do orçamento de tokens
+def build_messages(compiled, message, produtos=None, history=None):
+    system_prompt = compiled.system_prompt
+    if produtos:
+        system_prompt += (
+            "\n\nProdutos relacionados à pergunta (use apenas estes preços e não invente produtos):\n"
+            + format_produtos(produtos)
+        )
+    return [
+        {"role": "system", "content": system_prompt},
+        *(history or []),
+        {"role": "user", "content": message},
+    ]
+
+
+def prompt_stats():
+    data = dict(_stats)
+    data["cache"] = _compiled.stats()
+    return data
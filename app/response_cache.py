@@ -0,0 +1,162 @@
+# Cache das respostas da IA para perguntas repetidas (preço, horário, entrega...)
+# Chave: empresa + versão dos dados da empresa (app.data_versions) + mensagem normalizada.
+# Camadas: LRU com TTL no processo e, opcionalmente, SQLite compartilhado entre os workers do gunicorn.
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from app import data_versions
+from app.cache import TTLCache
+from database.local_store import connect_local
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2000"))
+CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# Camada em disco compartilhada entre processos
+SHARED = os.getenv("RESPONSE_CACHE_SHARED", "1") == "1"
+CACHE_DB = os.getenv("RESPONSE_CACHE_DB", "response_cache.sqlite3")
+# Mensagens longas raramente se repetem; não vale a pena guardar
+MAX_MESSAGE_LENGTH = 300
+# A cada tantas gravações, apaga do SQLite as respostas já expiradas (a leitura as ignora, mas
+# sem isso o arquivo só cresce)
+PURGE_EVERY = int(os.getenv("RESPONSE_CACHE_PURGE_EVERY", "500"))
+GLOBAL_SCOPE = data_versions.GLOBAL_SCOPE
+
+_memory = TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+_lock = threading.Lock()
+_stats = {"hits_memory": 0, "hits_shared": 0, "misses": 0, "stores": 0, "invalidations": 0, "purged": 0}
+_schema_ready = set()
+
+
+def _db():
+    conn = connect_local(CACHE_DB)
+    if os.getpid() not in _schema_ready:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                scope TEXT NOT NULL,
+                response TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_responses_scope ON responses (scope);
+            CREATE INDEX IF NOT EXISTS idx_responses_expires ON responses (expires_at);
+        """)
+        _schema_ready.add(os.getpid())
+    return conn
+
+
+def _count(name, value=1):
+    with _lock:
+        _stats[name] += value
+        return _stats[name]
+
+
+# Minúsculas, sem acentos, sem pontuação e com espaços simples: "Qual o preço??" == "qual o preco"
+def normalize_message(message):
+    text = unicodedata.normalize("NFKD", message.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def _key(empresa_id, message):
+    normalized = normalize_message(message)
+    if not normalized or len(normalized) > MAX_MESSAGE_LENGTH:
+        return None, None
+    scope = data_versions.scope_for(empresa_id)
+    digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+    key = f"{scope}:{data_versions.current(empresa_id)}:{data_versions.current()}:{digest}"
+    return scope, key
+
+
+def lookup(empresa_id, message):
+    if not ENABLED:
+        return None
+    try:
+        scope, key = _key(empresa_id, message)
+        if key is None:
+            return None
+        response = _memory.get(key)
+        if response is not None:
+            _count("hits_memory")
+            return response
+        if SHARED:
+            row = _db().execute(
+                "SELECT response, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+            if row:
+                _memory.set(key, row["response"], ttl=row["expires_at"] - time.time())
+                _count("hits_shared")
+                return row["response"]
+    except Exception as e:
+        logger.error(f"Erro ao consultar cache de respostas: {str(e)}")
+    _count("misses")
+    return None
+
+
+def store(empresa_id, message, response):
+    if not ENABLED or not response:
+        return
+    try:
+        scope, key = _key(empresa_id, message)
+        if key is None:
+            return
+        _memory.set(key, response)
+        if SHARED:
+            _db().execute(
+                "INSERT OR REPLACE INTO responses (key, scope, response, expires_at) VALUES (?, ?, ?, ?)",
+                (key, scope, response, time.time() + CACHE_TTL)
+            )
+        if _count("stores") % PURGE_EVERY == 0 and SHARED:
+            purge_expired()
+    except Exception as e:
+        logger.error(f"Erro ao gravar cache de respostas: {str(e)}")
+
+
+# Apaga do SQLite as respostas expiradas; retorna quantas foram apagadas
+def purge_expired():
+    deleted = _db().execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),)).rowcount
+    if deleted:
+        _count("purged", deleted)
+        logger.info(f"{deleted} resposta(s) expirada(s) apagada(s) do cache")
+    return deleted
+
+
+# Invalida as respostas de uma empresa (empresa_id=None invalida todas, ex.: catálogo global)
+# e retorna a nova versão dos dados (None em caso de erro)
+def invalidate(empresa_id=None):
+    scope = data_versions.scope_for(empresa_id)
+    version = None
+    try:
+        # A nova versão muda as chaves; apagar as entradas antigas só libera espaço
+        version = data_versions.bump(empresa_id)
+        if SHARED:
+            if scope == GLOBAL_SCOPE:
+                _db().execute("DELETE FROM responses")
+            else:
+                _db().execute("DELETE FROM responses WHERE scope = ?", (scope,))
+        if scope == GLOBAL_SCOPE:
+            _memory.clear()
+        else:
+            _memory.delete_where(lambda key: key.startswith(f"{scope}:"))
+        _count("invalidations")
+        logger.info(f"Cache de respostas invalidado para o escopo {scope}")
+    except Exception as e:
+        logger.error(f"Erro ao invalidar cache de respostas: {str(e)}")
+    return version
+
+
+def cache_stats():
+    with _lock:
+        data = dict(_stats)
+    lookups = data["hits_memory"] + data["hits_shared"] + data["misses"]
+    data["hit_ratio"] = round((data["hits_memory"] + data["hits_shared"]) / lookups, 3) if lookups else 0.0
+    data["memory"] = _memory.stats()
+    data["shared"] = SHARED
+    return data
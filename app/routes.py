@@ -1,68 +1,186 @@
-from flask import Blueprint, request, jsonify, render_template, redirect, url_for, Response, send_file
-import requests
+from flask import Blueprint, request, jsonify, render_template, redirect, url_for, Response
 import os
-from twilio.rest import Client
 from flask_login import login_required, current_user, login_user, logout_user
-from app.models import Usuario, registrar_usuario, login_usuario, login_usuario_web, cadastrar_usuario_empresa, get_persona_by_empresa, save_persona, get_empresa_id_by_usuario, save_produtos
-from database.connection import connect_db
+from app.models import Usuario, registrar_usuario, login_usuario, login_usuario_web, cadastrar_usuario_empresa, get_persona_by_empresa, save_persona, get_empresa_id_by_usuario, save_produtos, sync_produtos, get_empresa_id_by_telefone_async, get_plano_by_empresa, get_plano_by_empresa_async
+from database.connection import connect_db, run_db
+from app import auth, http_cache, idempotency, llm_scheduler, message_queue, response_cache, import_jobs, prompts, logging_config, metrics, conversations
+from app.utils import ALLOWED_IMPORT_EXTENSIONS, file_extension
+from reports import generate_reports
 import logging
-from logging.handlers import RotatingFileHandler
 # Adiciona suporte para nomes de arquivo seguros e timestamp
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 import time
 
-# Configura logging
-log_dir = os.path.join(os.path.dirname(__file__), '..', 'log')
-os.makedirs(log_dir, exist_ok=True)
-log_handler = RotatingFileHandler(
-    os.path.join(log_dir, 'system.log'),
-    maxBytes=1024*1024,
-    backupCount=5
-)
-log_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-logger.addHandler(log_handler)
 
 # Configura o blueprint da aplicação
 main = Blueprint('main', __name__)
+# Latência por rota e consultas ao banco por requisição (expostas em /metrics)
+metrics.instrument_blueprint(main)
 
-# Define a pasta de arquivos arquivados
-ARCHIVE_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'static', 'archive')
-os.makedirs(ARCHIVE_FOLDER, exist_ok=True)
-
-# Define a pasta de uploads e formatos permitidos
+# Define a pasta de uploads e formatos permitidos (criada em create_app)
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'static', 'uploads')
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 ALLOWED_EXTENSIONS = {'xlsx', 'xls'}  # Apenas .xlsx e .xls são aceitos
+# Tamanho máximo dos arquivos de produtos (lidos em streaming, então podem ser grandes)
+MAX_IMPORT_FILE_SIZE = int(os.getenv("MAX_IMPORT_FILE_SIZE", str(100 * 1024 * 1024)))
+# Acima dessa quantidade de produtos, /upload_produtos importa em segundo plano
+IMPORT_ASYNC_THRESHOLD = int(os.getenv("IMPORT_ASYNC_THRESHOLD", "5000"))
 
 # Função para validar extensões de arquivo
 def allowed_file(filename):
     # Verifica se o arquivo tem extensão e se está na lista permitida
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Função para chamar a API do DeepSeek
-def call_deepseek_api(message):
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    if not api_key:
-        logger.error("Chave de API do DeepSeek não encontrada no .env")
-        return "Erro: Chave de API do DeepSeek não encontrada no .env"
-    endpoint = "https://api.deepseek.com/chat/completions"
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    payload = {
-        "model": "deepseek-chat",
-        "messages": [{"role": "system", "content": "Você é um assistente prestativo."}, {"role": "user", "content": message}],
-        "max_tokens": 150,
-        "temperature": 0.7,
-        "stream": False
-    }
+# Resposta para login bloqueado (429 com Retry-After) ou pool de hash cheio (503)
+def auth_error_response(error):
+    if isinstance(error, auth.TooManyAttempts):
+        status, retry_after = 429, int(error.retry_after) + 1
+    else:
+        status, retry_after = 503, 1
+    response = jsonify({'success': False, 'message': str(error)})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, status
+
+# Faz a chamada ao modelo de IA (LLM_BACKEND) com o prompt compilado da empresa
+# e levanta exceção em caso de erro. Os clientes da IA (requests/aiohttp) e da Twilio são
+# importados no primeiro uso, fora da inicialização do app (ver app.prewarm_imports).
+# A chamada espera a vez da empresa no agendador (fila justa e cota de tokens do plano);
+# acima da cota, desiste na hora com llm_scheduler.QuotaExceeded
+def request_deepseek_completion(message, prompt=None, produtos=None, history=None, empresa_id=None):
+    from model import gemma_api
+    prompt = prompt or prompts.get_prompt(None)
+    messages = prompts.build_messages(prompt, message, produtos, history)
+    try:
+        with llm_scheduler.slot(empresa_id, get_plano_by_empresa(empresa_id), llm_scheduler.estimate_messages(messages), prompt.max_tokens) as slot:
+            with metrics.timed(metrics.llm_latency):
+                response = gemma_api.get_client().complete(messages, max_tokens=prompt.max_tokens, temperature=prompt.temperature)
+            slot.record(response)
+            return response
+    except gemma_api.LLMConfigError as e:
+        raise message_queue.PermanentJobError(str(e)) from e
+
+# Mesma chamada pelo cliente assíncrono (usada pelos workers da fila). TenantBusy (fila da
+# empresa cheia) propaga e a fila do webhook tenta de novo com backoff; QuotaExceeded é
+# tratada em process_webhook_message
+async def request_deepseek_completion_async(message, prompt=None, produtos=None, history=None, empresa_id=None):
+    from model import gemma_api
+    prompt = prompt or prompts.get_prompt(None)
+    messages = prompts.build_messages(prompt, message, produtos, history)
+    plano = await get_plano_by_empresa_async(empresa_id)
+    try:
+        async with llm_scheduler.slot_async(empresa_id, plano, llm_scheduler.estimate_messages(messages), prompt.max_tokens) as slot:
+            with metrics.timed(metrics.llm_latency):
+                response = await gemma_api.get_async_client().complete(messages, max_tokens=prompt.max_tokens, temperature=prompt.temperature)
+            slot.record(response)
+            return response
+    except gemma_api.LLMConfigError as e:
+        raise message_queue.PermanentJobError(str(e)) from e
+
+# Descobre a empresa dona do número que recebeu a mensagem (DEFAULT_EMPRESA_ID cobre o sandbox da Twilio)
+async def resolve_empresa_id(payload):
+    empresa_id = payload.get('empresa_id') or await get_empresa_id_by_telefone_async(payload.get('to'))
+    if empresa_id is None and os.getenv('DEFAULT_EMPRESA_ID'):
+        empresa_id = int(os.getenv('DEFAULT_EMPRESA_ID'))
+    return empresa_id
+
+# Processa uma mensagem da fila do webhook: consulta a IA e responde via Twilio (exceções fazem
+# a fila tentar de novo com backoff). É uma corrotina: enquanto espera a IA e a Twilio, o worker
+# não ocupa uma thread, e o acesso ao banco e aos SQLite locais vai para as threads de run_db
+async def process_webhook_message(payload):
+    from app import twilio_sender
+    sender = payload['sender']
+    if not os.getenv('TWILIO_ACCOUNT_SID') or not os.getenv('TWILIO_AUTH_TOKEN'):
+        raise message_queue.PermanentJobError("Credenciais da Twilio não configuradas")
+    empresa_id = await resolve_empresa_id(payload)
+    received_at = payload.get('received_at') or time.time()
+    # Numa nova tentativa do job, reaproveita a resposta já gerada e as partes já enviadas
+    progress = message_queue.job_progress()
+    response = progress.get('response')
+    cache_hit = progress.get('cache_hit', False)
+    produtos_sugeridos = progress.get('produtos_sugeridos', 0)
+    quota_exceeded = progress.get('quota_exceeded', False)
     try:
-        response = requests.post(endpoint, json=payload, headers=headers)
-        response.raise_for_status()
-        return response.json().get('choices')[0].get('message').get('content')
-    except requests.RequestException as e:
-        logger.error(f"Erro na API DeepSeek: {str(e)}")
-        return f"Erro na API: {str(e)}"
+        if response is None:
+            history = await run_db(conversations.history, empresa_id, sender)
+            # Perguntas repetidas são respondidas pelo cache, sem custo de IA; no meio de uma conversa
+            # a mesma frase ("sim", "quanto fica?") depende do contexto, então o cache só vale no início
+            response = await run_db(response_cache.lookup, empresa_id, payload['message']) if not history else None
+            cache_hit = response is not None
+            if response is None:
+                produtos = await prompts.produtos_para_mensagem_async(empresa_id, payload['message'])
+                produtos_sugeridos = len(produtos)
+                prompt = await prompts.get_prompt_async(empresa_id)
+                try:
+                    response = await request_deepseek_completion_async(payload['message'], prompt, produtos, history, empresa_id)
+                except llm_scheduler.QuotaExceeded as e:
+                    # Cota da empresa esgotada: o cliente recebe o aviso de LLM_QUOTA_MESSAGE em vez de
+                    # ficar sem resposta, e a mensagem conta como falha nos relatórios
+                    if not llm_scheduler.QUOTA_MESSAGE:
+                        raise message_queue.PermanentJobError(str(e)) from e
+                    logger.warning(f"{str(e)}; enviando aviso para {sender} (empresa_id {empresa_id})")
+                    response, quota_exceeded = llm_scheduler.QUOTA_MESSAGE, True
+                if not history and not quota_exceeded:
+                    await run_db(response_cache.store, empresa_id, payload['message'], response)
+            await run_db(
+                message_queue.save_progress, response=response, cache_hit=cache_hit,
+                produtos_sugeridos=produtos_sugeridos, quota_exceeded=quota_exceeded
+            )
+
+        async def segmento_enviado(enviados):
+            await run_db(message_queue.save_progress, segments_sent=enviados)
+
+        try:
+            # Respostas longas vão em partes; 429/5xx são tentados de novo com backoff no próprio envio.
+            # Se uma parte falhar de vez, a fila tenta de novo a partir dela, sem repetir as anteriores
+            await twilio_sender.send_whatsapp_async(
+                sender, response, skip=progress.get('segments_sent', 0), on_sent=segmento_enviado
+            )
+        except twilio_sender.PermanentSendError as e:
+            raise message_queue.PermanentJobError(str(e)) from e
+    except message_queue.PermanentJobError:
+        # Falhas temporárias são tentadas de novo pela fila; só a definitiva entra nos relatórios
+        await run_db(generate_reports.registrar_evento, empresa_id, sender, received_at, sucesso=False)
+        raise
+    if quota_exceeded:
+        await run_db(generate_reports.registrar_evento, empresa_id, sender, received_at, sucesso=False, tamanho_resposta=len(response))
+        return
+    await run_db(conversations.record_turn, empresa_id, sender, payload['message'], response)
+    await run_db(
+        generate_reports.registrar_evento, empresa_id, sender, received_at, cache_hit=cache_hit,
+        produtos_sugeridos=produtos_sugeridos, tamanho_resposta=len(response)
+    )
+    logger.info(f"Mensagem processada e enviada para {sender} (empresa_id {empresa_id})")
+
+# Valida e enfileira uma mensagem recebida da Twilio; retorna (corpo JSON, status HTTP).
+# Compartilhada pela rota do Flask e pela rota assíncrona do modo ASGI (asgi.py)
+def enfileirar_webhook(data):
+    message = data.get('Body', '')
+    sender = data.get('From', '').replace('whatsapp:', '')
+    if not message or not sender:
+        logger.error("Mensagem ou remetente ausentes na requisição /webhook")
+        return {'success': False, 'message': 'Missing message or sender'}, 400
+    # Apenas enfileira: a resposta da IA e o envio pela Twilio ficam com os workers da fila.
+    # Reenvios da Twilio (mesmo MessageSid) recebem o job da primeira entrega
+    try:
+        job_id, duplicate = idempotency.enqueue_once(data.get('MessageSid', ''), sender, {
+            'sender': sender,
+            'message': message,
+            'to': data.get('To', '').replace('whatsapp:', ''),
+            'message_sid': data.get('MessageSid', ''),
+            'request_id': logging_config.current_request_id(),
+            'received_at': time.time()
+        })
+        if duplicate:
+            logger.info(f"Reenvio da mensagem {data.get('MessageSid')} de {sender} ignorado (job {job_id})")
+            return {'success': True, 'message': 'Message already received', 'job_id': job_id, 'duplicate': True}, 200
+        logger.info(f"Mensagem de {sender} enfileirada (job {job_id})")
+        return {'success': True, 'message': 'Message queued', 'job_id': job_id}, 200
+    except Exception as e:
+        logger.error(f"Erro ao enfileirar mensagem do webhook: {str(e)}")
+        return {'success': False, 'message': f'Erro ao enfileirar mensagem: {str(e)}'}, 500
+
+message_queue.register_handler(process_webhook_message)
 
 # Rota para upload de arquivos Excel
 @main.route('/upload_excel', methods=['POST'])
@@ -104,10 +222,61 @@ def upload_excel():
             return jsonify({'success': False, 'message': 'Arquivo excede 10MB'}), 400
         file.seek(0)
         
-        # Salva o arquivo no servidor
+        # Salva o arquivo no servidor e importa os produtos em segundo plano
         file.save(file_path)
-        logger.info(f"Arquivo {filename} salvo com sucesso para usuário {current_user.email}")
-        return jsonify({'success': True, 'message': 'Arquivo enviado com sucesso!', 'filename': filename}), 200
+        job_id = import_jobs.create_job(current_user.id, empresa_id, filename, update=False)
+        import_jobs.start_import(job_id, empresa_id, file_path, file_extension(filename), update=False)
+        logger.info(f"Arquivo {filename} salvo com sucesso para usuário {current_user.email} (importação {job_id})")
+        return jsonify({'success': True, 'message': 'Arquivo enviado com sucesso!', 'filename': filename, 'job_id': job_id}), 200
+
+# Rota para importar produtos de arquivos CSV, JSON ou Excel (lidos no servidor em streaming)
+@main.route('/upload_produtos_arquivo', methods=['POST'])
+@login_required
+def upload_produtos_arquivo():
+    # O tamanho é conferido antes de ler o corpo: pelo Content-Length e, sem ele (chunked),
+    # pelo limite da requisição, que faz o Werkzeug parar de ler ao passar de MAX_IMPORT_FILE_SIZE
+    if request.content_length and request.content_length > MAX_IMPORT_FILE_SIZE:
+        logger.error(f"Arquivo muito grande na requisição /upload_produtos_arquivo para usuário {current_user.email}")
+        return jsonify({'success': False, 'message': 'Arquivo excede o tamanho máximo permitido'}), 413
+    request.max_content_length = MAX_IMPORT_FILE_SIZE
+    try:
+        file = request.files.get('file')
+    except RequestEntityTooLarge:
+        logger.error(f"Arquivo muito grande na requisição /upload_produtos_arquivo para usuário {current_user.email}")
+        return jsonify({'success': False, 'message': 'Arquivo excede o tamanho máximo permitido'}), 413
+    if file is None or file.filename == '':
+        logger.error(f"Arquivo ausente na requisição /upload_produtos_arquivo para usuário {current_user.email}")
+        return jsonify({'success': False, 'message': 'Nenhum arquivo enviado'}), 400
+    extension = file_extension(file.filename)
+    if extension not in ALLOWED_IMPORT_EXTENSIONS:
+        logger.error(f"Formato de arquivo inválido na requisição /upload_produtos_arquivo para usuário {current_user.email}")
+        return jsonify({'success': False, 'message': 'Formato inválido, use .csv, .json, .xlsx ou .xls'}), 400
+    empresa_id = get_empresa_id_by_usuario(current_user.id)
+    if not empresa_id:
+        logger.error(f"Empresa não encontrada para usuário {current_user.email}")
+        return jsonify({'success': False, 'message': 'Empresa não encontrada'}), 404
+    update = request.form.get('update', 'false').lower() in ('1', 'true', 'on')
+    # sync: reenvio do catálogo completo, grava só o que mudou (delete_missing apaga o que não veio)
+    sync = request.form.get('sync', 'false').lower() in ('1', 'true', 'on')
+    delete_missing = sync and request.form.get('delete_missing', 'false').lower() in ('1', 'true', 'on')
+    filename = secure_filename(f"{current_user.id}_{int(time.time())}_{file.filename}")
+    file_path = os.path.join(UPLOAD_FOLDER, filename)
+    # file.save copia em blocos: o arquivo não é carregado inteiro na memória
+    file.save(file_path)
+    job_id = import_jobs.create_job(current_user.id, empresa_id, filename, update, sync)
+    import_jobs.start_import(job_id, empresa_id, file_path, extension, update, sync, delete_missing)
+    logger.info(f"Importação {job_id} iniciada para usuário {current_user.email} ({filename})")
+    return jsonify({'success': True, 'message': 'Arquivo recebido, importação iniciada', 'job_id': job_id}), 202
+
+# Estado de um job de importação (linhas lidas, validadas, gravadas, com falha e vazão). No modo
+# ASGI, /jobs/<id>/events envia o mesmo estado por server-sent events (asgi.py)
+@main.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    job = import_jobs.get_job(job_id, current_user.id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Importação não encontrada'}), 404
+    return jsonify({'success': True, 'job': job}), 200
 
 @main.route('/registro', methods=['POST'])
 def registrar_usuario_route():
@@ -121,7 +290,10 @@ def registrar_usuario_route():
     if not all([nome, email, senha]):
         logger.error("Campos obrigatórios ausentes na requisição /registro")
         return jsonify({'success': False, 'message': 'Todos os campos são obrigatórios'}), 400
-    sucesso = registrar_usuario(nome, email, senha)
+    try:
+        sucesso = registrar_usuario(nome, email, senha)
+    except auth.AuthError as e:
+        return auth_error_response(e)
     if sucesso:
         logger.info(f"Usuário {email} registrado com sucesso via /registro")
         return jsonify({'success': True, 'message': 'Usuário registrado com sucesso!'}), 201
@@ -139,7 +311,11 @@ def login_usuario_route():
     if not all([email, senha]):
         logger.error("Campos obrigatórios ausentes na requisição /login")
         return jsonify({'success': False, 'message': 'Email e senha são obrigatórios'}), 400
-    usuario = login_usuario(email, senha)
+    try:
+        usuario = login_usuario(email, senha, request.remote_addr)
+    except auth.AuthError as e:
+        logger.warning(f"Login via /login recusado para {email}: {str(e)}")
+        return auth_error_response(e)
     if not usuario:
         logger.warning(f"Falha na autenticação via /login para {email}")
         return jsonify({'success': False, 'message': 'Usuário não encontrado ou senha incorreta'}), 401
@@ -159,13 +335,16 @@ def login_web():
         logger.error("E-mail ou senha ausentes na requisição /login-web")
         return jsonify({'success': False, 'message': 'E-mail e senha são obrigatórios'}), 400
     try:
-        user_obj = login_usuario_web(email, senha)
+        user_obj = login_usuario_web(email, senha, request.remote_addr)
         if user_obj:
             login_user(user_obj)
             logger.info(f"Usuário {email} autenticado com sucesso via /login-web")
             return jsonify({'success': True, 'message': 'Autenticação efetuada com sucesso!'}), 200
         logger.warning(f"Falha na autenticação via /login-web para {email}: e-mail ou senha incorretos")
         return jsonify({'success': False, 'message': 'E-mail ou senha incorretos'}), 401
+    except auth.AuthError as e:
+        logger.warning(f"Login via /login-web recusado para {email}: {str(e)}")
+        return auth_error_response(e)
     except Exception as e:
         logger.error(f"Erro ao autenticar usuário via /login-web: {str(e)}")
         return jsonify({'success': False, 'message': f'Erro ao autenticar: {str(e)}'}), 500
@@ -189,6 +368,8 @@ def cadastro():
                 return jsonify({'success': True, 'message': mensagem}), 201
             logger.error(f"Erro ao cadastrar usuário/empresa: {mensagem}")
             return jsonify({'success': False, 'message': mensagem}), 400
+        except auth.AuthError as e:
+            return auth_error_response(e)
         except Exception as e:
             logger.error(f"Erro no endpoint /cadastro: {str(e)}")
             return jsonify({'success': False, 'message': f'Erro ao cadastrar: {str(e)}'}), 500
@@ -210,7 +391,9 @@ def acoes():
         if not empresa_id:
             logger.error(f"Empresa não encontrada para usuário {current_user.email}")
             return jsonify({'success': False, 'message': 'Empresa não encontrada'}), 404
-        return render_template('acoes.html', usuario=current_user, empresa_id=empresa_id)
+        # A página depende da empresa e do usuário: reaproveitada até os dados de um dos dois mudarem
+        html, etag = http_cache.cached_page('acoes', empresa_id, lambda: render_template('acoes.html', usuario=current_user, empresa_id=empresa_id), usuario=current_user)
+        return http_cache.send_page(html, etag)
     except Exception as e:
         logger.error(f"Erro ao renderizar página de ações para usuário {current_user.email}: {str(e)}")
         return jsonify({'success': False, 'message': f'Erro ao carregar página de ações: {str(e)}'}), 500
@@ -225,24 +408,45 @@ def upload_produtos():
             return jsonify({'success': False, 'message': 'Nenhum dado fornecido'}), 400
         
         update = data.get('update', False)
+        # sync: compara com o catálogo gravado e grava só os produtos novos/alterados
+        sync = bool(data.get('sync', False))
+        delete_missing = sync and bool(data.get('delete_missing', False))
         produtos = data.get('produtos', [])
         
         if not produtos:
             logger.warning(f"Lista de produtos vazia na requisição /upload_produtos para usuário {current_user.email}")
             return jsonify({'success': False, 'message': 'Lista de produtos vazia'}), 400
+
+        # Os produtos vão para o catálogo da empresa do usuário
+        empresa_id = get_empresa_id_by_usuario(current_user.id)
+        if not empresa_id:
+            logger.error(f"Empresa não encontrada para usuário {current_user.email}")
+            return jsonify({'success': False, 'message': 'Empresa não encontrada', 'inserted': 0, 'updated': 0, 'duplicates': []}), 404
         
-        result = save_produtos(produtos, update)
+        # Listas grandes vão para um job em segundo plano, pra não estourar o timeout do worker
+        if len(produtos) > IMPORT_ASYNC_THRESHOLD:
+            job_id = import_jobs.start_import_from_list(current_user.id, empresa_id, produtos, update, UPLOAD_FOLDER, sync, delete_missing)
+            logger.info(f"Upload de {len(produtos)} produtos enviado para a importação {job_id} (usuário {current_user.email})")
+            return jsonify({'success': True, 'message': 'Importação iniciada', 'job_id': job_id, 'inserted': 0, 'updated': 0, 'duplicates': []}), 202
+
+        if sync:
+            result = sync_produtos(empresa_id, produtos, delete_missing)
+            logger.info(f"Sincronização de produtos para usuário {current_user.email}: {result.get('message')}")
+            return jsonify(result), 200 if result['success'] else 500
+
+        # Mesma regra da importação em segundo plano: sem update, grava os novos e só relata os
+        # já existentes (o usuário pode reenviar com update para atualizá-los)
+        result = save_produtos(empresa_id, produtos, update, skip_duplicates=not update)
+        if result['success'] and result['duplicates']:
+            result['message'] += f" {len(result['duplicates'])} produto(s) já existente(s) não foram alterados."
         logger.info(f"Upload de produtos processado para usuário {current_user.email}: {result.get('message')}")
-        return jsonify(result), 200 if result['success'] or result.get('duplicates') else 500
+        return jsonify(result), 200 if result['success'] else 500
     except Exception as e:
         logger.error(f"Erro ao processar upload de produtos para usuário {current_user.email}: {str(e)}")
         return jsonify({'success': False, 'message': f'Erro ao processar: {str(e)}', 'inserted': 0, 'updated': 0, 'duplicates': []}), 500
 
-@main.route('/download_json_template')
-@login_required
-def download_json_template():
-    try:
-        json_content = '''[
+# Modelos de importação: gerados uma vez em memória e servidos com ETag (304 se o navegador já tem)
+JSON_TEMPLATE = '''[
             {
                 "id": 1,
                 "codigo": "COD001",
@@ -254,11 +458,15 @@ def download_json_template():
                 "quantidade": 5
             }
         ]'''
-        file_path = os.path.join(ARCHIVE_FOLDER, 'produtos_vendas_template.json')
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(json_content)
-        logger.info(f"Arquivo JSON gerado: {file_path}")
-        return send_file(file_path, as_attachment=True, download_name='produtos_vendas_template.json')
+CSV_TEMPLATE = '''"id","codigo","produto","valor_unitario","desconto","valor_venda","unidade_medida","quantidade"
+1,"COD001","Produto Exemplo",100.00,10,90.00,"un",5'''
+
+@main.route('/download_json_template')
+@login_required
+def download_json_template():
+    try:
+        template = http_cache.artifact('produtos_vendas_template.json', lambda: JSON_TEMPLATE, 'application/json', 'produtos_vendas_template.json')
+        return http_cache.send_artifact(template)
     except Exception as e:
         logger.error(f"Erro ao gerar arquivo JSON para usuário {current_user.email}: {str(e)}")
         return jsonify({'success': False, 'message': f'Erro ao gerar template JSON: {str(e)}'}), 500
@@ -267,13 +475,8 @@ def download_json_template():
 @login_required
 def download_csv_template():
     try:
-        csv_content = '''"id","codigo","produto","valor_unitario","desconto","valor_venda","unidade_medida","quantidade"
-1,"COD001","Produto Exemplo",100.00,10,90.00,"un",5'''
-        file_path = os.path.join(ARCHIVE_FOLDER, 'produtos_vendas_template.csv')
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(csv_content)
-        logger.info(f"Arquivo CSV gerado: {file_path}")
-        return send_file(file_path, as_attachment=True, download_name='produtos_vendas_template.csv')
+        template = http_cache.artifact('produtos_vendas_template.csv', lambda: CSV_TEMPLATE, 'text/csv', 'produtos_vendas_template.csv')
+        return http_cache.send_artifact(template)
     except Exception as e:
         logger.error(f"Erro ao gerar arquivo CSV para usuário {current_user.email}: {str(e)}")
         return jsonify({'success': False, 'message': f'Erro ao gerar template CSV: {str(e)}'}), 500
@@ -297,30 +500,49 @@ def planos():
 
 @main.route('/webhook', methods=['POST'])
 def webhook():
-    data = request.form
-    message = data.get('Body', '')
-    sender = data.get('From', '').replace('whatsapp:', '')
-    if not message or not sender:
-        logger.error("Mensagem ou remetente ausentes na requisição /webhook")
-        return jsonify({'success': False, 'message': 'Missing message or sender'}), 400
-    response = call_deepseek_api(message)
-    account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-    auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-    if not account_sid or not auth_token:
-        logger.error("Credenciais da Twilio não configuradas")
-        return jsonify({'success': False, 'message': 'Credenciais da Twilio não configuradas'}), 500
+    body, status = enfileirar_webhook(request.form)
+    return jsonify(body), status
+
+@main.route('/webhook/status')
+@login_required
+def webhook_status():
+    return jsonify({'success': True, 'queue': message_queue.queue_stats(), 'cache': response_cache.cache_stats(), 'prompts': prompts.prompt_stats(), 'conversations': conversations.conversation_stats(), 'pages': http_cache.page_cache_stats(), 'dedup': idempotency.dedup_stats(), 'llm': llm_scheduler.scheduler_stats()}), 200
+
+# Métricas no formato do Prometheus. Exige "Authorization: Bearer <METRICS_TOKEN>"; sem token
+# configurado o endpoint não existe, a menos que METRICS_PUBLIC=1 (ex.: porta só da rede interna)
+@main.route('/metrics')
+def metrics_endpoint():
+    token = os.getenv('METRICS_TOKEN')
+    if not token:
+        if os.getenv('METRICS_PUBLIC', '0') != '1':
+            return Response('Not Found\n', status=404, mimetype='text/plain')
+    elif request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@main.route('/relatorios')
+@login_required
+def relatorios():
+    logger.info(f"Renderizando relatórios para usuário {current_user.email}")
+    return render_template('relatorios.html', usuario=current_user)
+
+# Dados do painel de relatórios (lidos dos agregados por hora/dia, não dos eventos brutos)
+@main.route('/relatorios/dados')
+@login_required
+def relatorios_dados():
+    empresa_id = get_empresa_id_by_usuario(current_user.id)
+    if not empresa_id:
+        return jsonify({'success': False, 'message': 'Empresa não encontrada para o usuário'}), 404
+    granularidade = request.args.get('granularidade', 'day')
     try:
-        client = Client(account_sid, auth_token)
-        client.messages.create(
-            from_='whatsapp:+14155238886',
-            body=response,
-            to=f'whatsapp:{sender}'
-        )
-        logger.info(f"Mensagem processada e enviada para {sender}")
-        return jsonify({'success': True, 'message': 'Message processed'}), 200
+        dias = min(max(int(request.args.get('dias', 30)), 1), 366)
+        relatorio = generate_reports.get_relatorio(empresa_id, granularidade, dias)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
-        logger.error(f"Erro ao enviar mensagem via Twilio: {str(e)}")
-        return jsonify({'success': False, 'message': f'Erro ao enviar mensagem: {str(e)}'}), 500
+        logger.error(f"Erro ao gerar relatório para empresa_id {empresa_id}: {str(e)}")
+        return jsonify({'success': False, 'message': 'Erro ao gerar relatório'}), 500
+    return jsonify({'success': True, **relatorio}), 200
 
 @main.route('/treinar_ia')
 @login_required
@@ -336,13 +558,13 @@ def persona_ia():
         if not empresa_id:
             logger.error(f"Empresa não encontrada para usuário {current_user.id}")
             return jsonify({'success': False, 'message': 'Empresa não encontrada'}), 404
-        persona = get_persona_by_empresa(empresa_id)
-        response = Response(
-            render_template('persona_ia.html', persona=persona, usuario=current_user, empresa_id=empresa_id)
-        )
-        response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+        # Renderizada de novo só quando a persona ou os produtos mudam (nova versão dos dados);
+        # o navegador revalida a cada acesso e recebe 304 se nada mudou
+        html, etag = http_cache.cached_page('persona_ia', empresa_id, lambda: render_template(
+            'persona_ia.html', persona=get_persona_by_empresa(empresa_id), usuario=current_user, empresa_id=empresa_id
+        ), usuario=current_user)
         logger.info(f"Renderizando página de persona para usuário {current_user.email}")
-        return response
+        return http_cache.send_page(html, etag)
     except Exception as e:
         logger.error(f"Erro no endpoint /persona_ia: {str(e)}")
         return jsonify({'success': False, 'message': f'Erro ao carregar persona: {str(e)}'}), 500
@@ -0,0 +1,391 @@
+# Envio das respostas pelo WhatsApp (Twilio): um cliente compartilhado por processo, com pool de
+# conexões HTTP; limite de envios por número remetente (token bucket); novas tentativas com
+# backoff e jitter em 429/5xx; e divisão das respostas longas em partes do tamanho aceito.
+# O envio assíncrono (send_whatsapp_async) usa o cliente aiohttp da Twilio, um por event loop.
+# FakeTwilioServer imita a API de mensagens para testes e benchmarks (TWILIO_API_URL).
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+import weakref
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.async_http_client import AsyncTwilioHttpClient
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+from app import metrics
+from model.gemma_api import FakeHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FROM = os.getenv("TWILIO_WHATSAPP_FROM", "whatsapp:+14155238886")
+# Tamanho máximo de cada mensagem enviada (limite do corpo de mensagem da Twilio)
+MAX_SEGMENT_CHARS = int(os.getenv("TWILIO_MAX_SEGMENT_CHARS", "1600"))
+# Envios por segundo por número remetente (por processo) e rajada permitida
+RATE_PER_SECOND = float(os.getenv("TWILIO_RATE_PER_SECOND", "10"))
+RATE_BURST = int(os.getenv("TWILIO_RATE_BURST", "20"))
+# Tempo máximo esperando uma vaga no limite antes de desistir (a fila tenta de novo depois)
+RATE_WAIT_TIMEOUT = float(os.getenv("TWILIO_RATE_WAIT_TIMEOUT", "30"))
+MAX_RETRIES = int(os.getenv("TWILIO_MAX_RETRIES", "4"))
+RETRY_BASE = float(os.getenv("TWILIO_RETRY_BASE", "0.5"))
+RETRY_MAX = float(os.getenv("TWILIO_RETRY_MAX", "10"))
+TIMEOUT = float(os.getenv("TWILIO_TIMEOUT", "15"))
+POOL_SIZE = int(os.getenv("TWILIO_POOL_SIZE", "10"))
+
+twilio_sends = metrics.Counter("twilio_messages_total", "Mensagens enviadas pela Twilio", ("outcome",))
+twilio_retries = metrics.Counter("twilio_retries_total", "Novas tentativas de envio pela Twilio", ("reason",))
+twilio_rate_wait = metrics.Histogram("twilio_rate_limit_wait_seconds", "Espera no limite de envios por número")
+
+
+class SendError(Exception):
+    pass
+
+
+# Erro que não adianta tentar de novo (credenciais, número inválido etc.)
+class PermanentSendError(SendError):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Tenta pegar um envio; retorna 0 se conseguiu ou quanto falta esperar pelo próximo
+    def _take(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    # Reserva um envio; retorna quanto tempo esperou (levanta SendError se passar de timeout)
+    def acquire(self, timeout=RATE_WAIT_TIMEOUT):
+        waited = 0.0
+        while self.rate > 0:
+            delay = self._take()
+            if not delay:
+                break
+            if waited + delay > timeout:
+                raise SendError("Limite de envios da Twilio atingido")
+            time.sleep(delay)
+            waited += delay
+        return waited
+
+    async def acquire_async(self, timeout=RATE_WAIT_TIMEOUT):
+        waited = 0.0
+        while self.rate > 0:
+            delay = self._take()
+            if not delay:
+                break
+            if waited + delay > timeout:
+                raise SendError("Limite de envios da Twilio atingido")
+            await asyncio.sleep(delay)
+            waited += delay
+        return waited
+
+
+# Cliente HTTP da Twilio com pool de conexões; TWILIO_API_URL redireciona as chamadas
+# (servidor falso nos testes e benchmarks)
+class PooledHttpClient(TwilioHttpClient):
+    def __init__(self, base_url=None, pool_size=POOL_SIZE, timeout=TIMEOUT):
+        super().__init__(pool_connections=True, timeout=timeout)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self._local = threading.local()
+
+    def request(self, method, url, *args, **kwargs):
+        if self.base_url:
+            url = url.replace("https://api.twilio.com", self.base_url, 1)
+        response = super().request(method, url, *args, **kwargs)
+        # Guarda o Retry-After da última resposta desta thread (a exceção da Twilio não o expõe)
+        self._local.retry_after = response.headers.get("Retry-After") if response.status_code == 429 else None
+        return response
+
+    def last_retry_after(self):
+        return _parse_retry_after(getattr(self._local, "retry_after", None))
+
+
+# Retry-After da última resposta da tarefa assíncrona atual
+_async_retry_after = contextvars.ContextVar("twilio_retry_after", default=None)
+
+
+# Versão assíncrona (aiohttp): precisa ser criada dentro do event loop que vai usá-la
+class AsyncPooledHttpClient(AsyncTwilioHttpClient):
+    def __init__(self, base_url=None, timeout=TIMEOUT):
+        super().__init__(pool_connections=True, timeout=timeout)
+        self.base_url = base_url.rstrip("/") if base_url else None
+
+    async def request(self, method, url, *args, **kwargs):
+        if self.base_url:
+            url = url.replace("https://api.twilio.com", self.base_url, 1)
+        response = await super().request(method, url, *args, **kwargs)
+        _async_retry_after.set(response.headers.get("Retry-After") if response.status_code == 429 else None)
+        return response
+
+    def last_retry_after(self):
+        return _parse_retry_after(_async_retry_after.get())
+
+
+def _parse_retry_after(value):
+    try:
+        return float(value or 0)
+    except ValueError:
+        return 0.0
+
+
+# Divide o texto em partes de até limit caracteres, preferindo quebrar em parágrafo, linha, frase ou palavra
+def split_message(text, limit=MAX_SEGMENT_CHARS):
+    text = text.strip()
+    segments = []
+    while len(text) > limit:
+        window = text[:limit]
+        cut = -1
+        for separator in ("\n\n", "\n", ". ", " "):
+            cut = window.rfind(separator)
+            if cut > limit // 2:
+                cut += len(separator)
+                break
+        if cut <= limit // 2:
+            cut = limit
+        segments.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        segments.append(text)
+    return segments
+
+
+def _retryable(error):
+    if isinstance(error, TwilioRestException):
+        return error.status == 429 or error.status >= 500
+    # Falhas de rede do envio assíncrono (conexão recusada, timeout) também são passageiras
+    return isinstance(error, (requests.RequestException, aiohttp.ClientError, asyncio.TimeoutError))
+
+
+def _backoff(attempt):
+    # "Full jitter": espera aleatória até o teto exponencial, pra não sincronizar as novas tentativas
+    return random.uniform(0, min(RETRY_MAX, RETRY_BASE * (2 ** attempt)))
+
+
+class TwilioSender:
+    def __init__(self, account_sid, auth_token, base_url=None):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.base_url = base_url
+        self.http_client = PooledHttpClient(base_url)
+        self.client = Client(account_sid, auth_token, http_client=self.http_client)
+        self.pid = os.getpid()
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+        # Cliente assíncrono por event loop: (http_client, client)
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _bucket(self, from_):
+        bucket = self._buckets.get(from_)
+        if bucket is None:
+            with self._buckets_lock:
+                bucket = self._buckets.setdefault(from_, TokenBucket(RATE_PER_SECOND, RATE_BURST))
+        return bucket
+
+    # Decide o que fazer com uma falha de envio: levanta o erro final ou retorna a espera até a nova tentativa
+    def _retry_delay(self, error, attempt, to, http_client):
+        if not _retryable(error):
+            twilio_sends.inc(outcome="rejected")
+            raise PermanentSendError(f"Twilio recusou a mensagem: {str(error)}") from error
+        if attempt == MAX_RETRIES:
+            twilio_sends.inc(outcome="failed")
+            raise SendError(f"Falha ao enviar pela Twilio após {attempt + 1} tentativas: {str(error)}") from error
+        reason = str(error.status) if isinstance(error, TwilioRestException) else "connection"
+        twilio_retries.inc(reason=reason)
+        delay = max(_backoff(attempt), http_client.last_retry_after())
+        logger.warning(f"Envio para {to} falhou ({reason}), nova tentativa em {delay:.2f}s")
+        return delay
+
+    def _send_segment(self, from_, to, body):
+        for attempt in range(MAX_RETRIES + 1):
+            twilio_rate_wait.observe(self._bucket(from_).acquire())
+            try:
+                with metrics.timed(metrics.twilio_latency):
+                    message = self.client.messages.create(from_=from_, body=body, to=to)
+                twilio_sends.inc(outcome="ok")
+                return message.sid
+            except Exception as e:
+                time.sleep(self._retry_delay(e, attempt, to, self.http_client))
+
+    # Envia o texto (em partes, se preciso) e retorna os SIDs das mensagens criadas
+    # skip: partes já enviadas numa tentativa anterior; on_sent(n) é chamado depois de cada
+    # parte com o total enviado, para quem precisa retomar o envio do ponto em que parou
+    def send(self, to, body, from_=DEFAULT_FROM, skip=0, on_sent=None):
+        sids = []
+        for index, segment in enumerate(split_message(body)):
+            if index < skip:
+                continue
+            sids.append(self._send_segment(from_, to, segment))
+            if on_sent is not None:
+                on_sent(index + 1)
+        return sids
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        pair = self._async_clients.get(loop)
+        if pair is None:
+            http_client = AsyncPooledHttpClient(self.base_url)
+            pair = self._async_clients[loop] = (http_client, Client(self.account_sid, self.auth_token, http_client=http_client))
+        return pair
+
+    # Fecha a sessão aiohttp do event loop atual; o próximo envio abre outra
+    async def close_async(self):
+        pair = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if pair is not None:
+            await pair[0].close()
+
+    async def _send_segment_async(self, from_, to, body):
+        http_client, client = self._async_client()
+        for attempt in range(MAX_RETRIES + 1):
+            twilio_rate_wait.observe(await self._bucket(from_).acquire_async())
+            try:
+                with metrics.timed(metrics.twilio_latency):
+                    message = await client.messages.create_async(from_=from_, body=body, to=to)
+                twilio_sends.inc(outcome="ok")
+                return message.sid
+            except Exception as e:
+                try:
+                    delay = self._retry_delay(e, attempt, to, http_client)
+                except SendError:
+                    # Desistiu: não deixa a sessão (e as conexões dela) aberta
+                    await self.close_async()
+                    raise
+                await asyncio.sleep(delay)
+
+    async def send_async(self, to, body, from_=DEFAULT_FROM, skip=0, on_sent=None):
+        sids = []
+        for index, segment in enumerate(split_message(body)):
+            if index < skip:
+                continue
+            sids.append(await self._send_segment_async(from_, to, segment))
+            if on_sent is not None:
+                await on_sent(index + 1)
+        return sids
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+# Sender compartilhado do processo (recriado após fork ou se as credenciais mudarem)
+def get_sender():
+    global _sender
+    account_sid = os.getenv("TWILIO_ACCOUNT_SID")
+    auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+    if not account_sid or not auth_token:
+        raise PermanentSendError("Credenciais da Twilio não configuradas")
+    sender = _sender
+    if sender is None or sender.pid != os.getpid() or sender.account_sid != account_sid:
+        with _sender_lock:
+            sender = _sender
+            if sender is None or sender.pid != os.getpid() or sender.account_sid != account_sid:
+                sender = _sender = TwilioSender(account_sid, auth_token, os.getenv("TWILIO_API_URL"))
+    return sender
+
+
+def send_whatsapp(to, body, from_=DEFAULT_FROM, skip=0, on_sent=None):
+    if not to.startswith("whatsapp:"):
+        to = f"whatsapp:{to}"
+    return get_sender().send(to, body, from_, skip, on_sent)
+
+
+async def send_whatsapp_async(to, body, from_=DEFAULT_FROM, skip=0, on_sent=None):
+    if not to.startswith("whatsapp:"):
+        to = f"whatsapp:{to}"
+    return await get_sender().send_async(to, body, from_, skip, on_sent)
+
+
+# Servidor falso da API de mensagens da Twilio, com latência e taxa de erros configuráveis
+class FakeTwilioServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, error_status=429, retry_after=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.messages = []
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+                form = {key: values[-1] for key, values in parse_qs(body).items()}
+                time.sleep(server.latency)
+                with server._lock:
+                    fail = server._random.random() < server.error_rate
+                    if fail:
+                        server.errors += 1
+                    else:
+                        server.messages.append(form)
+                if fail:
+                    status = server.error_status
+                    data = {"code": 20429 if status == 429 else 20500, "message": "Erro simulado", "status": status}
+                else:
+                    status = 201
+                    data = {
+                        "sid": "SM" + uuid.uuid4().hex,
+                        "status": "queued",
+                        "from": form.get("From"),
+                        "to": form.get("To"),
+                        "body": form.get("Body"),
+                        "num_segments": "1",
+                    }
+                raw = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                if fail and server.retry_after is not None:
+                    self.send_header("Retry-After", str(server.retry_after))
+                self.end_headers()
+                self.wfile.write(raw)
+
+        self.httpd = FakeHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def sent(self):
+        with self._lock:
+            return len(self.messages)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,214 @@
+# Funções auxiliares de leitura de arquivos de produtos (CSV, JSON e Excel) em streaming:
+# as linhas são lidas uma a uma e entregues em lotes de tamanho limitado, então a memória
+# usada não depende do tamanho do arquivo
+import codecs
+import csv
+import io
+import json
+import os
+
+# Linhas por lote entregue à importação de produtos
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "2000"))
+READ_BLOCK_SIZE = 64 * 1024
+ALLOWED_IMPORT_EXTENSIONS = {'csv', 'json', 'xlsx', 'xls'}
+
+# Nomes de coluna aceitos para cada campo (mesmos apelidos que a página de ações aceitava)
+FIELD_ALIASES = {
+    'codigo': ('codigo', 'Codigo', 'código', 'Código'),
+    'produto': ('produto', 'Produto'),
+    'valor_unitario': ('valor_unitario', 'Valor Unitário', 'valor Uniário', 'Valor Unitario'),
+    'desconto': ('desconto', 'Desconto'),
+    'valor_venda': ('valor_venda', 'Valor Venda'),
+    'unidade_medida': ('unidade_medida', 'Unidade Medida'),
+    'quantidade': ('quantidade', 'Quantidade'),
+}
+NUMERIC_FIELDS = ('valor_unitario', 'desconto', 'valor_venda', 'quantidade')
+
+
+class IngestError(Exception):
+    pass
+
+
+def file_extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+# Converte uma linha lida do arquivo para os campos usados por save_produtos
+def normalize_produto(row):
+    produto = {}
+    for field, aliases in FIELD_ALIASES.items():
+        for alias in aliases:
+            value = row.get(alias)
+            if value is not None and value != '':
+                produto[field] = value.strip() if isinstance(value, str) else value
+                break
+    if isinstance(produto.get('codigo'), (int, float)):
+        produto['codigo'] = str(produto['codigo'])
+    # Números no formato brasileiro ("1.234,56") viram "1234.56"
+    for field in NUMERIC_FIELDS:
+        value = produto.get(field)
+        if isinstance(value, str) and ',' in value:
+            produto[field] = value.replace('.', '').replace(',', '.')
+    return produto
+
+
+# Leitor que conta os bytes já lidos (usado pra calcular o progresso real)
+class CountingReader(io.RawIOBase):
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.raw.read(len(buffer))
+        self.bytes_read += len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def iter_csv_rows(stream):
+    text = io.TextIOWrapper(io.BufferedReader(stream, READ_BLOCK_SIZE), encoding='utf-8-sig', newline='')
+    sample = text.readline()
+    if not sample.strip():
+        return
+    # Planilhas exportadas em pt-BR costumam usar ';' como separador
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    header = next(csv.reader([sample], dialect))
+    for row in csv.DictReader(text, fieldnames=[h.strip() for h in header], dialect=dialect):
+        if any(v not in (None, '') for v in row.values()):
+            yield row
+
+
+# Lê um array JSON ([{...}, {...}]) objeto por objeto, sem carregar o arquivo inteiro
+def iter_json_rows(stream):
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    pos = 0
+    started = False
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        block = stream.read(READ_BLOCK_SIZE)
+        if not block:
+            eof = True
+            buffer = buffer[pos:] + text_decoder.decode(b'', final=True)
+        else:
+            buffer = buffer[pos:] + text_decoder.decode(block)
+        pos = 0
+
+    while True:
+        while pos < len(buffer) and (buffer[pos].isspace() or (started and buffer[pos] == ',')):
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise IngestError('JSON incompleto: array não foi fechado.')
+            fill()
+            continue
+        if not started:
+            if buffer[pos] != '[':
+                raise IngestError('JSON deve conter um array de objetos.')
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise IngestError('JSON inválido.')
+            fill()
+            continue
+        pos = end
+        if not isinstance(item, dict):
+            raise IngestError('JSON deve conter um array de objetos.')
+        yield item
+
+
+def iter_excel_rows(path, extension='xlsx'):
+    if extension == 'xls':
+        # Formato antigo: sem leitura em streaming, depende do xlrd
+        try:
+            import pandas as pd
+            df = pd.read_excel(path, dtype=object)
+        except ImportError as e:
+            raise IngestError(f'Leitura de arquivos .xls indisponível: {str(e)}')
+        for row in df.to_dict('records'):
+            yield {k: (None if pd.isna(v) else v) for k, v in row.items()}
+        return
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise IngestError('Leitura de arquivos .xlsx indisponível: instale o openpyxl')
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header:
+            return
+        header = [str(h).strip() if h is not None else '' for h in header]
+        for values in rows:
+            if any(v not in (None, '') for v in values):
+                yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+# Agrupa as linhas em lotes de até size itens
+def iter_chunks(rows, size=INGEST_CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Abre o arquivo salvo e retorna (gerador de produtos normalizados, função de progresso 0..1)
+def open_produtos_file(path, extension):
+    if extension not in ALLOWED_IMPORT_EXTENSIONS:
+        raise IngestError('Formato inválido, use .csv, .json, .xlsx ou .xls')
+    total = os.path.getsize(path) or 1
+    if extension in ('xlsx', 'xls'):
+        state = {'rows': 0, 'total': None}
+        if extension == 'xlsx':
+            try:
+                from openpyxl import load_workbook
+                workbook = load_workbook(path, read_only=True)
+                state['total'] = max((workbook.active.max_row or 1) - 1, 1)
+                workbook.close()
+            except Exception:
+                state['total'] = None
+
+        def rows():
+            for row in iter_excel_rows(path, extension):
+                state['rows'] += 1
+                yield normalize_produto(row)
+
+        def progress():
+            return min(state['rows'] / state['total'], 1.0) if state['total'] else 0.0
+        return rows(), progress
+
+    handle = open(path, 'rb')
+    reader = CountingReader(handle)
+    source = iter_csv_rows(reader) if extension == 'csv' else iter_json_rows(reader)
+
+    def rows():
+        try:
+            for row in source:
+                yield normalize_produto(row)
+        finally:
+            handle.close()
+
+    def progress():
+        return min(reader.bytes_read / total, 1.0)
+    return rows(), progress
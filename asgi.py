@@ -0,0 +1,144 @@
+# Entrada ASGI (modo assíncrono). O /webhook e o stream de progresso das importações
+# (/jobs/<id>/events) são atendidos direto no event loop do servidor; as demais rotas são do
+# Flask, executadas num pool de threads (a2wsgi). As respostas da IA e
+# os envios pela Twilio ficam com os workers assíncronos da fila (app.message_queue).
+#
+# Uso: uvicorn asgi:app --host 0.0.0.0 --port 8000
+#      gunicorn -k uvicorn.workers.UvicornWorker -w 4 asgi:app   (vários processos)
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from urllib.parse import parse_qsl
+from a2wsgi import WSGIMiddleware
+from flask_login import current_user
+from werkzeug.test import EnvironBuilder
+from app import create_app, import_jobs, logging_config, metrics, routes
+
+logger = logging.getLogger(__name__)
+
+# Threads que atendem as rotas do Flask (páginas, uploads, login)
+WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "32"))
+# Tamanho máximo do corpo aceito no /webhook (a Twilio envia poucos KB)
+WEBHOOK_MAX_BODY = int(os.getenv("ASGI_WEBHOOK_MAX_BODY", str(64 * 1024)))
+
+_JOB_EVENTS_PATH = re.compile(r"^/jobs/([0-9a-f]{32})/events$")
+
+
+async def _read_body(receive, limit):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body.extend(message.get("body", b""))
+        if len(body) > limit:
+            return None
+        if not message.get("more_body"):
+            return bytes(body)
+
+
+async def _send_json(send, data, status, headers):
+    raw = json.dumps(data).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(raw)).encode())] + headers,
+    })
+    await send({"type": "http.response.body", "body": raw})
+
+
+# Rota assíncrona do /webhook: só enfileira, com a mesma validação e resposta da rota do Flask
+async def webhook(scope, receive, send):
+    start = time.perf_counter()
+    request_headers = dict(scope.get("headers") or [])
+    request_id = request_headers.get(b"x-request-id", b"").decode("latin1") or uuid.uuid4().hex
+    token = logging_config.set_request_id(request_id)
+    try:
+        body = await _read_body(receive, WEBHOOK_MAX_BODY)
+        if body is None:
+            data, status = {'success': False, 'message': 'Corpo da requisição inválido'}, 400
+        else:
+            form = dict(parse_qsl(body.decode("utf-8", "replace"), keep_blank_values=True))
+            # A fila é um SQLite local: a gravação vai para uma thread, fora do event loop
+            data, status = await asyncio.to_thread(routes.enfileirar_webhook, form)
+        elapsed = time.perf_counter() - start
+        metrics.http_requests.inc(endpoint="main.webhook", method="POST", status=status)
+        metrics.http_latency.observe(elapsed, endpoint="main.webhook", method="POST")
+        await _send_json(send, data, status, [
+            (b"x-request-id", request_id.encode("latin1")),
+            (b"server-timing", f"app;dur={elapsed * 1000:.1f}".encode()),
+        ])
+    finally:
+        logging_config.reset_request_id(token)
+
+
+class ZenithASGI:
+    def __init__(self, flask_app, wsgi_threads=WSGI_THREADS):
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app, workers=wsgi_threads)
+        # Os templates só abrem o stream de progresso quando ele existe (aqui, não no WSGI)
+        flask_app.config["JOB_EVENTS"] = True
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http" and scope["path"] == "/webhook" and scope["method"] == "POST":
+            await webhook(scope, receive, send)
+        elif scope["type"] == "http" and scope["method"] == "GET" and _JOB_EVENTS_PATH.match(scope["path"]):
+            await self._job_events(scope, receive, send, _JOB_EVENTS_PATH.match(scope["path"]).group(1))
+        else:
+            await self.wsgi(scope, receive, send)
+
+    # Usuário logado, lido da sessão do Flask (cookie) como nas rotas com @login_required
+    def _user_id(self, scope):
+        headers = [(name.decode("latin1"), value.decode("latin1")) for name, value in scope.get("headers") or []]
+        environ = EnvironBuilder(path=scope["path"], headers=headers).get_environ()
+        with self.flask_app.request_context(environ):
+            return current_user.get_id() if current_user.is_authenticated else None
+
+    # Progresso de uma importação por server-sent events: espera no event loop, sem ocupar thread
+    async def _job_events(self, scope, receive, send, job_id):
+        user_id = await asyncio.to_thread(self._user_id, scope)
+        if user_id is None:
+            await _send_json(send, {'success': False, 'message': 'Não autenticado'}, 401, [])
+            return
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")],
+        })
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            async for event in import_jobs.job_events(job_id, user_id):
+                if disconnected.is_set():
+                    return
+                await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            watcher.cancel()
+
+    # O app já é iniciado na importação (create_app); aqui só confirma o início e o fim
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                logger.info(f"Servidor ASGI iniciado no processo {os.getpid()}")
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+flask_app = create_app()
+app = ZenithASGI(flask_app)
@@ -0,0 +1,382 @@
+# Benchmark dos caminhos críticos (login, load_user, save_produtos e /webhook) contra um banco
+# MySQL/MariaDB local, com servidores falsos no lugar da IA e da Twilio.
+#
+# Uso (a partir da raiz do projeto, com DB_HOST/DB_USER/DB_PASSWORD/DB_NAME de um banco de testes):
+#   python -m benchmarks.run_benchmarks --companies 20 --products 20000 --concurrency 16 \
+#       --requests 2000 --llm-latency 0.3 --twilio-latency 0.1 --output bench.json
+#   python -m benchmarks.run_benchmarks ... --compare bench.json   (compara com uma execução anterior)
+#   python -m benchmarks.run_benchmarks --server asgi --scenarios conversations --conversations 1000 \
+#       --webhook-workers 500 --llm-latency 2   (conversas simultâneas que um processo sustenta)
+#
+# O relatório (JSON) traz, por cenário: vazão, latências p50/p95/p99 e consultas ao banco por requisição.
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+SCENARIOS = ("login", "load_user", "save_produtos", "webhook", "conversations")
+_QUERIES_RE = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(samples, elapsed):
+    latencies = [s["latency"] for s in samples]
+    queries = [s["queries"] for s in samples if s["queries"] is not None]
+    errors = sum(1 for s in samples if s["status"] >= 400 or s["status"] == 0)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "duration_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2) if latencies else 0.0,
+        },
+        "queries_per_request": {
+            "mean": round(sum(queries) / len(queries), 2) if queries else None,
+            "max": max(queries) if queries else None,
+        },
+    }
+
+
+# Executa total chamadas de request_fn(session, i) com concurrency threads, cada uma com sua sessão
+def drive(total, concurrency, request_fn, setup_session=None):
+    counter = itertools.count()
+    samples = []
+    lock = threading.Lock()
+
+    def worker():
+        session = requests.Session()
+        if setup_session:
+            setup_session(session)
+        local = []
+        while True:
+            i = next(counter)
+            if i >= total:
+                break
+            start = time.perf_counter()
+            try:
+                response = request_fn(session, i)
+                status = response.status_code
+                match = _QUERIES_RE.search(response.headers.get("Server-Timing", ""))
+                queries = int(match.group(1)) if match else None
+            except requests.RequestException:
+                status, queries = 0, None
+            local.append({"latency": time.perf_counter() - start, "status": status, "queries": queries})
+        with lock:
+            samples.extend(local)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return summarize(samples, time.perf_counter() - start)
+
+
+def _login(base_url, email, password):
+    def setup(session):
+        response = session.post(f"{base_url}/login-web", data={"email": email, "senha": password})
+        response.raise_for_status()
+    return setup
+
+
+# Espera os workers da fila esvaziarem a fila (ou o tempo limite)
+def _wait_drain(timeout):
+    from app import message_queue
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = message_queue.queue_stats()
+        if stats["depth"] == 0 and stats["processing"] == 0:
+            break
+        time.sleep(0.1)
+    return message_queue.queue_stats()
+
+
+def run_scenarios(args, base_url, seeded, llm, twilio):
+    from benchmarks.seed import BENCH_PASSWORD, gerar_produtos
+
+    empresas = seeded["empresas"]
+    rng = random.Random(args.seed)
+    results = {}
+
+    def empresa(i):
+        return empresas[i % len(empresas)]
+
+    if "login" in args.scenarios:
+        results["login"] = drive(args.requests, args.concurrency, lambda s, i: s.post(
+            f"{base_url}/login", json={"email": empresa(i)["email"], "senha": BENCH_PASSWORD}
+        ))
+
+    if "load_user" in args.scenarios:
+        # Página autenticada simples: o custo é o load_user da sessão mais a renderização
+        results["load_user"] = drive(
+            args.requests, args.concurrency, lambda s, i: s.get(f"{base_url}/treinar_ia"),
+            _login(base_url, empresas[0]["email"], BENCH_PASSWORD)
+        )
+
+    if "save_produtos" in args.scenarios:
+        def upload(session, i):
+            inicio = rng.randrange(max(seeded["produtos"] - args.batch, 1))
+            produtos = list(gerar_produtos(inicio, args.batch, random.Random(i)))
+            return session.post(f"{base_url}/upload_produtos", json={"update": True, "produtos": produtos})
+        results["save_produtos"] = drive(
+            max(args.requests // 20, 1), args.concurrency, upload,
+            _login(base_url, empresas[0]["email"], BENCH_PASSWORD)
+        )
+
+    if "webhook" in args.scenarios:
+        perguntas = ("Quanto custa o café pilão?", "Vocês têm arroz camil 5kg?", "Qual o preço da cerveja?", "Tem detergente ype?")
+        sent_before = twilio.sent
+
+        def webhook(session, i):
+            return session.post(f"{base_url}/webhook", data={
+                "Body": f"{rng.choice(perguntas)} #{i % args.distinct_messages}",
+                "From": f"whatsapp:+55219{i % args.senders:08d}",
+                "To": f"whatsapp:{empresa(i)['telefone']}",
+                "MessageSid": "SM" + uuid.uuid4().hex,
+            })
+
+        start = time.perf_counter()
+        result = drive(args.requests, args.concurrency, webhook)
+        # Ponta a ponta: espera os workers da fila consultarem a IA e enviarem pela Twilio
+        stats = _wait_drain(args.drain_timeout)
+        drained = time.perf_counter() - start
+        delivered = twilio.sent - sent_before
+        result["end_to_end"] = {
+            "delivered": delivered,
+            "pending": stats["depth"] + stats["processing"],
+            "failed": stats["failed_total"],
+            "duration_seconds": round(drained, 3),
+            "throughput_rps": round(delivered / drained, 2) if drained > 0 else 0.0,
+            "queue_latency_p50_ms": round(stats["latency_p50_seconds"] * 1000, 2),
+            "queue_latency_p95_ms": round(stats["latency_p95_seconds"] * 1000, 2),
+        }
+        results["webhook"] = result
+
+    if "conversations" in args.scenarios:
+        # Conversas simultâneas: cada remetente manda uma pergunta inédita (sem cache), então todas
+        # esperam a IA; o pico de chamadas em andamento na IA falsa é o que o processo sustenta
+        lote = uuid.uuid4().hex[:8]
+        sent_before = twilio.sent
+        llm.peak_in_flight = 0
+        start = time.perf_counter()
+        result = drive(args.conversations, args.concurrency, lambda s, i: s.post(f"{base_url}/webhook", data={
+            "Body": f"Quero saber do pedido {lote}-{i}",
+            "From": f"whatsapp:+55319{i:08d}",
+            "To": f"whatsapp:{empresa(i)['telefone']}",
+            "MessageSid": "SM" + uuid.uuid4().hex,
+        }))
+        stats = _wait_drain(args.drain_timeout)
+        drained = time.perf_counter() - start
+        delivered = twilio.sent - sent_before
+        result["end_to_end"] = {
+            "delivered": delivered,
+            "pending": stats["depth"] + stats["processing"],
+            "failed": stats["failed_total"],
+            "duration_seconds": round(drained, 3),
+            "throughput_rps": round(delivered / drained, 2) if drained > 0 else 0.0,
+            "peak_concurrent_llm_calls": llm.peak_in_flight,
+            # Conversas em paralelo na média: tempo total de espera pela IA / duração
+            "mean_concurrency": round(delivered * args.llm_latency / drained, 1) if drained > 0 else 0.0,
+        }
+        results["conversations"] = result
+    return results
+
+
+class _UvicornServer:
+    def __init__(self, app):
+        import uvicorn
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("Falha ao iniciar o uvicorn")
+            time.sleep(0.05)
+
+    def shutdown(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+# Sobe o app numa thread: servidor WSGI com threads (werkzeug) ou ASGI (uvicorn + asgi.py)
+def start_server(kind):
+    if kind == "asgi":
+        import asgi
+        server = _UvicornServer(asgi.app)
+        server.start()
+        return server, f"http://127.0.0.1:{server.port}"
+    from werkzeug.serving import make_server
+    from app import create_app
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    linhas = []
+    for name, result in report["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        for label, new_value, old_value in (
+            ("throughput_rps", result["throughput_rps"], old["throughput_rps"]),
+            ("p95_ms", result["latency_ms"]["p95"], old["latency_ms"]["p95"]),
+            ("p99_ms", result["latency_ms"]["p99"], old["latency_ms"]["p99"]),
+        ):
+            delta = (new_value - old_value) / old_value * 100 if old_value else 0.0
+            linhas.append(f"{name:<14} {label:<15} {old_value:>10} -> {new_value:>10} ({delta:+.1f}%)")
+    return "\n".join(linhas)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dos caminhos críticos da Zenith IA")
+    parser.add_argument("--companies", type=int, default=10)
+    parser.add_argument("--products", type=int, default=10000, help="produtos no catálogo de cada empresa")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=1000, help="requisições por cenário (save_produtos usa 1/20)")
+    parser.add_argument("--batch", type=int, default=500, help="produtos por chamada de /upload_produtos")
+    parser.add_argument("--senders", type=int, default=200, help="remetentes distintos no /webhook")
+    parser.add_argument("--distinct-messages", type=int, default=50, help="mensagens distintas (o resto acerta o cache)")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--twilio-latency", type=float, default=0.05)
+    parser.add_argument("--twilio-error-rate", type=float, default=0.0, help="fração de envios respondidos com 429")
+    parser.add_argument("--twilio-rate", type=float, default=0, help="envios por segundo por número (0: sem limite)")
+    parser.add_argument("--webhook-workers", type=int, default=32, help="conversas atendidas ao mesmo tempo por processo")
+    parser.add_argument("--conversations", type=int, default=500, help="remetentes distintos no cenário conversations")
+    parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi", help="servidor do app (asgi: uvicorn + asgi.py)")
+    parser.add_argument("--drain-timeout", type=float, default=300)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-seed", action="store_true", help="reutiliza os dados de uma execução anterior")
+    parser.add_argument("--output", help="arquivo do relatório JSON (padrão: saída padrão)")
+    parser.add_argument("--compare", help="relatório anterior para comparar")
+    args = parser.parse_args(argv)
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"cenários desconhecidos: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    workdir = tempfile.mkdtemp(prefix="zenith-bench-")
+    # Configuração lida pelos módulos do app na importação: precisa vir antes de importar o app
+    os.environ.update({
+        "LLM_BACKEND": "fake",
+        "TWILIO_ACCOUNT_SID": os.getenv("TWILIO_ACCOUNT_SID") or "AC" + "0" * 32,
+        "TWILIO_AUTH_TOKEN": os.getenv("TWILIO_AUTH_TOKEN") or "bench",
+        "WEBHOOK_WORKERS": str(args.webhook_workers),
+        "TWILIO_RATE_PER_SECOND": str(args.twilio_rate),
+        "LLM_ASYNC_POOL_SIZE": str(max(args.webhook_workers, 1)),
+        # Mede o pipeline, não os limites dos planos: vagas e filas do agendador da IA sem aperto
+        # (defina LLM_PLAN_LIMITS para medir com os limites reais)
+        "LLM_MAX_CONCURRENCY": str(max(args.webhook_workers, 1)),
+        "LLM_PLAN_LIMITS": os.getenv("LLM_PLAN_LIMITS") or json.dumps({
+            plano: {"concorrencia": max(args.webhook_workers, 1), "fila": 100000, "tokens": 0}
+            for plano in ("free", "basico", "plus", "enterprise")
+        }),
+        "ZENITH_DATA_DIR": os.path.join(workdir, "data"),
+        "LOG_DIR": os.path.join(workdir, "log"),
+        "SECRET_KEY": os.getenv("SECRET_KEY") or uuid.uuid4().hex,
+    })
+    from model.gemma_api import FakeLLMServer
+    from app.twilio_sender import FakeTwilioServer
+    llm = FakeLLMServer(latency=args.llm_latency).start()
+    twilio = FakeTwilioServer(latency=args.twilio_latency, error_rate=args.twilio_error_rate).start()
+    # Lidos a cada chamada (não na importação)
+    os.environ["FAKE_LLM_URL"] = llm.url
+    os.environ["TWILIO_API_URL"] = twilio.url
+    from benchmarks.seed import seed, bench_email, bench_telefone
+
+    if args.skip_seed:
+        seeded = {
+            "empresas": [{"email": bench_email(i), "telefone": bench_telefone(i)} for i in range(args.companies)],
+            "produtos": args.products,
+        }
+    else:
+        seed_start = time.perf_counter()
+        seeded = seed(args.companies, args.products, args.seed)
+        print(f"Banco populado em {time.perf_counter() - seed_start:.1f}s", file=sys.stderr)
+
+    server, base_url = start_server(args.server)
+    try:
+        results = run_scenarios(args, base_url, seeded, llm, twilio)
+    finally:
+        server.shutdown()
+        twilio.stop()
+        llm.stop()
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "companies": args.companies,
+            "products": args.products,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "llm_latency": args.llm_latency,
+            "twilio_latency": args.twilio_latency,
+            "twilio_error_rate": args.twilio_error_rate,
+            "twilio_errors": twilio.errors,
+            "webhook_workers": args.webhook_workers,
+            "twilio_rate": args.twilio_rate,
+            "server": args.server,
+            "llm_requests": llm.requests,
+        },
+        "scenarios": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if baseline is not None:
+        print(compare(report, baseline), file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Cria o esquema (database/init_db.sql) e popula o banco configurado nas variáveis DB_* com
+# empresas e produtos sintéticos para os benchmarks. Os dados ficam marcados (e-mails
+# @zenith.bench, códigos BENCH-*) e são apagados antes de cada carga.
+import os
+import random
+from werkzeug.security import generate_password_hash
+from database.connection import connect_db
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), '..', 'database', 'init_db.sql')
+BENCH_PASSWORD = "bench-senha"
+BENCH_EMAIL_DOMAIN = "zenith.bench"
+BATCH_SIZE = 1000
+
+PRODUTOS = "arroz feijao cafe acucar oleo leite pao biscoito sabao detergente farinha macarrao molho sal cerveja refrigerante".split()
+MARCAS = "pilao camil uniao liza italac nestle ype omo skol coca dona benta".split()
+UNIDADES = ("un", "kg", "cx", "lt")
+
+
+def bench_email(i):
+    return f"bench-{i}@{BENCH_EMAIL_DOMAIN}"
+
+
+# Já em E.164, o formato de empresas.telefone_e164
+def bench_telefone(i):
+    return f"+55119{i:08d}"
+
+
+def _statements(sql):
+    linhas = [linha for linha in sql.splitlines() if not linha.strip().startswith('--')]
+    return [stmt.strip() for stmt in "\n".join(linhas).split(';') if stmt.strip()]
+
+
+def apply_schema(cursor):
+    with open(SCHEMA_PATH, encoding='utf-8') as f:
+        for statement in _statements(f.read()):
+            cursor.execute(statement)
+
+
+def reset(cursor):
+    cursor.execute("DELETE FROM usuarios WHERE email LIKE %s", (f"%@{BENCH_EMAIL_DOMAIN}",))
+    cursor.execute("DELETE FROM produtos WHERE codigo LIKE 'BENCH-%'")
+
+
+def gerar_produtos(inicio, quantidade, rng=random):
+    for j in range(inicio, inicio + quantidade):
+        valor = round(rng.uniform(1, 200), 2)
+        yield {
+            "codigo": f"BENCH-{j}",
+            "produto": f"{rng.choice(PRODUTOS)} {rng.choice(MARCAS)} {rng.choice((1, 2, 5))}{rng.choice(UNIDADES)}",
+            "valor_unitario": valor,
+            "desconto": 0,
+            "valor_venda": valor,
+            "unidade_medida": rng.choice(UNIDADES),
+            "quantidade": rng.randint(0, 500),
+        }
+
+
+# Cada empresa recebe um catálogo de `products` produtos (os mesmos códigos BENCH-* em todas)
+# Retorna {"empresas": [{"id", "usuario_id", "email", "telefone"}, ...], "produtos": M}
+def seed(companies, products, seed_value=42):
+    rng = random.Random(seed_value)
+    senha_hash = generate_password_hash(BENCH_PASSWORD)
+    conn = connect_db()
+    cursor = conn.cursor()
+    try:
+        apply_schema(cursor)
+        reset(cursor)
+        empresas = []
+        for i in range(companies):
+            cursor.execute(
+                "INSERT INTO usuarios (nome, email, senha_hash, plano) VALUES (%s, %s, %s, %s)",
+                (f"Bench {i}", bench_email(i), senha_hash, rng.choice(("Básico", "Pro", "Enterprise")))
+            )
+            usuario_id = cursor.lastrowid
+            cursor.execute(
+                "INSERT INTO empresas (usuario_id, razao_social, nome_fantasia, cnpj, telefone, telefone_e164, email_empresarial) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                (usuario_id, f"Bench {i} LTDA", f"Bench {i}", f"{i:014d}", bench_telefone(i), bench_telefone(i), bench_email(i))
+            )
+            empresa_id = cursor.lastrowid
+            cursor.execute(
+                "INSERT INTO persona_ia (empresa_id, nome_agente, tamanho_resposta, diretrizes_1) VALUES (%s, %s, %s, %s)",
+                (empresa_id, f"Agente {i}", rng.choice(("Minimalistas", "Curta", "Longa")), "Ofereça os produtos do catálogo")
+            )
+            empresas.append({"id": empresa_id, "usuario_id": usuario_id, "email": bench_email(i), "telefone": bench_telefone(i)})
+        sql = (
+            "INSERT INTO produtos (empresa_id, codigo, produto, valor_unitario, desconto, valor_venda, unidade_medida, quantidade) "
+            "VALUES (%(empresa_id)s, %(codigo)s, %(produto)s, %(valor_unitario)s, %(desconto)s, %(valor_venda)s, %(unidade_medida)s, %(quantidade)s)"
+        )
+        for empresa in empresas:
+            for inicio in range(0, products, BATCH_SIZE):
+                lote = [dict(p, empresa_id=empresa["id"]) for p in gerar_produtos(inicio, min(BATCH_SIZE, products - inicio), rng)]
+                cursor.executemany(sql, lote)
+        conn.commit()
+        return {"empresas": empresas, "produtos": products}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
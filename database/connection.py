@@ -1,19 +1,40 @@
 # Importa a biblioteca mysql-connector-python pra conectar ao banco de dados MySQL
 import mysql.connector
+from mysql.connector.errors import PoolError
 # Importa o módulo os pra acessar variáveis de ambiente
 import os
+import asyncio
+import contextvars
+import functools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 # Importa a função load_dotenv pra carregar variáveis de ambiente de um arquivo .env
 from dotenv import load_dotenv
 
 # Carrega as variáveis de ambiente do arquivo .env (ex.: DB_HOST, DB_USER, etc.)
 load_dotenv()
 
-# Função que estabelece a conexão com o banco de dados MySQL
-def connect_db():
-    # Imprime o usuário do banco de dados (pra depuração, pode ser removido em produção)
-    print("Conectando como:", os.getenv("DB_USER"))  # DEBUG
+logger = logging.getLogger(__name__)
+
+# Quantidade máxima de conexões abertas por processo
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+# Tempo máximo (segundos) que uma requisição espera por uma conexão livre
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Conexões ociosas há mais tempo que isso (segundos) recebem um ping antes de serem entregues
+POOL_PING_INTERVAL = float(os.getenv("DB_POOL_PING_INTERVAL", "30"))
+# Threads que executam as consultas pedidas por código assíncrono (run_db); por padrão uma por
+# conexão do pool, assim as corrotinas esperam numa fila em vez de disputar conexões
+ASYNC_THREADS = int(os.getenv("DB_ASYNC_THREADS", str(POOL_SIZE)))
 
-    # Retorna uma conexão com o banco de dados usando os parâmetros configurados
+
+# Abre uma conexão nova com o MySQL (usada apenas pelo pool)
+def _open_connection():
+    # Usa a extensão em C quando disponível; DB_USE_PURE=1 força a implementação pura em Python
+    use_pure = os.getenv("DB_USE_PURE", "0") == "1" or not mysql.connector.HAVE_CEXT
     return mysql.connector.connect(
         # Host do banco de dados (ex.: localhost ou um endereço remoto)
         host=os.getenv("DB_HOST"),
@@ -23,8 +44,281 @@ def connect_db():
         password=os.getenv("DB_PASSWORD"),
         # Nome do banco de dados a ser usado (ex.: zenith_ia)
         database=os.getenv("DB_NAME"),
-        # Usa a implementação pura em Python do MySQL Connector (pra compatibilidade)
-        use_pure=True,
+        use_pure=use_pure,
         # Define o socket Unix como None (usado apenas em configurações específicas, geralmente em servidores locais)
         unix_socket=None
-    )
\ No newline at end of file
+    )
+
+
+# Observadores das consultas: fn(operacao, segundos, erro) é chamada depois de cada
+# cursor.execute/executemany (usado pelas métricas em app.metrics, sem importar o app aqui)
+_query_observers = []
+
+
+def add_query_observer(fn):
+    if fn not in _query_observers:
+        _query_observers.append(fn)
+
+
+def remove_query_observer(fn):
+    if fn in _query_observers:
+        _query_observers.remove(fn)
+
+
+def _operation(statement):
+    words = str(statement).split(None, 1)
+    return words[0].upper() if words else ""
+
+
+# Cursor que mede o tempo de cada consulta e avisa os observadores
+class ObservedCursor:
+    def __init__(self, cursor):
+        object.__setattr__(self, "_cursor", cursor)
+
+    def __getattr__(self, name):
+        return getattr(object.__getattribute__(self, "_cursor"), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _observe(self, method, statement, *args, **kwargs):
+        start = time.perf_counter()
+        error = None
+        try:
+            return method(statement, *args, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            for observer in list(_query_observers):
+                try:
+                    observer(_operation(statement), elapsed, error)
+                except Exception as e:
+                    logger.error(f"Erro no observador de consultas: {str(e)}")
+
+    def execute(self, statement, *args, **kwargs):
+        return self._observe(self._cursor.execute, statement, *args, **kwargs)
+
+    def executemany(self, statement, *args, **kwargs):
+        return self._observe(self._cursor.executemany, statement, *args, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._cursor.close()
+
+
+# Conexão emprestada do pool: se comporta como a conexão do MySQL,
+# mas close() devolve a conexão ao pool em vez de desconectar
+class PooledConnection:
+    def __init__(self, pool, cnx):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_cnx", cnx)
+        object.__setattr__(self, "_autocommit_changed", False)
+
+    def __getattr__(self, name):
+        cnx = object.__getattribute__(self, "_cnx")
+        if cnx is None:
+            raise PoolError("Conexão já devolvida ao pool")
+        return getattr(cnx, name)
+
+    def __setattr__(self, name, value):
+        # Atributos como autocommit são repassados à conexão real
+        if name == "autocommit":
+            object.__setattr__(self, "_autocommit_changed", True)
+        setattr(self._cnx, name, value)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self.__getattr__("cursor")(*args, **kwargs)
+        return ObservedCursor(cursor) if _query_observers else cursor
+
+    def close(self):
+        cnx = object.__getattribute__(self, "_cnx")
+        if cnx is None:
+            return
+        object.__setattr__(self, "_cnx", None)
+        self._pool._release(cnx, self._autocommit_changed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Pool de conexões por processo, com health-check na retirada e métricas
+class ConnectionPool:
+    def __init__(self, size=POOL_SIZE, timeout=POOL_TIMEOUT, ping_interval=POOL_PING_INTERVAL):
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.pid = os.getpid()
+        # LIFO: reaproveita as conexões mais "quentes" e deixa as antigas envelhecerem
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._in_use = 0
+        self._stats = {
+            "created": 0,
+            "discarded": 0,
+            "checkouts": 0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def _create(self):
+        try:
+            cnx = _open_connection()
+        except Exception:
+            with self._lock:
+                self._open -= 1
+            raise
+        with self._lock:
+            self._stats["created"] += 1
+        return cnx
+
+    def _discard(self, cnx):
+        try:
+            cnx.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._open -= 1
+            self._stats["discarded"] += 1
+
+    def _healthy(self, cnx, idle_since):
+        if time.monotonic() - idle_since < self.ping_interval:
+            return True
+        try:
+            cnx.ping(reconnect=False)
+            return True
+        except Exception:
+            with self._lock:
+                self._stats["health_check_failures"] += 1
+            return False
+
+    def get(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        deadline = time.monotonic() + timeout
+        cnx = None
+        while cnx is None:
+            try:
+                cnx, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_create = self._open < self.size
+                    if can_create:
+                        self._open += 1
+                if can_create:
+                    cnx = self._create()
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    cnx, idle_since = self._idle.get(timeout=max(remaining, 0))
+                except queue.Empty:
+                    with self._lock:
+                        self._stats["timeouts"] += 1
+                    raise PoolError(f"Nenhuma conexão livre no pool após {timeout:.1f}s")
+            if not self._healthy(cnx, idle_since):
+                self._discard(cnx)
+                cnx = None
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            self._stats["wait_seconds_total"] += waited
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+        return PooledConnection(self, cnx)
+
+    def _release(self, cnx, autocommit_changed):
+        with self._lock:
+            self._in_use -= 1
+        try:
+            # Desfaz transações abertas (inclusive snapshots de leitura) antes de reutilizar
+            if cnx.in_transaction:
+                cnx.rollback()
+            if autocommit_changed:
+                cnx.autocommit = False
+        except Exception as e:
+            logger.warning(f"Descartando conexão do pool após erro ao liberar: {str(e)}")
+            self._discard(cnx)
+            return
+        self._idle.put((cnx, time.monotonic()))
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data["size"] = self.size
+            data["open"] = self._open
+            data["in_use"] = self._in_use
+        data["idle"] = self._idle.qsize()
+        return data
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Retorna o pool do processo atual (recriado após fork, ex.: workers do gunicorn com --preload)
+def get_pool():
+    global _pool
+    pool = _pool
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = ConnectionPool()
+                logger.info(f"Pool de conexões criado (tamanho {_pool.size}) como {os.getenv('DB_USER')}")
+            pool = _pool
+    return pool
+
+
+# Função que retira uma conexão do pool; conn.close() devolve a conexão ao pool
+def connect_db():
+    return get_pool().get()
+
+
+# Versão em context manager: with get_connection() as conn: ...
+@contextmanager
+def get_connection():
+    conn = connect_db()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+# Métricas do pool (tempo de espera, conexões em uso, criadas etc.)
+def pool_stats():
+    return get_pool().stats()
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=ASYNC_THREADS, thread_name_prefix="db-async")
+                _executor_pid = os.getpid()
+    return _executor
+
+
+# Executa uma função que usa o banco (o conector do MySQL é bloqueante) numa thread do executor,
+# sem travar o event loop: produto = await run_db(get_produto, codigo). O contexto (ID da
+# requisição nos logs) é levado junto
+async def run_db(func, *args, **kwargs):
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), call)
@@ -0,0 +1,125 @@
+-- Esquema do banco da Zenith IA (MySQL 8 / MariaDB 10.5+)
+-- Uso: mysql -u <usuario> -p <banco> < database/init_db.sql
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    nome VARCHAR(255) NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    senha_hash VARCHAR(255) NOT NULL,
+    cpf VARCHAR(14) DEFAULT '',
+    data_nascimento VARCHAR(10) DEFAULT '',
+    cep VARCHAR(9) DEFAULT '',
+    endereco VARCHAR(255) DEFAULT '',
+    plano VARCHAR(50) NOT NULL DEFAULT 'Básico',
+    criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uk_usuarios_email (email)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS empresas (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    usuario_id INT NOT NULL,
+    razao_social VARCHAR(255) NOT NULL,
+    nome_fantasia VARCHAR(255) DEFAULT '',
+    cnpj VARCHAR(18) NOT NULL,
+    tipo_empresa VARCHAR(50) DEFAULT '',
+    cep VARCHAR(9) DEFAULT '',
+    endereco VARCHAR(255) DEFAULT '',
+    telefone VARCHAR(20) DEFAULT '',
+    -- Número do WhatsApp em E.164 (app.models.normalize_telefone): chave exata das mensagens recebidas
+    telefone_e164 VARCHAR(16) NULL,
+    email_empresarial VARCHAR(255) DEFAULT '',
+    inscricao_estadual VARCHAR(20) DEFAULT '',
+    inscricao_municipal VARCHAR(20) DEFAULT '',
+    criado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_empresas_usuario (usuario_id),
+    UNIQUE KEY uk_empresas_telefone_e164 (telefone_e164),
+    CONSTRAINT fk_empresas_usuario FOREIGN KEY (usuario_id) REFERENCES usuarios (id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS persona_ia (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    empresa_id INT NOT NULL,
+    nome_agente VARCHAR(100) DEFAULT '',
+    funcao_agente VARCHAR(100) DEFAULT 'Assistente Virtual',
+    idioma VARCHAR(50) DEFAULT 'Português',
+    tom_voz VARCHAR(50) DEFAULT 'Amigável',
+    estilo_conversacao VARCHAR(50) DEFAULT 'Chat',
+    tamanho_resposta VARCHAR(50) DEFAULT 'Curta',
+    diretrizes_1 VARCHAR(500) NULL,
+    diretrizes_2 VARCHAR(500) NULL,
+    diretrizes_3 VARCHAR(500) NULL,
+    diretrizes_4 VARCHAR(500) NULL,
+    diretrizes_5 VARCHAR(500) NULL,
+    diretrizes_6 VARCHAR(500) NULL,
+    diretrizes_7 VARCHAR(500) NULL,
+    diretrizes_8 VARCHAR(500) NULL,
+    UNIQUE KEY uk_persona_empresa (empresa_id),
+    CONSTRAINT fk_persona_empresa FOREIGN KEY (empresa_id) REFERENCES empresas (id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Bancos criados antes do telefone normalizado (depois do ALTER, preencha com
+-- python -c "from app.models import preencher_telefones_e164; preencher_telefones_e164()"):
+-- ALTER TABLE empresas ADD COLUMN telefone_e164 VARCHAR(16) NULL AFTER telefone,
+--     ADD UNIQUE KEY uk_empresas_telefone_e164 (telefone_e164);
+
+-- Catálogo por empresa: o índice único (empresa_id, codigo) é a chave do upsert em lote de
+-- save_produtos (INSERT ... ON DUPLICATE KEY UPDATE) e atende as consultas por empresa pelo prefixo
+CREATE TABLE IF NOT EXISTS produtos (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    empresa_id INT NOT NULL,
+    codigo VARCHAR(50) NOT NULL,
+    produto VARCHAR(255) NOT NULL,
+    valor_unitario DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    desconto DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    valor_venda DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    unidade_medida VARCHAR(20) DEFAULT '',
+    quantidade INT NOT NULL DEFAULT 0,
+    -- Hash da linha normalizada: a sincronização (sync_produtos) só regrava produtos com hash diferente
+    hash_linha CHAR(32) NULL,
+    UNIQUE KEY uk_produtos_empresa_codigo (empresa_id, codigo),
+    CONSTRAINT fk_produtos_empresa FOREIGN KEY (empresa_id) REFERENCES empresas (id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Bancos criados antes do catálogo por empresa (produtos sem empresa_id), atribuindo os produtos
+-- existentes à empresa que os cadastrou:
+-- ALTER TABLE produtos ADD COLUMN empresa_id INT NULL AFTER id;
+-- UPDATE produtos SET empresa_id = <id da empresa>;
+-- ALTER TABLE produtos MODIFY empresa_id INT NOT NULL, DROP INDEX uk_produtos_codigo,
+--     ADD UNIQUE KEY uk_produtos_empresa_codigo (empresa_id, codigo),
+--     ADD CONSTRAINT fk_produtos_empresa FOREIGN KEY (empresa_id) REFERENCES empresas (id) ON DELETE CASCADE;
+-- Bancos sem o hash das linhas (a primeira sincronização regrava todos os produtos uma vez):
+-- ALTER TABLE produtos ADD COLUMN hash_linha CHAR(32) NULL;
+
+-- Relatórios: eventos das conversas do WhatsApp (só inserção) e agregados por empresa e hora/dia.
+-- Os agregados são atualizados em lote por reports/generate_reports.py a partir da marca d'água.
+CREATE TABLE IF NOT EXISTS eventos_conversa (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    empresa_id INT NULL,
+    remetente VARCHAR(32) NOT NULL DEFAULT '',
+    recebido_em DATETIME(3) NOT NULL,
+    criado_em DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    sucesso TINYINT(1) NOT NULL DEFAULT 1,
+    cache_hit TINYINT(1) NOT NULL DEFAULT 0,
+    latencia_ms INT NOT NULL DEFAULT 0,
+    produtos_sugeridos INT NOT NULL DEFAULT 0,
+    tamanho_resposta INT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS rollup_conversas (
+    empresa_id INT NOT NULL,
+    granularidade VARCHAR(8) NOT NULL,
+    periodo DATETIME NOT NULL,
+    mensagens INT NOT NULL DEFAULT 0,
+    sucessos INT NOT NULL DEFAULT 0,
+    cache_hits INT NOT NULL DEFAULT 0,
+    latencia_total_ms BIGINT NOT NULL DEFAULT 0,
+    latencia_max_ms INT NOT NULL DEFAULT 0,
+    produtos_sugeridos INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (empresa_id, granularidade, periodo)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS rollup_watermark (
+    nome VARCHAR(64) PRIMARY KEY,
+    ultimo_evento_id BIGINT NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
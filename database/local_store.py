@@ -0,0 +1,31 @@
+# Armazenamento local em SQLite (filas, caches e estados compartilhados entre os workers do gunicorn)
+import os
+import sqlite3
+import threading
+
+# Pasta dos arquivos SQLite locais (ZENITH_DATA_DIR permite apontar pra um volume persistente)
+DATA_DIR = os.getenv("ZENITH_DATA_DIR", os.path.join(os.path.dirname(__file__), '..', 'data'))
+
+_local = threading.local()
+
+
+def local_db_path(name):
+    return os.path.join(DATA_DIR, name)
+
+
+# Retorna uma conexão SQLite por thread e por arquivo, em modo WAL (leitores não bloqueiam o escritor)
+def connect_local(name):
+    conns = getattr(_local, "conns", None)
+    if conns is None or getattr(_local, "pid", None) != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(name)
+    if conn is None:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        # isolation_level=None: as transações são controladas explicitamente com BEGIN/COMMIT
+        conn = sqlite3.connect(local_db_path(name), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conns[name] = conn
+    return conn
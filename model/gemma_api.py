@@ -0,0 +1,344 @@
+# Cliente dos modelos de linguagem (DeepSeek, Gemma-2B local e servidor falso pra testes),
+# síncrono (requests) e assíncrono (aiohttp, usado pelos workers do webhook)
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Backend padrão: deepseek, gemma ou fake
+LLM_BACKEND = os.getenv("LLM_BACKEND", "deepseek")
+# Timeouts (segundos): conexão curta, leitura do tamanho de uma resposta longa do modelo
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "30"))
+# Conexões keep-alive mantidas por processo
+POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "10"))
+# Conexões simultâneas do cliente assíncrono por event loop (cada conversa em andamento usa uma)
+ASYNC_POOL_SIZE = int(os.getenv("LLM_ASYNC_POOL_SIZE", "100"))
+
+
+# Marca o fim do streaming ("data: [DONE]")
+STREAM_DONE = object()
+
+
+class LLMError(Exception):
+    pass
+
+
+# Erro de configuração (ex.: chave ausente): não adianta tentar de novo
+class LLMConfigError(LLMError):
+    pass
+
+
+# Backend com API de chat no formato OpenAI (/chat/completions), usado pelo DeepSeek,
+# pelo servidor local do Gemma (llama.cpp, Ollama, vLLM) e pelo servidor falso
+class ChatBackend:
+    def __init__(self, name, endpoint, model, api_key=None, require_key=False):
+        self.name = name
+        self.endpoint = endpoint
+        self.model = model
+        self.api_key = api_key
+        self.require_key = require_key
+
+    def headers(self):
+        if self.require_key and not self.api_key:
+            raise LLMConfigError(f"Chave de API do backend {self.name} não encontrada no .env")
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def payload(self, messages, max_tokens, temperature, stream):
+        return {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": stream
+        }
+
+    def parse_response(self, data):
+        return data.get('choices')[0].get('message').get('content')
+
+    # Extrai o pedaço de texto de uma linha SSE ("data: {...}"); None quando não há texto
+    # e STREAM_DONE no fim
+    def parse_stream_line(self, line):
+        if not line or not line.startswith("data:"):
+            return None
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return STREAM_DONE
+        choices = json.loads(data).get('choices') or [{}]
+        return (choices[0].get('delta') or {}).get('content')
+
+
+def deepseek_backend():
+    return ChatBackend(
+        "deepseek",
+        os.getenv("DEEPSEEK_API_URL", "https://api.deepseek.com/chat/completions"),
+        os.getenv("DEEPSEEK_MODEL", "deepseek-chat"),
+        api_key=os.getenv("DEEPSEEK_API_KEY"),
+        require_key=True
+    )
+
+
+# Servidor local do Gemma-2B (exposto via ngrok no MVP)
+def gemma_backend():
+    return ChatBackend(
+        "gemma",
+        os.getenv("GEMMA_API_URL", "http://localhost:8000/v1/chat/completions"),
+        os.getenv("GEMMA_MODEL", "gemma-2b"),
+        api_key=os.getenv("GEMMA_API_KEY")
+    )
+
+
+def fake_backend(url):
+    return ChatBackend("fake", url.rstrip("/") + "/chat/completions", "fake")
+
+
+# Cliente HTTP com sessão keep-alive, timeouts e modo streaming
+class LLMClient:
+    def __init__(self, backend, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, pool_size=POOL_SIZE):
+        self.backend = backend
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        # Só repete falhas de conexão (a requisição não chegou ao servidor, então não duplica cobrança)
+        retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _post(self, messages, max_tokens, temperature, stream):
+        try:
+            response = self.session.post(
+                self.backend.endpoint,
+                json=self.backend.payload(messages, max_tokens, temperature, stream),
+                headers=self.backend.headers(),
+                timeout=self.timeout,
+                stream=stream
+            )
+            response.raise_for_status()
+            return response
+        except requests.RequestException as e:
+            raise LLMError(f"Erro na API {self.backend.name}: {str(e)}") from e
+
+    # Retorna a resposta completa do modelo
+    def complete(self, messages, max_tokens=150, temperature=0.7):
+        response = self._post(messages, max_tokens, temperature, stream=False)
+        try:
+            return self.backend.parse_response(response.json())
+        except (ValueError, TypeError, IndexError, AttributeError) as e:
+            raise LLMError(f"Resposta inválida da API {self.backend.name}: {str(e)}") from e
+
+    # Gera os pedaços da resposta conforme chegam (stream: True)
+    def stream(self, messages, max_tokens=150, temperature=0.7):
+        response = self._post(messages, max_tokens, temperature, stream=True)
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                token = self.backend.parse_stream_line(line)
+                if token is STREAM_DONE:
+                    return
+                if token:
+                    yield token
+        except requests.RequestException as e:
+            raise LLMError(f"Erro no streaming da API {self.backend.name}: {str(e)}") from e
+        finally:
+            response.close()
+
+    def close(self):
+        self.session.close()
+
+
+# Mesmo cliente sobre aiohttp: as conversas esperam a IA sem ocupar uma thread cada.
+# A sessão pertence ao event loop em que foi criada (ver get_async_client)
+class AsyncLLMClient:
+    def __init__(self, backend, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, pool_size=ASYNC_POOL_SIZE):
+        self.backend = backend
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size),
+            timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        )
+
+    async def _post(self, messages, max_tokens, temperature, stream):
+        payload = self.backend.payload(messages, max_tokens, temperature, stream)
+        headers = self.backend.headers()
+        # Como no cliente síncrono, só repete falhas de conexão (a requisição não chegou ao servidor)
+        for attempt in range(3):
+            try:
+                response = await self.session.post(self.backend.endpoint, json=payload, headers=headers)
+                response.raise_for_status()
+                return response
+            except aiohttp.ClientConnectorError as e:
+                if attempt == 2:
+                    raise LLMError(f"Erro na API {self.backend.name}: {str(e)}") from e
+                await asyncio.sleep(0.2 * (2 ** attempt))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise LLMError(f"Erro na API {self.backend.name}: {str(e) or type(e).__name__}") from e
+
+    async def complete(self, messages, max_tokens=150, temperature=0.7):
+        response = await self._post(messages, max_tokens, temperature, stream=False)
+        try:
+            async with response:
+                data = await response.json(content_type=None)
+            return self.backend.parse_response(data)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise LLMError(f"Erro na API {self.backend.name}: {str(e) or type(e).__name__}") from e
+        except (ValueError, TypeError, IndexError, AttributeError) as e:
+            raise LLMError(f"Resposta inválida da API {self.backend.name}: {str(e)}") from e
+
+    async def stream(self, messages, max_tokens=150, temperature=0.7):
+        response = await self._post(messages, max_tokens, temperature, stream=True)
+        try:
+            async with response:
+                async for raw in response.content:
+                    token = self.backend.parse_stream_line(raw.decode("utf-8").strip())
+                    if token is STREAM_DONE:
+                        return
+                    if token:
+                        yield token
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise LLMError(f"Erro no streaming da API {self.backend.name}: {str(e) or type(e).__name__}") from e
+
+    async def close(self):
+        await self.session.close()
+
+
+# Servidor HTTP dos servidores falsos, com fila de conexões grande o bastante para os benchmarks
+class FakeHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+# Servidor HTTP local que imita a API de chat (respostas e streaming) com latência configurável
+class FakeLLMServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, token_delay=0.0, reply=None):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.reply = reply or (lambda messages: f"Resposta simulada: {messages[-1]['content']}")
+        self.requests = 0
+        # Requisições em andamento ao mesmo tempo (mostra quantas conversas o app mantém em paralelo)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                    server.in_flight += 1
+                    server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+                try:
+                    time.sleep(server.latency)
+                    text = server.reply(body.get("messages") or [{"content": ""}])
+                    if body.get("stream"):
+                        self._stream(text)
+                    else:
+                        self._send_json({"choices": [{"message": {"role": "assistant", "content": text}}]})
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def _send_json(self, data):
+                raw = json.dumps(data).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def _stream(self, text):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for word in text.split(" "):
+                    chunk = {"choices": [{"delta": {"content": word + " "}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(server.token_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        self.httpd = FakeHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+# Clientes assíncronos por event loop (a sessão do aiohttp não pode ser usada em outro loop)
+_async_clients = weakref.WeakKeyDictionary()
+_fake_server = None
+
+
+def _build_backend(name):
+    global _fake_server
+    if name == "deepseek":
+        return deepseek_backend()
+    if name == "gemma":
+        return gemma_backend()
+    if name == "fake":
+        url = os.getenv("FAKE_LLM_URL")
+        if not url:
+            # Sem URL configurada, sobe o servidor falso no próprio processo
+            if _fake_server is None:
+                _fake_server = FakeLLMServer(latency=float(os.getenv("FAKE_LLM_LATENCY", "0"))).start()
+            url = _fake_server.url
+        return fake_backend(url)
+    raise LLMConfigError(f"Backend de IA desconhecido: {name}")
+
+
+# Retorna o cliente compartilhado do processo para o backend (LLM_BACKEND por padrão)
+def get_client(backend=None):
+    name = backend or LLM_BACKEND
+    key = (os.getpid(), name)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = LLMClient(_build_backend(name))
+                logger.info(f"Cliente de IA criado para o backend {name}")
+    return client
+
+
+# Cliente assíncrono compartilhado pelas corrotinas do event loop atual
+def get_async_client(backend=None):
+    name = backend or LLM_BACKEND
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    client = clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = clients[name] = AsyncLLMClient(_build_backend(name))
+        logger.info(f"Cliente assíncrono de IA criado para o backend {name}")
+    return client
@@ -0,0 +1,242 @@
+# Motor de relatórios. Cada mensagem do WhatsApp atendida gera uma linha em eventos_conversa
+# (tabela só de inserção). Um job em lote soma os eventos novos desde a última marca d'água
+# (rollup_watermark) nos agregados por empresa e por hora/dia (rollup_conversas), com group-by
+# vetorizado do pandas; o painel lê só os agregados, nunca o histórico bruto.
+#
+# Uso: python -m reports.generate_reports            (processa os eventos pendentes e sai)
+#      python -m reports.generate_reports --loop 60  (repete a cada 60 segundos)
+import argparse
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from database.connection import connect_db
+
+logger = logging.getLogger(__name__)
+
+# Eventos lidos por lote do job de agregação
+BATCH_SIZE = int(os.getenv("REPORTS_BATCH_SIZE", "50000"))
+# Eventos mais novos que isso ficam para o próximo lote (inserções ainda não confirmadas
+# podem ter IDs menores que os já visíveis)
+SAFETY_SECONDS = float(os.getenv("REPORTS_SAFETY_SECONDS", "5"))
+# Intervalo do job dentro do app (0 desativa; nesse caso rode o job por fora, ex.: cron)
+ROLLUP_INTERVAL = float(os.getenv("REPORTS_ROLLUP_INTERVAL", "60"))
+WATERMARK = "rollup_conversas"
+# Granularidade -> frequência do pandas usada para truncar o horário do evento
+GRANULARITIES = {"hour": "h", "day": "D"}
+# Eventos sem empresa identificada são agregados com empresa_id 0
+SEM_EMPRESA = 0
+
+_EVENT_COLUMNS = ["id", "empresa_id", "recebido_em", "criado_em", "sucesso", "cache_hit", "latencia_ms", "produtos_sugeridos"]
+_ROLLUP_SQL = """
+    INSERT INTO rollup_conversas (
+        empresa_id, granularidade, periodo, mensagens, sucessos, cache_hits,
+        latencia_total_ms, latencia_max_ms, produtos_sugeridos
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        mensagens = mensagens + VALUES(mensagens), sucessos = sucessos + VALUES(sucessos),
+        cache_hits = cache_hits + VALUES(cache_hits),
+        latencia_total_ms = latencia_total_ms + VALUES(latencia_total_ms),
+        latencia_max_ms = GREATEST(latencia_max_ms, VALUES(latencia_max_ms)),
+        produtos_sugeridos = produtos_sugeridos + VALUES(produtos_sugeridos)
+"""
+
+
+# Registra uma mensagem atendida (chamado pelos workers do webhook; erros só são logados)
+def registrar_evento(empresa_id, remetente, recebido_em, sucesso=True, cache_hit=False, produtos_sugeridos=0, tamanho_resposta=0):
+    conn = None
+    cursor = None
+    try:
+        latencia_ms = max(int((time.time() - recebido_em) * 1000), 0)
+        conn = connect_db()
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO eventos_conversa (
+                empresa_id, remetente, recebido_em, sucesso, cache_hit, latencia_ms,
+                produtos_sugeridos, tamanho_resposta
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, (
+            empresa_id, (remetente or '')[:32], datetime.fromtimestamp(recebido_em), int(bool(sucesso)),
+            int(bool(cache_hit)), latencia_ms, int(produtos_sugeridos), int(tamanho_resposta)
+        ))
+        conn.commit()
+    except Exception as e:
+        logger.error(f"Erro ao registrar evento de conversa: {str(e)}")
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+# Soma os eventos do DataFrame por empresa e período, para cada granularidade
+def aggregate(eventos):
+    linhas = []
+    for granularidade, freq in GRANULARITIES.items():
+        grupos = eventos.assign(periodo=eventos["recebido_em"].dt.floor(freq)).groupby(["empresa_id", "periodo"])
+        agregado = grupos.agg(
+            mensagens=("id", "size"),
+            sucessos=("sucesso", "sum"),
+            cache_hits=("cache_hit", "sum"),
+            latencia_total_ms=("latencia_ms", "sum"),
+            latencia_max_ms=("latencia_ms", "max"),
+            produtos_sugeridos=("produtos_sugeridos", "sum"),
+        ).reset_index()
+        for row in agregado.itertuples(index=False):
+            linhas.append((
+                int(row.empresa_id), granularidade, row.periodo.to_pydatetime(), int(row.mensagens),
+                int(row.sucessos), int(row.cache_hits), int(row.latencia_total_ms), int(row.latencia_max_ms),
+                int(row.produtos_sugeridos)
+            ))
+    return linhas
+
+
+def _eventos_frame(rows, cutoff):
+    # pandas só é carregado quando há eventos para agregar
+    import pandas as pd
+    eventos = pd.DataFrame(rows, columns=_EVENT_COLUMNS)
+    eventos["recebido_em"] = pd.to_datetime(eventos["recebido_em"])
+    eventos["criado_em"] = pd.to_datetime(eventos["criado_em"])
+    # Para no primeiro evento recente demais: a marca d'água só avança sobre um prefixo contínuo de IDs
+    recentes = (eventos["criado_em"] >= cutoff).to_numpy()
+    if recentes.any():
+        eventos = eventos.iloc[:int(recentes.argmax())]
+    eventos["empresa_id"] = eventos["empresa_id"].fillna(SEM_EMPRESA).astype("int64")
+    for coluna in ("sucesso", "cache_hit", "latencia_ms", "produtos_sugeridos"):
+        eventos[coluna] = pd.to_numeric(eventos[coluna]).fillna(0).astype("int64")
+    return eventos
+
+
+# Processa um lote de eventos novos; retorna quantos eventos foram agregados
+def rollup_batch(batch_size=BATCH_SIZE):
+    conn = None
+    cursor = None
+    try:
+        conn = connect_db()
+        cursor = conn.cursor()
+        cursor.execute("INSERT IGNORE INTO rollup_watermark (nome, ultimo_evento_id) VALUES (%s, 0)", (WATERMARK,))
+        conn.commit()
+        # FOR UPDATE: dois jobs ao mesmo tempo (vários workers) não somam o mesmo lote duas vezes
+        cursor.execute("SELECT ultimo_evento_id, NOW(3) FROM rollup_watermark WHERE nome = %s FOR UPDATE", (WATERMARK,))
+        watermark, agora = cursor.fetchone()
+        cursor.execute(
+            "SELECT " + ", ".join(_EVENT_COLUMNS) + " FROM eventos_conversa WHERE id > %s ORDER BY id LIMIT %s",
+            (watermark, batch_size)
+        )
+        rows = cursor.fetchall()
+        eventos = _eventos_frame(rows, agora - timedelta(seconds=SAFETY_SECONDS)) if rows else None
+        if eventos is None or eventos.empty:
+            conn.rollback()
+            return 0
+        linhas = aggregate(eventos)
+        cursor.executemany(_ROLLUP_SQL, linhas)
+        cursor.execute(
+            "UPDATE rollup_watermark SET ultimo_evento_id = %s WHERE nome = %s",
+            (int(eventos["id"].max()), WATERMARK)
+        )
+        conn.commit()
+        return len(eventos)
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+# Agrega todos os eventos pendentes (em lotes); retorna o total processado
+def run_rollups(batch_size=BATCH_SIZE):
+    total = 0
+    start = time.perf_counter()
+    while True:
+        processados = rollup_batch(batch_size)
+        total += processados
+        if processados < batch_size:
+            break
+    if total:
+        logger.info(f"Relatórios: {total} eventos agregados em {time.perf_counter() - start:.2f}s")
+    return total
+
+
+# Série do painel lida dos agregados (granularidade 'hour' ou 'day', últimos `dias` dias)
+def get_relatorio(empresa_id, granularidade="day", dias=30):
+    if granularidade not in GRANULARITIES:
+        raise ValueError(f"Granularidade inválida: {granularidade}")
+    inicio = datetime.now() - timedelta(days=dias)
+    conn = None
+    cursor = None
+    try:
+        conn = connect_db()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT periodo, mensagens, sucessos, cache_hits, latencia_total_ms, latencia_max_ms, produtos_sugeridos
+            FROM rollup_conversas
+            WHERE empresa_id = %s AND granularidade = %s AND periodo >= %s
+            ORDER BY periodo
+        """, (empresa_id, granularidade, inicio))
+        serie = cursor.fetchall()
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+    totais = {key: 0 for key in ("mensagens", "sucessos", "cache_hits", "latencia_total_ms", "produtos_sugeridos")}
+    totais["latencia_max_ms"] = 0
+    for ponto in serie:
+        for key in totais:
+            totais[key] = max(totais[key], ponto[key]) if key == "latencia_max_ms" else totais[key] + ponto[key]
+        ponto["periodo"] = ponto["periodo"].isoformat()
+        ponto["latencia_media_ms"] = round(ponto["latencia_total_ms"] / ponto["mensagens"], 1) if ponto["mensagens"] else 0.0
+        ponto["taxa_sucesso"] = round(ponto["sucessos"] / ponto["mensagens"], 4) if ponto["mensagens"] else 0.0
+    totais["latencia_media_ms"] = round(totais["latencia_total_ms"] / totais["mensagens"], 1) if totais["mensagens"] else 0.0
+    totais["taxa_sucesso"] = round(totais["sucessos"] / totais["mensagens"], 4) if totais["mensagens"] else 0.0
+    totais["taxa_cache"] = round(totais["cache_hits"] / totais["mensagens"], 4) if totais["mensagens"] else 0.0
+    return {"granularidade": granularidade, "serie": serie, "totais": totais}
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _scheduler_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            run_rollups()
+        except Exception as e:
+            logger.error(f"Erro ao agregar relatórios: {str(e)}")
+
+
+# Roda o job periodicamente numa thread do processo (não roda nos processos filhos do app)
+def start_scheduler(interval=ROLLUP_INTERVAL):
+    global _scheduler
+    if interval <= 0 or multiprocessing.parent_process() is not None:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = threading.Thread(target=_scheduler_loop, args=(interval,), name="reports-rollup", daemon=True)
+            _scheduler.start()
+    return _scheduler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Agrega os eventos de conversa nos relatórios")
+    parser.add_argument("--loop", type=float, default=0, help="repete a cada N segundos")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    while True:
+        total = run_rollups(args.batch_size)
+        logger.info(f"{total} eventos agregados")
+        if not args.loop:
+            break
+        time.sleep(args.loop)
+
+
+if __name__ == "__main__":
+    main()
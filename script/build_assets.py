@@ -0,0 +1,203 @@
+# Build dos arquivos estáticos (ver app/assets.py). Executar no deploy, a partir da raiz do projeto:
+#   python -m script.build_assets             (baixa as bibliotecas na primeira vez, em app/static/vendor)
+#   python -m script.build_assets --offline   (usa só o que já está em app/static/vendor)
+#   python -m script.build_assets --clean     (apaga de app/static/dist o que não está no novo manifest)
+#
+# Gera em app/static/dist: os pacotes de BUNDLES concatenados (com as fontes referenciadas
+# no CSS baixadas e renomeadas), as imagens de app/static/images com hash no nome, as versões
+# .gz (e .br, com o pacote Brotli) dos arquivos de texto, as variantes WebP redimensionadas
+# das imagens (com Pillow) e o manifest.json lido pelo app.
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import urllib.request
+from io import BytesIO
+from urllib.parse import urljoin, urlsplit
+from app import assets
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+VENDOR_DIR = os.path.join(assets.STATIC_DIR, 'vendor')
+IMAGES_DIR = os.path.join(assets.STATIC_DIR, 'images')
+# O Google Fonts escolhe o formato pelo navegador; com este, entrega woff2
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".map"}
+# Larguras das variantes WebP (as maiores que a imagem original são ignoradas)
+IMAGE_WIDTHS = (40, 80, 160, 320, 640, 1280)
+RASTER_IMAGES = {".png", ".jpg", ".jpeg", ".gif"}
+WEBP_QUALITY = 80
+
+_CSS_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+_SOURCE_MAP_RE = re.compile(r"^\s*(/\*# sourceMappingURL=.*?\*/|//# sourceMappingURL=.*)$", re.MULTILINE)
+
+
+def _content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+# Arquivo baixado, guardado em app/static/vendor para os próximos builds
+def fetch(url, offline=False):
+    parts = urlsplit(url)
+    base = os.path.basename(parts.path) or "index"
+    name = f"{hashlib.sha1(url.encode('utf-8')).hexdigest()[:10]}-{base}"
+    path = os.path.join(VENDOR_DIR, name)
+    if os.path.isfile(path):
+        with open(path, 'rb') as f:
+            return f.read()
+    if offline:
+        raise FileNotFoundError(f"{url} não está em {VENDOR_DIR} (rode sem --offline)")
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        data = response.read()
+    os.makedirs(VENDOR_DIR, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    print(f"Baixado {url} ({len(data)} bytes)", file=sys.stderr)
+    return data
+
+
+class Builder:
+    def __init__(self, output, offline=False):
+        self.output = output
+        self.offline = offline
+        self.manifest = {"bundles": {}, "files": {}, "images": {}}
+        self.written = set()
+        self.sizes = []
+        # URL referenciada no CSS -> arquivo gravado (a mesma fonte aparece várias vezes)
+        self.localized = {}
+
+    # Grava `data` como <stem>.<hash><ext> (mais as versões comprimidas) e retorna o nome relativo
+    def write(self, stem, ext, data):
+        name = f"{stem}.{_content_hash(data)}{ext}"
+        path = os.path.join(self.output, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # O nome já identifica o conteúdo: se existe, é de um build anterior igual
+        if not os.path.isfile(path):
+            self._write_file(path, data)
+        self.written.add(name)
+        sizes = {"file": name, "bytes": len(data)}
+        if ext in COMPRESSIBLE:
+            compressed = {"gzip": (".gz", gzip.compress(data, 9, mtime=0))}
+            if brotli is not None:
+                compressed["br"] = (".br", brotli.compress(data, quality=11))
+            for encoding, (suffix, payload) in compressed.items():
+                # Só vale a pena se ficar menor que o original
+                if len(payload) < len(data):
+                    self._write_file(path + suffix, payload)
+                    self.written.add(name + suffix)
+                    sizes[encoding] = len(payload)
+        self.sizes.append(sizes)
+        return name
+
+    def _write_file(self, path, data):
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    # Baixa as fontes/imagens referenciadas no CSS e troca as URLs pelos arquivos com hash
+    def _localize_css(self, css, source_url):
+        def replace(match):
+            ref = match.group(2).strip()
+            if ref.startswith(("data:", "#")):
+                return match.group(0)
+            url = urljoin(source_url, ref)
+            if url not in self.localized:
+                stem, ext = os.path.splitext(os.path.basename(urlsplit(url).path))
+                self.localized[url] = self.write(f"fonts/{stem}", ext, fetch(url, self.offline))
+            return f'url("{self.localized[url]}")'
+        return _CSS_URL_RE.sub(replace, css)
+
+    def build_bundle(self, bundle, urls):
+        stem, ext = os.path.splitext(bundle)
+        parts = []
+        for url in urls:
+            text = fetch(url, self.offline).decode('utf-8')
+            text = _SOURCE_MAP_RE.sub("", text)
+            if ext == ".css":
+                text = self._localize_css(text, url)
+            parts.append(text.strip())
+        # ";" entre os scripts evita que um arquivo sem ponto e vírgula final quebre o próximo
+        data = ("\n" if ext == ".css" else ";\n").join(parts).encode('utf-8') + b"\n"
+        self.manifest["bundles"][bundle] = self.write(stem, ext, data)
+
+    def build_image(self, rel):
+        stem, ext = os.path.splitext(rel)
+        with open(os.path.join(assets.STATIC_DIR, rel), 'rb') as f:
+            data = f.read()
+        name = self.write(stem, ext.lower(), data)
+        self.manifest["files"][rel] = name
+        if ext.lower() not in RASTER_IMAGES or Image is None:
+            return
+        with Image.open(os.path.join(assets.STATIC_DIR, rel)) as image:
+            image.load()
+            width, height = image.size
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            variants = []
+            for target in sorted({w for w in IMAGE_WIDTHS if w < width} | {width}):
+                resized = image if target == width else image.resize((target, max(1, round(height * target / width))), Image.LANCZOS)
+                buffer = BytesIO()
+                resized.save(buffer, "WEBP", quality=WEBP_QUALITY, method=6)
+                variants.append([target, self.write(f"{stem}.{target}w", ".webp", buffer.getvalue())])
+        self.manifest["images"][rel] = {"src": name, "width": width, "height": height, "webp": variants}
+
+    def build(self):
+        for bundle, urls in assets.BUNDLES.items():
+            self.build_bundle(bundle, urls)
+        for root, _, files in os.walk(IMAGES_DIR):
+            for filename in sorted(files):
+                rel = os.path.relpath(os.path.join(root, filename), assets.STATIC_DIR).replace(os.sep, "/")
+                self.build_image(rel)
+        self._write_file(
+            os.path.join(self.output, assets.MANIFEST_NAME),
+            json.dumps(self.manifest, indent=2, sort_keys=True).encode('utf-8')
+        )
+        return self.manifest
+
+    # Remove os arquivos de builds anteriores (páginas já abertas podem ainda pedir por eles)
+    def clean(self):
+        removed = 0
+        for root, _, files in os.walk(self.output):
+            for filename in files:
+                rel = os.path.relpath(os.path.join(root, filename), self.output).replace(os.sep, "/")
+                if rel != assets.MANIFEST_NAME and rel not in self.written:
+                    os.remove(os.path.join(root, filename))
+                    removed += 1
+        return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build dos arquivos estáticos da Zenith IA")
+    parser.add_argument("--output", default=assets.DIST_DIR, help="pasta de saída (padrão: app/static/dist)")
+    parser.add_argument("--offline", action="store_true", help="não baixa nada; usa app/static/vendor")
+    parser.add_argument("--clean", action="store_true", help="apaga os arquivos de builds anteriores")
+    args = parser.parse_args(argv)
+
+    if brotli is None:
+        print("Pacote Brotli não instalado: gerando só as versões .gz", file=sys.stderr)
+    if Image is None:
+        print("Pillow não instalado: imagens sem variantes WebP", file=sys.stderr)
+    builder = Builder(args.output, offline=args.offline)
+    builder.build()
+    for sizes in builder.sizes:
+        compressed = ", ".join(f"{encoding} {sizes[encoding]}" for encoding in ("gzip", "br") if encoding in sizes)
+        print(f"{sizes['file']}: {sizes['bytes']} bytes" + (f" ({compressed})" if compressed else ""))
+    if args.clean:
+        print(f"{builder.clean()} arquivos antigos removidos", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
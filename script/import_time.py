@@ -0,0 +1,94 @@
+# Mede o tempo de importação do app (python -X importtime num interpretador novo) e falha
+# (código de saída 1) se passar do orçamento ou se um módulo pesado for importado na partida.
+# Executar a partir da raiz do projeto (no CI, depois de mudanças nos imports):
+#   python -m script.import_time                      (relatório dos módulos mais lentos)
+#   python -m script.import_time --budget-ms 400      (falha acima de 400 ms)
+#   python -m script.import_time --target asgi --top 30
+#
+# O tempo varia com a máquina; o orçamento serve para pegar regressões grandes (ex.: um
+# `import pandas` no topo de um módulo das rotas), que --forbid pega de forma determinística.
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+# Orçamento padrão da importação do pacote app (o Flask sozinho leva ~100 ms)
+DEFAULT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "400"))
+# Módulos que só devem ser carregados no primeiro uso (ver app.PREWARM_MODULES)
+DEFAULT_FORBIDDEN = ("pandas", "numpy", "twilio", "aiohttp", "requests", "model.gemma_api", "app.twilio_sender")
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| *(\S+)$")
+
+
+# [(módulo, próprio_us, acumulado_us)] na ordem do -X importtime
+def measure(target, python=sys.executable, env=None):
+    # Sem o pré-carregamento em segundo plano (o alvo asgi chama create_app)
+    run_env = dict(os.environ if env is None else env, STARTUP_PREWARM="0")
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True, text=True, env=run_env, cwd=os.getcwd()
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {target}:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            own, cumulative, name = match.groups()
+            rows.append((name, int(own), int(cumulative)))
+    return rows
+
+
+def report(rows, target, top=20):
+    total = next((cumulative for name, _, cumulative in rows if name == target), 0)
+    imported = {name for name, _, _ in rows}
+    slowest = sorted(rows, key=lambda row: row[2], reverse=True)[:top]
+    return {
+        "target": target,
+        "total_ms": round(total / 1000, 1),
+        "modules": len(rows),
+        "slowest": [
+            {"module": name, "cumulative_ms": round(cumulative / 1000, 1), "self_ms": round(own / 1000, 1)}
+            for name, own, cumulative in slowest
+        ],
+        "imported": imported,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tempo de importação do app e orçamento de partida")
+    parser.add_argument("--target", default="app", help="módulo importado (padrão: app)")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="0 desativa o orçamento")
+    parser.add_argument("--forbid", default=",".join(DEFAULT_FORBIDDEN), help="módulos que não podem ser importados na partida")
+    parser.add_argument("--top", type=int, default=20, help="módulos mais lentos no relatório")
+    parser.add_argument("--runs", type=int, default=3, help="execuções (vale a mais rápida)")
+    parser.add_argument("--json", action="store_true", help="relatório em JSON")
+    args = parser.parse_args(argv)
+
+    # A menor de algumas execuções desconta o ruído (cache de disco, outros processos)
+    result = min((report(measure(args.target), args.target, args.top) for _ in range(max(1, args.runs))), key=lambda r: r["total_ms"])
+    forbidden = [name for name in args.forbid.split(",") if name and name in result["imported"]]
+    errors = []
+    if args.budget_ms and result["total_ms"] > args.budget_ms:
+        errors.append(f"importação de {args.target} levou {result['total_ms']} ms (orçamento: {args.budget_ms:g} ms)")
+    if forbidden:
+        errors.append(f"módulos pesados importados na partida: {', '.join(forbidden)}")
+
+    del result["imported"]
+    result["budget_ms"] = args.budget_ms
+    result["forbidden_imported"] = forbidden
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{args.target}: {result['total_ms']} ms, {result['modules']} módulos (orçamento {args.budget_ms:g} ms)")
+        for item in result["slowest"]:
+            print(f"  {item['cumulative_ms']:8.1f} ms  {item['self_ms']:7.1f} ms  {item['module']}")
+    for error in errors:
+        print(f"ERRO: {error}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
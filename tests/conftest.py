@@ -0,0 +1,223 @@
+# Configuração lida pelos módulos do app na importação: precisa vir antes de qualquer import do app.
+# Os SQLite locais e os logs vão para uma pasta temporária; sem workers da fila, sem job de
+# relatórios e sem pré-carregamento, para os testes controlarem o que roda.
+import copy
+import os
+import re
+import tempfile
+
+_workdir = tempfile.mkdtemp(prefix="zenith-tests-")
+os.environ.update({
+    "ZENITH_DATA_DIR": os.path.join(_workdir, "data"),
+    "LOG_DIR": os.path.join(_workdir, "log"),
+    "SECRET_KEY": "tests",
+    "WEBHOOK_WORKERS": "0",
+    "REPORTS_ROLLUP_INTERVAL": "0",
+    "STARTUP_PREWARM": "0",
+    "LLM_QUOTA_SYNC_INTERVAL": "0",
+    "DB_POOL_TIMEOUT": "0.1",
+})
+
+import pytest
+
+
+class FakeCursor:
+    def __init__(self, conn, dictionary=False):
+        self.conn = conn
+        self.dictionary = dictionary
+        self.rowcount = 0
+        self.lastrowid = None
+        self._rows = []
+
+    def execute(self, statement, params=None):
+        self.conn.statements.append((statement, params))
+        self._rows = list(self.conn.results.pop(0)) if self.conn.results else []
+        self.rowcount = len(self._rows)
+
+    def executemany(self, statement, rows):
+        rows = list(rows)
+        self.conn.statements.append((statement, rows))
+        self.rowcount = len(rows)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size=1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+# Conexão do MySQL em memória: guarda as consultas executadas e devolve `results` em ordem
+class FakeConnection:
+    def __init__(self, results=None):
+        self.statements = []
+        self.results = list(results or [])
+        self.in_transaction = False
+        self.autocommit = False
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+        self.ping_ok = True
+
+    def cursor(self, dictionary=False, **kwargs):
+        return FakeCursor(self, dictionary)
+
+    def start_transaction(self):
+        self.in_transaction = True
+
+    def commit(self):
+        self.commits += 1
+        self.in_transaction = False
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def ping(self, reconnect=False):
+        if not self.ping_ok:
+            raise OSError("conexão perdida")
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def flask_app():
+    from app import create_app
+    app = create_app()
+    app.config.update(TESTING=True)
+    return app
+
+
+# Cliente autenticado como o usuário 1 (empresa 1), sem consultar o MySQL
+@pytest.fixture
+def logged_client(flask_app, monkeypatch):
+    import app as app_module
+    from app import routes
+    usuario = {"id": 1, "nome": "Teste", "email": "teste@example.com", "plano": "Plus"}
+    monkeypatch.setattr(app_module, "get_usuario_by_id", lambda user_id: usuario if str(user_id) == "1" else None)
+    monkeypatch.setattr(routes, "get_empresa_id_by_usuario", lambda usuario_id: 1)
+    client = flask_app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = "1"
+        session["_fresh"] = True
+    return client
+
+
+# Catálogo do MySQL em memória (tabelas produtos e persona_ia), interpretando as consultas que
+# app.models emite: as linhas são separadas por empresa_id como no índice único (empresa_id, codigo),
+# e um INSERT sem ON DUPLICATE KEY de um código já existente na empresa falha
+class CatalogDB:
+    def __init__(self):
+        self.produtos = {}
+        self.personas = {}
+        self.conns = []
+
+    def connect(self):
+        self.conns.append(CatalogConnection(self))
+        return self.conns[-1]
+
+    def catalogo(self, empresa_id):
+        return {codigo: dict(row) for (empresa, codigo), row in self.produtos.items() if empresa == empresa_id}
+
+
+class CatalogConnection(FakeConnection):
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+        self._snapshot = None
+
+    def cursor(self, dictionary=False, **kwargs):
+        return CatalogCursor(self, dictionary)
+
+    def begin_write(self):
+        if self._snapshot is None:
+            self._snapshot = (copy.deepcopy(self.db.produtos), copy.deepcopy(self.db.personas))
+
+    def commit(self):
+        super().commit()
+        self._snapshot = None
+
+    def rollback(self):
+        super().rollback()
+        if self._snapshot is not None:
+            self.db.produtos, self.db.personas = self._snapshot
+            self._snapshot = None
+
+
+class CatalogCursor(FakeCursor):
+    def execute(self, statement, params=None):
+        self.conn.statements.append((statement, params))
+        sql = " ".join(statement.split())
+        params = list(params or [])
+        self._rows = []
+        if sql.startswith("SELECT"):
+            colunas, tabela, filtro = re.match(r"SELECT (.+?) FROM (\w+) WHERE (.+)$", sql).groups()
+            rows = self._filtrar(tabela, filtro, params)
+            if colunas == "*":
+                self._rows = [dict(row) for row in rows]
+            else:
+                nomes = [nome.strip() for nome in colunas.split(",")]
+                self._rows = [{nome: row.get(nome) for nome in nomes} if self.dictionary else tuple(row.get(nome) for nome in nomes) for row in rows]
+        elif sql.startswith("INSERT INTO"):
+            self._inserir(sql, [params])
+        elif sql.startswith("DELETE FROM produtos"):
+            self.conn.begin_write()
+            for row in self._filtrar("produtos", sql.split(" WHERE ", 1)[1], params):
+                del self.conn.db.produtos[(row["empresa_id"], row["codigo"])]
+        elif sql.startswith("UPDATE persona_ia"):
+            self.conn.begin_write()
+            nomes = re.findall(r"(\w+) = %s", sql.split(" WHERE ")[0])
+            persona = self.conn.db.personas.get(params[-1])
+            if persona is not None:
+                persona.update(zip(nomes, params))
+        else:
+            raise AssertionError(f"consulta inesperada: {sql}")
+        self.rowcount = len(self._rows)
+
+    def executemany(self, statement, rows):
+        rows = list(rows)
+        self.conn.statements.append((statement, rows))
+        self._inserir(" ".join(statement.split()), rows)
+        self.rowcount = len(rows)
+
+    def _filtrar(self, tabela, filtro, params):
+        if tabela == "persona_ia":
+            persona = self.conn.db.personas.get(params[0])
+            return [persona] if persona else []
+        assert filtro.startswith("empresa_id = %s"), filtro
+        codigos = set(params[1:]) if " codigo IN " in filtro else None
+        return [row for (empresa, codigo), row in sorted(self.conn.db.produtos.items())
+                if empresa == params[0] and (codigos is None or codigo in codigos)]
+
+    def _inserir(self, sql, rows):
+        tabela, colunas = re.match(r"INSERT INTO (\w+) \((.+?)\) VALUES", sql).groups()
+        nomes = [nome.strip() for nome in colunas.split(",")]
+        self.conn.begin_write()
+        for valores in rows:
+            row = dict(zip(nomes, valores))
+            if tabela == "persona_ia":
+                self.conn.db.personas[row["empresa_id"]] = row
+                continue
+            chave = (row["empresa_id"], row["codigo"])
+            if chave in self.conn.db.produtos and "ON DUPLICATE KEY UPDATE" not in sql:
+                raise ValueError(f"Duplicate entry '{chave}' for key 'uk_produtos_empresa_codigo'")
+            self.conn.db.produtos[chave] = row
+
+
+@pytest.fixture
+def catalog_db(monkeypatch):
+    from app import models
+    db = CatalogDB()
+    monkeypatch.setattr(models, "connect_db", db.connect)
+    for cache in models._entity_caches.values():
+        cache.clear()
+    models._product_indexes.clear()
+    return db
@@ -0,0 +1,164 @@
+import gzip
+import json
+import re
+import pytest
+from app import assets
+from script import build_assets
+
+MANIFEST = {
+    "bundles": {"forms.js": "forms.0123456789ab.js", "base.css": "base.0123456789ab.css"},
+    "files": {"images/logo.svg": "images/logo.0123456789ab.svg"},
+    "images": {"images/foto.png": {
+        "src": "images/foto.0123456789ab.png", "width": 80, "height": 40,
+        "webp": [[40, "images/foto.40w.0123456789ab.webp"], [80, "images/foto.80w.0123456789ab.webp"]],
+    }},
+}
+
+
+@pytest.fixture
+def dist(tmp_path, monkeypatch):
+    dist = tmp_path / "dist"
+    dist.mkdir()
+    monkeypatch.setattr(assets, "DIST_DIR", str(dist))
+    assets.reload_manifest()
+    yield dist
+    monkeypatch.undo()
+    assets.reload_manifest()
+
+
+def _with_manifest(dist, manifest=MANIFEST):
+    (dist / assets.MANIFEST_NAME).write_text(json.dumps(manifest), encoding="utf-8")
+    assets.reload_manifest()
+
+
+def test_without_manifest_falls_back_to_cdn_and_static(flask_app, dist):
+    with flask_app.test_request_context():
+        tags = str(assets.asset_tags("forms.js", defer=True))
+        assert re.findall(r'src="([^"]+)"', tags) == list(assets.BUNDLES["forms.js"])
+        assert tags.count(" defer") == 2
+        assert str(assets.asset_tags("base.css")).count('rel="stylesheet"') == 3
+        assert assets.asset_url("images/logo.svg") == "/static/images/logo.svg"
+        assert str(assets.image_tag("images/foto.png", "Foto")) == '<img src="/static/images/foto.png" alt="Foto" loading="lazy" decoding="async">'
+
+
+def test_manifest_points_to_hashed_files(flask_app, dist):
+    _with_manifest(dist)
+    with flask_app.test_request_context():
+        assert str(assets.asset_tags("forms.js")) == '<script src="/assets/forms.0123456789ab.js"></script>'
+        assert assets.asset_url("images/logo.svg") == "/assets/images/logo.0123456789ab.svg"
+        # Arquivo fora do build continua vindo de /static
+        assert assets.asset_url("images/outro.svg") == "/static/images/outro.svg"
+        tag = str(assets.image_tag("images/foto.png", 'Foto "A"', sizes="40px", lazy=False))
+        assert 'srcset="/assets/images/foto.40w.0123456789ab.webp 40w, /assets/images/foto.80w.0123456789ab.webp 80w"' in tag
+        assert 'src="/assets/images/foto.0123456789ab.png" alt="Foto &#34;A&#34;" width="80" height="40">' in tag
+        assert "loading" not in tag
+
+
+def test_base_url_prefixes_hashed_files(flask_app, dist, monkeypatch):
+    _with_manifest(dist)
+    monkeypatch.setattr(assets, "BASE_URL", "https://cdn.example.com/assets")
+    with flask_app.test_request_context():
+        assert assets.asset_url("images/logo.svg") == "https://cdn.example.com/assets/images/logo.0123456789ab.svg"
+
+
+def test_invalid_manifest_falls_back(flask_app, dist):
+    (dist / assets.MANIFEST_NAME).write_text("{quebrado", encoding="utf-8")
+    assert assets.reload_manifest() == {}
+
+
+@pytest.fixture
+def bundle(dist):
+    (dist / "app.0123456789ab.js").write_bytes(b"console.log('original');")
+    (dist / "app.0123456789ab.js.gz").write_bytes(b"gzip")
+    (dist / "app.0123456789ab.js.br").write_bytes(b"brotli")
+    return "/assets/app.0123456789ab.js"
+
+
+@pytest.mark.parametrize("accept, body, encoding", [
+    ("gzip, deflate, br", b"brotli", "br"),
+    ("gzip", b"gzip", "gzip"),
+    ("", b"console.log('original');", None),
+    ("br;q=0, gzip", b"gzip", "gzip"),
+])
+def test_serve_picks_precompressed_file(flask_app, bundle, accept, body, encoding):
+    response = flask_app.test_client().get(bundle, headers={"Accept-Encoding": accept})
+    assert response.status_code == 200
+    assert response.data == body
+    assert response.headers.get("Content-Encoding") == encoding
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.mimetype == "text/javascript"
+    assert response.cache_control.immutable and response.cache_control.public
+    assert response.cache_control.max_age == assets.MAX_AGE
+
+
+def test_serve_without_compressed_version_sends_original(flask_app, dist):
+    (dist / "logo.0123456789ab.png").write_bytes(b"\x89PNG")
+    response = flask_app.test_client().get("/assets/logo.0123456789ab.png", headers={"Accept-Encoding": "br, gzip"})
+    assert response.data == b"\x89PNG"
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+
+
+def test_manifest_is_not_served(flask_app, dist):
+    _with_manifest(dist)
+    assert flask_app.test_client().get("/assets/manifest.json").status_code == 404
+
+
+@pytest.mark.parametrize("path", ["/assets/../segredo.txt", "/assets/%2e%2e/segredo.txt", "/assets/..%2fsegredo.txt", "/assets/nao-existe.js"])
+def test_paths_outside_dist_are_not_found(flask_app, dist, path):
+    (dist.parent / "segredo.txt").write_text("segredo")
+    response = flask_app.test_client().get(path)
+    assert response.status_code == 404
+    assert b"segredo" not in response.data
+
+
+def test_build_writes_hashed_bundles_and_manifest(tmp_path, monkeypatch):
+    static = tmp_path / "static"
+    (static / "images").mkdir(parents=True)
+    (static / "images" / "logo.svg").write_text("<svg>" + " " * 200 + "</svg>")
+    css = "body{font-family:Inter}\n@font-face{src:url(fonts/inter.woff2)}\n/*# sourceMappingURL=x.map */"
+    remoto = {
+        "https://cdn.example.com/a.css": css.encode(),
+        "https://cdn.example.com/fonts/inter.woff2": b"woff2",
+        "https://cdn.example.com/a.js": b"var a = 1;\n" * 50,
+        "https://cdn.example.com/b.js": b"var b = 2",
+    }
+    monkeypatch.setattr(assets, "STATIC_DIR", str(static))
+    monkeypatch.setattr(build_assets, "IMAGES_DIR", str(static / "images"))
+    monkeypatch.setattr(assets, "BUNDLES", {"base.css": ("https://cdn.example.com/a.css",), "forms.js": ("https://cdn.example.com/a.js", "https://cdn.example.com/b.js")})
+    monkeypatch.setattr(build_assets, "fetch", lambda url, offline=False: remoto[url])
+    output = tmp_path / "dist"
+
+    manifest = build_assets.Builder(str(output), offline=True).build()
+    assert re.fullmatch(r"forms\.[0-9a-f]{12}\.js", manifest["bundles"]["forms.js"])
+    assert re.fullmatch(r"images/logo\.[0-9a-f]{12}\.svg", manifest["files"]["images/logo.svg"])
+    assert json.loads((output / "manifest.json").read_text()) == manifest
+
+    forms = output / manifest["bundles"]["forms.js"]
+    assert forms.read_bytes() == (b"var a = 1;\n" * 50).strip() + b";\nvar b = 2\n"
+    assert gzip.decompress((output / (manifest["bundles"]["forms.js"] + ".gz")).read_bytes()) == forms.read_bytes()
+    base = (output / manifest["bundles"]["base.css"]).read_text()
+    fonte = re.search(r'url\("(fonts/inter\.[0-9a-f]{12}\.woff2)"\)', base).group(1)
+    assert (output / fonte).read_bytes() == b"woff2"
+    assert "sourceMappingURL" not in base
+
+    # Mesmo conteúdo, mesmos nomes; o clean apaga só o que saiu do build
+    (output / "forms.000000000000.js").write_bytes(b"antigo")
+    builder = build_assets.Builder(str(output), offline=True)
+    assert builder.build() == manifest
+    assert builder.clean() == 1
+    assert not (output / "forms.000000000000.js").exists()
+
+
+def test_build_makes_webp_variants(tmp_path, monkeypatch):
+    image_module = pytest.importorskip("PIL.Image")
+    static = tmp_path / "static"
+    (static / "images").mkdir(parents=True)
+    image_module.new("RGB", (100, 50)).save(static / "images" / "foto.png")
+    monkeypatch.setattr(assets, "STATIC_DIR", str(static))
+    monkeypatch.setattr(build_assets, "IMAGES_DIR", str(static / "images"))
+    monkeypatch.setattr(assets, "BUNDLES", {})
+    manifest = build_assets.Builder(str(tmp_path / "dist")).build()
+    image = manifest["images"]["images/foto.png"]
+    assert (image["width"], image["height"]) == (100, 50)
+    assert [width for width, _ in image["webp"]] == [40, 80, 100]
@@ -0,0 +1,67 @@
+import pytest
+from werkzeug.security import generate_password_hash
+import app as app_module
+from app import auth, create_app, models
+from tests.conftest import FakeConnection
+
+USUARIO = {"id": 1, "nome": "Teste", "email": "teste@example.com", "plano": "Plus",
+           "senha_hash": generate_password_hash("certa")}
+
+
+@pytest.fixture(autouse=True)
+def limiters(monkeypatch):
+    monkeypatch.setattr(auth, "_email_limiter", auth.AttemptLimiter(3))
+    monkeypatch.setattr(auth, "_ip_limiter", auth.AttemptLimiter(2))
+
+
+@pytest.fixture
+def db(monkeypatch):
+    conns = []
+
+    def connect():
+        conns.append(FakeConnection(results=[[dict(USUARIO)]]))
+        return conns[-1]
+
+    monkeypatch.setattr(models, "connect_db", connect)
+    return conns
+
+
+def test_default_matches_existing_werkzeug_hashes():
+    assert not auth.needs_rehash(USUARIO["senha_hash"])
+    assert auth.hash_password("x").startswith("scrypt:32768:8:1$")
+
+
+def test_rehash_when_parameters_differ_in_either_direction():
+    assert auth.needs_rehash("scrypt:16384:8:1$salt$hash")
+    assert auth.needs_rehash("scrypt:65536:8:1$salt$hash")
+    assert auth.needs_rehash("scrypt:32768:16:1$salt$hash")
+    assert auth.needs_rehash("pbkdf2:sha256:600000$salt$hash")
+    assert auth.needs_rehash("$2b$12$" + "a" * 53)
+
+
+def test_verify_password_flags_rehash_only_when_correct():
+    old_hash = generate_password_hash("certa", method="pbkdf2:sha256:1000")
+    assert auth.verify_password(old_hash, "certa") == (True, True)
+    assert auth.verify_password(old_hash, "errada") == (False, False)
+
+
+def test_login_is_blocked_after_failures_per_email(flask_app, db, monkeypatch):
+    monkeypatch.setattr(auth, "_ip_limiter", auth.AttemptLimiter(10))
+    client = flask_app.test_client()
+    for _ in range(3):
+        assert client.post("/login", json={"email": "teste@example.com", "senha": "errada"}).status_code == 401
+    response = client.post("/login", json={"email": "teste@example.com", "senha": "certa"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert len(db) == 3
+
+
+def test_ip_limit_uses_forwarded_address_behind_proxy(monkeypatch, db):
+    monkeypatch.setattr(app_module, "TRUSTED_PROXIES", 1)
+    client = create_app().test_client()
+    for email in ("a@example.com", "b@example.com"):
+        client.post("/login", json={"email": email, "senha": "errada"}, headers={"X-Forwarded-For": "203.0.113.1"})
+    blocked = client.post("/login", json={"email": "c@example.com", "senha": "errada"}, headers={"X-Forwarded-For": "203.0.113.1"})
+    other = client.post("/login", json={"email": "teste@example.com", "senha": "certa"}, headers={"X-Forwarded-For": "203.0.113.2"})
+    assert blocked.status_code == 429
+    assert other.status_code == 200
@@ -0,0 +1,54 @@
+import pytest
+from mysql.connector.errors import PoolError
+from database import connection
+from tests.conftest import FakeConnection
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    conns = []
+
+    def open_connection():
+        conns.append(FakeConnection())
+        return conns[-1]
+
+    monkeypatch.setattr(connection, "_open_connection", open_connection)
+    return conns
+
+
+def test_close_returns_connection_to_pool(opened):
+    pool = connection.ConnectionPool(size=2, timeout=0.1)
+    conn = pool.get()
+    conn.close()
+    pool.get().close()
+    assert len(opened) == 1
+    assert pool.stats()["checkouts"] == 2
+    assert pool.stats()["in_use"] == 0
+
+
+def test_release_rolls_back_open_transaction(opened):
+    pool = connection.ConnectionPool(size=1, timeout=0.1)
+    conn = pool.get()
+    conn.start_transaction()
+    conn.close()
+    assert opened[0].rollbacks == 1
+    with pytest.raises(PoolError):
+        conn.cursor()
+
+
+def test_get_times_out_when_pool_is_exhausted(opened):
+    pool = connection.ConnectionPool(size=1, timeout=0.05)
+    pool.get()
+    with pytest.raises(PoolError):
+        pool.get()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_unhealthy_idle_connection_is_replaced(opened):
+    pool = connection.ConnectionPool(size=1, timeout=0.1, ping_interval=0)
+    pool.get().close()
+    opened[0].ping_ok = False
+    pool.get().close()
+    assert len(opened) == 2
+    assert opened[0].closed
+    assert pool.stats()["health_check_failures"] == 1
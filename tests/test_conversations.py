@@ -0,0 +1,157 @@
+import json
+import time
+import uuid
+import pytest
+from app import conversations
+from app.conversations import Conversation, ConversationStore
+
+
+@pytest.fixture
+def stores():
+    created = []
+
+    def make(**kwargs):
+        kwargs.setdefault("flush_interval", 3600)
+        created.append(ConversationStore(**kwargs))
+        return created[-1]
+
+    yield make
+    for store in created:
+        store.close()
+
+
+@pytest.fixture
+def key():
+    return conversations.conversation_key(1, f"+55{uuid.uuid4().int % 10**11:011d}")
+
+
+def _row(key):
+    return conversations._db().execute("SELECT messages, summary, version FROM conversations WHERE key = ?", (key,)).fetchone()
+
+
+def test_ring_buffer_keeps_last_messages_and_summarizes_questions(monkeypatch):
+    monkeypatch.setattr(conversations, "MAX_MESSAGES", 4)
+    conversation = Conversation()
+    for i in range(3):
+        conversation.append("user", f"pergunta {i}")
+        conversation.append("assistant", f"resposta {i}")
+    assert [m["content"] for m in conversation.messages] == ["pergunta 1", "resposta 1", "pergunta 2", "resposta 2"]
+    assert conversation.summary == "pergunta 0"
+    assert conversation.version == 6
+    conversation.append("user", "pergunta 3")
+    assert conversation.summary == "pergunta 0; pergunta 1"
+
+
+def test_summary_is_capped(monkeypatch):
+    monkeypatch.setattr(conversations, "MAX_MESSAGES", 2)
+    monkeypatch.setattr(conversations, "SUMMARY_MAX_CHARS", 30)
+    conversation = Conversation()
+    for i in range(10):
+        conversation.append("user", f"assunto número {i}")
+        conversation.append("assistant", "ok")
+    assert len(conversation.summary) == 30
+    assert conversation.summary.endswith("assunto número 8")
+
+
+def test_history_fits_token_budget_and_starts_with_a_question():
+    conversation = Conversation([
+        {"role": "user", "content": "a" * 40},
+        {"role": "assistant", "content": "b" * 40},
+        {"role": "user", "content": "c" * 40},
+        {"role": "assistant", "content": "d" * 40},
+    ])
+    assert conversation.history(token_budget=1000) == list(conversation.messages)
+    # 11 tokens por mensagem: cabem as 3 últimas, mas a primeira delas é uma resposta
+    assert [m["content"][0] for m in conversation.history(token_budget=33)] == ["c", "d"]
+    assert conversation.history(token_budget=5) == []
+
+
+def test_history_puts_summary_first_only_if_it_fits():
+    conversation = Conversation([{"role": "user", "content": "x" * 40}], summary="frete; prazo")
+    history = conversation.history(token_budget=1000)
+    assert history[0] == {"role": "system", "content": "Assuntos anteriores desta conversa: frete; prazo"}
+    assert history[1:] == [{"role": "user", "content": "x" * 40}]
+    assert conversation.history(token_budget=11) == [{"role": "user", "content": "x" * 40}]
+
+
+def test_messages_are_written_behind_in_batches(stores, key):
+    store = stores()
+    other = key + "-2"
+    store.append(key, ("user", "oi"), ("assistant", "olá"))
+    store.append(other, ("user", "tem café?"), ("assistant", "tem"))
+    assert _row(key) is None
+    assert store.stats()["dirty"] == 2
+    store.flush()
+    row = _row(key)
+    assert [m["content"] for m in json.loads(row["messages"])] == ["oi", "olá"]
+    assert row["version"] == 2
+    stats = store.stats()
+    assert (stats["flushes"], stats["written"], stats["dirty"]) == (1, 2, 0)
+    # Sem mudanças, a próxima gravação não escreve nada
+    store.flush()
+    assert store.stats()["flushes"] == 1
+
+
+def test_failed_write_keeps_conversations_dirty(stores, key, monkeypatch):
+    store = stores()
+    store.append(key, ("user", "oi"), ("assistant", "olá"))
+    monkeypatch.setattr(store, "_write", lambda items: (_ for _ in ()).throw(OSError("disco cheio")))
+    store.flush()
+    assert store.stats()["dirty"] == 1
+    monkeypatch.undo()
+    store.flush()
+    assert _row(key)["version"] == 2
+
+
+def test_newer_version_from_another_process_is_reloaded(stores, key):
+    a, b = stores(), stores()
+    assert b.history(key) == []
+    a.append(key, ("user", "quanto custa?"), ("assistant", "R$ 10"))
+    a.flush()
+    assert [m["content"] for m in b.history(key)] == ["quanto custa?", "R$ 10"]
+    assert b.stats()["reloads"] == 1
+    # Mesma versão: não relê
+    b.history(key)
+    assert b.stats()["reloads"] == 1
+
+
+def test_unsaved_local_messages_are_not_replaced_by_reload(stores, key):
+    a, b = stores(), stores()
+    b.append(key, ("user", "local"), ("assistant", "ok"))
+    a.append(key, ("user", "remota 1"), ("assistant", "ok"), ("user", "remota 2"), ("assistant", "ok"))
+    a.flush()
+    assert b.history(key)[0]["content"] == "local"
+    # A versão mais nova no SQLite não é sobrescrita por uma gravação mais antiga
+    b.flush()
+    assert _row(key)["version"] == 4
+
+
+def test_idle_conversations_leave_memory_after_flush(stores, key):
+    store = stores(idle_ttl=0.01)
+    store.append(key, ("user", "oi"), ("assistant", "olá"))
+    time.sleep(0.02)
+    store.flush()
+    stats = store.stats()
+    assert (stats["active"], stats["evicted_idle"]) == (0, 1)
+    assert _row(key)["version"] == 2
+    assert store.history(key)[0]["content"] == "oi"
+
+
+def test_least_recently_used_conversation_is_evicted_and_saved(stores, key):
+    store = stores(max_active=2)
+    store.append(key + "-a", ("user", "a"), ("assistant", "ok"))
+    store.append(key + "-b", ("user", "b"), ("assistant", "ok"))
+    store.history(key + "-a")
+    store.history(key + "-c")
+    stats = store.stats()
+    assert (stats["active"], stats["evicted_lru"]) == (2, 1)
+    # A conversa "b" tinha mensagens não gravadas: foi gravada ao sair da memória
+    assert _row(key + "-b")["version"] == 2
+    assert _row(key + "-a") is None
+
+
+def test_disabled_memory_returns_empty_history(monkeypatch):
+    monkeypatch.setattr(conversations, "ENABLED", False)
+    conversations.record_turn(1, "+5511999999999", "oi", "olá")
+    assert conversations.history(1, "+5511999999999") == []
+    assert conversations.conversation_stats() == {"enabled": False}
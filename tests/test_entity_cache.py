@@ -0,0 +1,58 @@
+import pytest
+from app import models
+from app.cache import TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1, ttl=0)
+    assert cache.get("a", "ausente") == "ausente"
+
+
+def test_lookup_is_cached_including_not_found(monkeypatch):
+    calls = []
+
+    def fetch(user_id):
+        calls.append(user_id)
+        return None
+
+    monkeypatch.setattr(models, "_fetch_usuario", fetch)
+    assert models.get_usuario_by_id(9001) is None
+    assert models.get_usuario_by_id(9001) is None
+    assert calls == [9001]
+    models.invalidate_lookup("usuario", "9001")
+    models.get_usuario_by_id(9001)
+    assert calls == [9001, 9001]
+
+
+def test_database_errors_are_not_cached(monkeypatch):
+    calls = []
+
+    def fetch(usuario_id):
+        calls.append(usuario_id)
+        if len(calls) == 1:
+            raise ConnectionError("MySQL fora do ar")
+        return 7
+
+    monkeypatch.setattr(models, "_fetch_empresa_id", fetch)
+    assert models.get_empresa_id_by_usuario(9002) is None
+    assert models.get_empresa_id_by_usuario(9002) == 7
+    assert models.get_empresa_id_by_usuario(9002) == 7
+    assert len(calls) == 2
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    for cache in models._entity_caches.values():
+        cache.clear()
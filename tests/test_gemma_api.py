@@ -0,0 +1,56 @@
+import asyncio
+import socket
+import pytest
+from model import gemma_api
+
+MESSAGES = [{"role": "user", "content": "qual o horário?"}]
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = gemma_api.FakeLLMServer().start()
+    yield server
+    server.stop()
+
+
+def _closed_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_complete_and_stream(server):
+    client = gemma_api.LLMClient(gemma_api.fake_backend(server.url))
+    try:
+        assert client.complete(MESSAGES) == "Resposta simulada: qual o horário?"
+        assert "".join(client.stream(MESSAGES)).strip() == "Resposta simulada: qual o horário?"
+    finally:
+        client.close()
+
+
+def test_async_complete(server):
+    async def run():
+        client = gemma_api.AsyncLLMClient(gemma_api.fake_backend(server.url))
+        try:
+            return await client.complete(MESSAGES)
+        finally:
+            await client.close()
+
+    assert asyncio.run(run()) == "Resposta simulada: qual o horário?"
+
+
+def test_connection_error_becomes_llm_error():
+    client = gemma_api.LLMClient(gemma_api.fake_backend(f"http://127.0.0.1:{_closed_port()}"), connect_timeout=0.5)
+    try:
+        with pytest.raises(gemma_api.LLMError):
+            client.complete(MESSAGES)
+    finally:
+        client.close()
+
+
+def test_missing_api_key_is_a_config_error(monkeypatch):
+    monkeypatch.delenv("DEEPSEEK_API_KEY", raising=False)
+    with pytest.raises(gemma_api.LLMConfigError):
+        gemma_api.deepseek_backend().headers()
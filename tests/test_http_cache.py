@@ -0,0 +1,56 @@
+import pytest
+from app import data_versions, http_cache
+from app.models import Usuario
+
+
+@pytest.fixture(autouse=True)
+def clear_pages():
+    http_cache._pages.clear()
+
+
+def _render(calls, text):
+    def render():
+        calls.append(text)
+        return f"<p>{text}</p>"
+    return render
+
+
+def test_page_is_reused_until_company_data_changes():
+    calls = []
+    first = http_cache.cached_page("pagina", 301, _render(calls, "a"))
+    assert http_cache.cached_page("pagina", 301, _render(calls, "a")) == first
+    data_versions.bump(301)
+    second = http_cache.cached_page("pagina", 301, _render(calls, "b"))
+    assert calls == ["a", "b"]
+    assert second[1] != first[1]
+
+
+def test_user_pages_are_not_shared_between_users():
+    calls = []
+    ana = Usuario(1, "Ana", "ana@example.com", "Plus")
+    bia = Usuario(2, "Bia", "bia@example.com", "Plus")
+    assert http_cache.cached_page("pagina", 302, _render(calls, "Ana"), usuario=ana)[0] == "<p>Ana</p>"
+    assert http_cache.cached_page("pagina", 302, _render(calls, "Bia"), usuario=bia)[0] == "<p>Bia</p>"
+    ana.plano = "Enterprise"
+    assert http_cache.cached_page("pagina", 302, _render(calls, "Ana Enterprise"), usuario=ana)[0] == "<p>Ana Enterprise</p>"
+    assert calls == ["Ana", "Bia", "Ana Enterprise"]
+
+
+def test_company_page_answers_304_when_unchanged(logged_client):
+    first = logged_client.get("/acoes")
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    etag = first.headers["ETag"]
+    second = logged_client.get("/acoes", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.data == b""
+    data_versions.bump(1)
+    assert logged_client.get("/acoes", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_download_template_answers_304(logged_client):
+    first = logged_client.get("/download_csv_template")
+    assert first.status_code == 200
+    assert "attachment" in first.headers["Content-Disposition"]
+    second = logged_client.get("/download_csv_template", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 304
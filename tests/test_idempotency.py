@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+from app import idempotency, message_queue, routes, twilio_sender
+from app.twilio_sender import FakeTwilioServer
+
+
+@pytest.fixture(autouse=True)
+def empty_queue():
+    conn = message_queue._db()
+    conn.execute("DELETE FROM jobs")
+    conn.execute("DELETE FROM message_keys")
+    idempotency._memory.clear()
+
+
+def _jobs():
+    return message_queue._db().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+def _webhook(client, sid):
+    data = {"Body": "oi", "From": "whatsapp:+5511999990000", "To": "whatsapp:+14155238886"}
+    if sid:
+        data["MessageSid"] = sid
+    return client.post("/webhook", data=data)
+
+
+def test_redelivery_gets_the_first_job(flask_app):
+    client = flask_app.test_client()
+    first = _webhook(client, "SM1").get_json()
+    again = _webhook(client, "SM1").get_json()
+    assert again["duplicate"] is True
+    assert again["job_id"] == first["job_id"]
+    assert _jobs() == 1
+
+
+def test_redelivery_to_another_process_uses_the_shared_keys(flask_app):
+    client = flask_app.test_client()
+    first = _webhook(client, "SM2").get_json()
+    # Outro worker do gunicorn não tem a chave na memória
+    idempotency._memory.clear()
+    again = _webhook(client, "SM2").get_json()
+    assert again["job_id"] == first["job_id"]
+    assert idempotency.dedup_stats()["duplicates_shared"] >= 1
+    assert _jobs() == 1
+
+
+def test_messages_without_sid_are_not_deduplicated(flask_app):
+    client = flask_app.test_client()
+    assert _webhook(client, None).status_code == 200
+    assert _webhook(client, None).status_code == 200
+    assert _jobs() == 2
+
+
+def test_retry_resumes_after_the_segments_already_sent(monkeypatch):
+    server = FakeTwilioServer().start()
+    monkeypatch.setenv("TWILIO_API_URL", server.url)
+    monkeypatch.setenv("TWILIO_ACCOUNT_SID", "ACteste")
+    monkeypatch.setenv("TWILIO_AUTH_TOKEN", "token")
+    monkeypatch.setattr(twilio_sender, "_sender", None)
+    monkeypatch.setattr(routes.conversations, "record_turn", lambda *args: None)
+    monkeypatch.setattr(routes.generate_reports, "registrar_evento", lambda *args, **kwargs: None)
+
+    async def no_llm(*args):
+        raise AssertionError("a resposta já gerada deve ser reaproveitada")
+
+    monkeypatch.setattr(routes, "request_deepseek_completion_async", no_llm)
+    response = "\n\n".join(letra * 1000 for letra in "abc")
+    job_id = message_queue.enqueue("+5511999990000", {})
+    job = {"id": job_id, "progress": {"response": response, "segments_sent": 1}}
+
+    async def run():
+        message_queue._current_job.set(job)
+        await routes.process_webhook_message({"sender": "+5511999990000", "message": "oi", "empresa_id": 1})
+        await twilio_sender.get_sender().close_async()
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.stop()
+    assert [message["Body"] for message in server.messages] == ["b" * 1000, "c" * 1000]
+    assert job["progress"]["segments_sent"] == 3
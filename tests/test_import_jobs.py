@@ -0,0 +1,92 @@
+import asyncio
+import subprocess
+import sys
+import time
+import pytest
+from app import import_jobs
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def _job(status="running", owner_pid=None, age=0):
+    job_id = import_jobs.create_job(1, 1, "produtos.csv", update=False)
+    fields = {"status": status}
+    if owner_pid is not None:
+        fields["owner_pid"] = owner_pid
+    import_jobs._update_job(job_id, **fields)
+    if age:
+        import_jobs._db().execute("UPDATE import_jobs SET updated_at = ? WHERE id = ?", (time.time() - age, job_id))
+    return job_id
+
+
+def test_job_of_a_dead_process_is_marked_failed():
+    job_id = _job(owner_pid=_dead_pid())
+    job = import_jobs.get_job(job_id, 1)
+    assert job["status"] == "failed"
+    assert "encerrado" in job["message"]
+    assert "owner_pid" not in job
+
+
+def test_running_job_without_heartbeat_is_marked_failed(monkeypatch):
+    monkeypatch.setattr(import_jobs, "STALE_AFTER", 60)
+    stale = _job(age=120)
+    alive = _job(age=10)
+    queued = _job(status="queued", age=120)
+    assert import_jobs.reap_stale_jobs() >= 1
+    assert import_jobs.get_job(stale, 1)["status"] == "failed"
+    assert import_jobs.get_job(alive, 1)["status"] == "running"
+    # Na fila do pool, com o dono vivo, o job só espera a vez
+    assert import_jobs.get_job(queued, 1)["status"] == "queued"
+
+
+def test_job_events_stream_until_the_job_ends():
+    job_id = _job()
+
+    async def collect():
+        events = []
+        async for event in import_jobs.job_events(job_id, 1, interval=0.01, timeout=2):
+            events.append(event)
+            if len(events) == 1:
+                await asyncio.to_thread(import_jobs._update_job, job_id, status="done", stage="done")
+        return events
+
+    events = asyncio.run(collect())
+    assert len(events) == 2
+    assert '"status": "done"' in events[-1]
+
+
+def test_job_events_are_not_served_by_the_sync_app(logged_client):
+    job_id = _job()
+    assert logged_client.get(f"/jobs/{job_id}/events").status_code == 404
+    assert logged_client.get(f"/jobs/{job_id}").get_json()["job"]["status"] == "running"
+    assert b"const jobEvents = false" in logged_client.get("/acoes").data
+
+
+def test_asgi_streams_job_events_to_the_logged_user(logged_client):
+    import asgi
+    job_id = _job(status="done")
+    cookie = logged_client.get_cookie("session")
+    sent = []
+
+    async def call(headers):
+        sent.clear()
+
+        async def receive():
+            await asyncio.sleep(10)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": f"/jobs/{job_id}/events", "headers": headers}
+        await asgi.app(scope, receive, send)
+        return sent[0]["status"], b"".join(message.get("body", b"") for message in sent[1:])
+
+    status, body = asyncio.run(call([(b"cookie", f"session={cookie.value}".encode())]))
+    assert status == 200
+    assert body.startswith(b"data: ") and b'"status": "done"' in body
+    assert asyncio.run(call([]))[0] == 401
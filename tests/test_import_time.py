@@ -0,0 +1,21 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from script import import_time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Roda a verificação do CI (script/import_time.py) num interpretador novo, como na partida do servidor
+@pytest.mark.parametrize("target", ["app", "asgi"])
+def test_import_stays_within_budget_without_heavy_modules(target):
+    result = subprocess.run(
+        [sys.executable, "-m", "script.import_time", "--target", target, "--json", "--runs", "3"],
+        capture_output=True, text=True, cwd=ROOT, timeout=120
+    )
+    data = json.loads(result.stdout)
+    assert data["forbidden_imported"] == []
+    assert data["total_ms"] <= import_time.DEFAULT_BUDGET_MS
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,144 @@
+import asyncio
+import pytest
+from app import llm_scheduler, message_queue, routes, twilio_sender
+from app.llm_scheduler import LLMScheduler, QuotaExceeded, TenantBusy
+from app.twilio_sender import FakeTwilioServer
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    def set_limits(plano, **values):
+        monkeypatch.setitem(llm_scheduler.PLANOS, plano, dict(llm_scheduler.PLANOS[plano], **values))
+    return set_limits
+
+
+def test_quota_is_disabled_by_default():
+    assert all(limites["tokens"] == 0 for limites in llm_scheduler.PLANOS.values())
+    assert llm_scheduler.plan_name("Básico") == "basico"
+    assert llm_scheduler.plan_name("desconhecido") == llm_scheduler.DEFAULT_PLAN
+
+
+def test_light_tenant_is_not_stuck_behind_a_flood():
+    scheduler = LLMScheduler(max_concurrency=1)
+    first, _ = scheduler._admit(401, "enterprise", 100, 100)
+    flood = [scheduler._admit(401, "enterprise", 100, 100)[1] for _ in range(5)]
+    _, light = scheduler._admit(402, "free", 100, 100)
+    scheduler._release(first)
+    # A empresa que chegou depois é atendida antes do resto da campanha
+    assert light.granted
+    assert not any(waiter.granted for waiter in flood)
+    scheduler._release(light.ticket)
+    assert flood[0].granted
+
+
+def test_tenant_concurrency_cap_leaves_slots_for_others(limits):
+    limits("free", concorrencia=1)
+    scheduler = LLMScheduler(max_concurrency=4)
+    scheduler._admit(403, "free", 10, 10)
+    _, waiter = scheduler._admit(403, "free", 10, 10)
+    _, other = scheduler._admit(404, "free", 10, 10)
+    assert waiter is not None
+    assert other is None
+    assert scheduler.in_flight == 2
+
+
+def test_full_tenant_queue_is_shed(limits):
+    limits("free", concorrencia=1, fila=1)
+    scheduler = LLMScheduler(max_concurrency=1)
+    scheduler._admit(405, "free", 10, 10)
+    scheduler._admit(405, "free", 10, 10)
+    with pytest.raises(TenantBusy):
+        scheduler._admit(405, "free", 10, 10)
+    assert scheduler.stats()["tenants"][0]["recusadas"] == 1
+
+
+def test_quota_is_enforced_and_shared_through_sync(limits):
+    limits("free", tokens=1000)
+    scheduler = LLMScheduler()
+    with scheduler.slot(406, "free", 300, 300) as ticket:
+        ticket.record("x" * 1200)
+    with pytest.raises(QuotaExceeded) as raised:
+        with scheduler.slot(406, "free", 300, 300):
+            pass
+    assert raised.value.retry_after > 0
+    assert scheduler.in_flight == 0
+    # Outro processo enxerga o uso depois da sincronização
+    scheduler.sync()
+    other = LLMScheduler()
+    other._tenant("406", "free")
+    other.sync()
+    assert other._tenants["406"].used() == 600
+    with pytest.raises(QuotaExceeded):
+        other._admit(406, "free", 300, 300)
+
+
+def test_wait_times_out_and_leaves_the_queue():
+    scheduler = LLMScheduler(max_concurrency=1, queue_timeout=0.05)
+    with scheduler.slot(407, "free", 10, 10):
+        with pytest.raises(TenantBusy):
+            with scheduler.slot(408, "free", 10, 10):
+                pass
+    assert scheduler.in_flight == 0
+    assert scheduler.stats()["waiting"] == 0
+
+
+def test_cancelled_waiter_gives_back_its_slot():
+    scheduler = LLMScheduler(max_concurrency=1)
+
+    async def hold(seconds):
+        async with scheduler.slot_async(409, "free", 10, 10):
+            await asyncio.sleep(seconds)
+
+    async def run():
+        holder = asyncio.create_task(hold(0.05))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold(0))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(holder, waiter, return_exceptions=True)
+
+    asyncio.run(run())
+    assert scheduler.in_flight == 0
+    assert scheduler.stats()["waiting"] == 0
+
+
+def test_over_quota_message_gets_the_fallback_reply(monkeypatch):
+    server = FakeTwilioServer().start()
+    monkeypatch.setenv("TWILIO_API_URL", server.url)
+    monkeypatch.setenv("TWILIO_ACCOUNT_SID", "ACteste")
+    monkeypatch.setenv("TWILIO_AUTH_TOKEN", "token")
+    monkeypatch.setattr(twilio_sender, "_sender", None)
+    eventos = []
+    monkeypatch.setattr(routes.conversations, "history", lambda *args: [])
+    monkeypatch.setattr(routes.response_cache, "lookup", lambda *args: None)
+    monkeypatch.setattr(routes.response_cache, "store", lambda *args: pytest.fail("o aviso não vai para o cache"))
+    monkeypatch.setattr(routes.generate_reports, "registrar_evento", lambda *args, **kwargs: eventos.append(kwargs))
+
+    async def produtos(*args):
+        return []
+
+    async def prompt(*args):
+        return None
+
+    async def over_quota(*args):
+        raise QuotaExceeded("free", 60)
+
+    monkeypatch.setattr(routes.prompts, "produtos_para_mensagem_async", produtos)
+    monkeypatch.setattr(routes.prompts, "get_prompt_async", prompt)
+    monkeypatch.setattr(routes, "request_deepseek_completion_async", over_quota)
+
+    async def run():
+        await routes.process_webhook_message({"sender": "+5511999990000", "message": "oi", "empresa_id": 1})
+        await twilio_sender.get_sender().close_async()
+
+    aviso = llm_scheduler.QUOTA_MESSAGE
+    try:
+        asyncio.run(run())
+        # Sem LLM_QUOTA_MESSAGE a mensagem fica sem resposta, mas ainda conta como falha
+        monkeypatch.setattr(llm_scheduler, "QUOTA_MESSAGE", "")
+        with pytest.raises(message_queue.PermanentJobError):
+            asyncio.run(routes.process_webhook_message({"sender": "+5511999990000", "message": "oi", "empresa_id": 1}))
+    finally:
+        server.stop()
+    assert [message["Body"] for message in server.messages] == [aviso]
+    assert [evento["sucesso"] for evento in eventos] == [False, False]
@@ -0,0 +1,53 @@
+import logging
+from app import logging_config
+from app.logging_config import SamplingFilter
+
+
+def _record(level, lineno=10):
+    return logging.LogRecord("app.models", level, "/app/models.py", lineno, "mensagem", None, None)
+
+
+def _passed(sampler, level, n, lineno=10):
+    return sum(sampler.filter(_record(level, lineno)) for _ in range(n))
+
+
+def test_info_is_never_sampled_by_default():
+    sampler = SamplingFilter(burst=3, interval=60)
+    assert _passed(sampler, logging.INFO, 50) == 50
+    assert _passed(sampler, logging.WARNING, 50) == 50
+
+
+def test_debug_is_limited_per_call_site():
+    sampler = SamplingFilter(burst=3, interval=60)
+    assert _passed(sampler, logging.DEBUG, 10) == 3
+    # Outro ponto do código tem a própria janela
+    assert _passed(sampler, logging.DEBUG, 10, lineno=20) == 3
+
+
+def test_suppressed_count_goes_to_the_next_record(monkeypatch):
+    agora = [100.0]
+    monkeypatch.setattr(logging_config.time, "monotonic", lambda: agora[0])
+    sampler = SamplingFilter(burst=2, interval=1)
+    assert _passed(sampler, logging.DEBUG, 5) == 2
+    agora[0] += 1
+    record = _record(logging.DEBUG)
+    assert sampler.filter(record)
+    assert record.suppressed == 3
+
+
+def test_level_can_include_info():
+    sampler = SamplingFilter(burst=2, interval=60, level="INFO")
+    assert _passed(sampler, logging.INFO, 10) == 2
+    assert _passed(sampler, logging.WARNING, 10) == 10
+
+
+def test_zero_burst_disables_sampling():
+    sampler = SamplingFilter(burst=0, interval=60)
+    assert _passed(sampler, logging.DEBUG, 50) == 50
+
+
+def test_root_handler_keeps_every_info_record():
+    logging_config.setup_logging()
+    handler = next(h for h in logging.getLogger().handlers if isinstance(h, logging_config._RequestQueueHandler))
+    record = _record(logging.INFO, lineno=30)
+    assert all(handler.filter(record) for _ in range(logging_config.LOG_SAMPLE_BURST * 3))
@@ -0,0 +1,150 @@
+import asyncio
+import time
+import pytest
+from app import message_queue
+
+
+@pytest.fixture(autouse=True)
+def empty_queue():
+    conn = message_queue._db()
+    conn.execute("DELETE FROM jobs")
+    conn.execute("DELETE FROM message_keys")
+
+
+def _job(job_id):
+    return message_queue._db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+# Roda o leitor e os workers do pool no event loop do teste por `timeout` segundos (sem deixar
+# a thread do pool viva)
+def _run_worker(handler, timeout=0.5, concurrency=1):
+    pool = message_queue.WorkerPool(handler, concurrency=concurrency)
+    pool.loop.close()
+
+    async def run():
+        try:
+            await asyncio.wait_for(pool._serve(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(run())
+
+
+def test_claim_keeps_order_per_sender():
+    first = message_queue.enqueue("+5511", {"message": "1"})
+    message_queue.enqueue("+5511", {"message": "2"})
+    other = message_queue.enqueue("+5522", {"message": "3"})
+    claimed = [message_queue.claim("w1"), message_queue.claim("w2"), message_queue.claim("w3")]
+    # A segunda mensagem do mesmo remetente espera a primeira terminar
+    assert [job["id"] for job in claimed if job] == [first, other]
+    assert claimed[2] is None
+
+
+def test_transient_failure_is_retried_with_backoff():
+    job_id = message_queue.enqueue("+5511", {"message": "oi"})
+    job = message_queue.claim("w1")
+    message_queue.fail(job, RuntimeError("timeout"))
+    row = _job(job_id)
+    assert row["status"] == "pending"
+    assert row["attempts"] == 1
+    assert row["available_at"] > time.time()
+    assert message_queue.claim("w1") is None
+
+
+def test_permanent_failure_is_not_retried():
+    job_id = message_queue.enqueue("+5511", {"message": "oi"})
+    message_queue.fail(message_queue.claim("w1"), message_queue.PermanentJobError("sem credenciais"), permanent=True)
+    row = _job(job_id)
+    assert row["status"] == "failed"
+    assert row["attempts"] == 1
+
+
+def test_failure_after_max_attempts_is_final(monkeypatch):
+    monkeypatch.setattr(message_queue, "RETRY_BASE", 0)
+    job_id = message_queue.enqueue("+5511", {"message": "oi"})
+    for _ in range(message_queue.MAX_ATTEMPTS):
+        message_queue.fail(message_queue.claim("w1"), RuntimeError("erro"))
+    assert _job(job_id)["status"] == "failed"
+    assert _job(job_id)["attempts"] == message_queue.MAX_ATTEMPTS
+
+
+def test_worker_classifies_handler_errors(monkeypatch):
+    monkeypatch.setattr(message_queue, "RETRY_BASE", 60)
+
+    async def handler(payload):
+        if payload["kind"] == "permanent":
+            raise message_queue.PermanentJobError("não adianta repetir")
+        if payload["kind"] == "transient":
+            raise ConnectionError("rede")
+
+    ok = message_queue.enqueue("+551", {"kind": "ok"})
+    permanent = message_queue.enqueue("+552", {"kind": "permanent"})
+    transient = message_queue.enqueue("+553", {"kind": "transient"})
+    _run_worker(handler)
+    assert _job(ok)["status"] == "done"
+    assert _job(permanent)["status"] == "failed"
+    assert _job(permanent)["attempts"] == 1
+    row = _job(transient)
+    assert row["status"] == "pending"
+    assert row["attempts"] == 1
+    assert "rede" in row["last_error"]
+
+
+def test_progress_is_kept_between_attempts():
+    job_id = message_queue.enqueue("+5511", {"message": "oi"})
+    job = message_queue.claim("w1")
+    token = message_queue._current_job.set(job)
+    try:
+        message_queue.save_progress(response="resposta", segments_sent=1)
+    finally:
+        message_queue._current_job.reset(token)
+    message_queue._db().execute("UPDATE jobs SET status = 'pending' WHERE id = ?", (job_id,))
+    assert message_queue.claim("w1")["progress"] == {"response": "resposta", "segments_sent": 1}
+
+
+def test_stuck_job_counts_as_an_attempt_and_eventually_fails(monkeypatch):
+    monkeypatch.setattr(message_queue, "VISIBILITY_TIMEOUT", 0)
+    job_id = message_queue.enqueue("+5511", {"message": "trava o worker"})
+    for attempt in range(1, message_queue.MAX_ATTEMPTS):
+        assert message_queue.claim("w1")["id"] == job_id
+        time.sleep(0.01)
+        message_queue.housekeeping()
+        assert _job(job_id)["status"] == "pending"
+        assert _job(job_id)["attempts"] == attempt
+    message_queue.claim("w1")
+    time.sleep(0.01)
+    message_queue.housekeeping()
+    assert _job(job_id)["status"] == "failed"
+    assert _job(job_id)["attempts"] == message_queue.MAX_ATTEMPTS
+
+
+def test_idle_pool_backs_off_and_uses_a_single_reader(monkeypatch):
+    claims = []
+    claim = message_queue.claim
+    monkeypatch.setattr(message_queue, "POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(message_queue, "POLL_MAX", 0.2)
+    monkeypatch.setattr(message_queue, "claim", lambda worker_id: claims.append(worker_id) or claim(worker_id))
+
+    async def handler(payload):
+        pass
+
+    _run_worker(handler, timeout=0.6, concurrency=8)
+    # 8 workers com leitura fixa a cada 0,05 s fariam ~96 leituras; com um leitor e backoff, poucas
+    assert len(claims) <= 6
+    assert len(set(claims)) == 1
+
+
+def test_pool_processes_jobs_concurrently_in_sender_order():
+    done = []
+
+    async def handler(payload):
+        await asyncio.sleep(0.05)
+        done.append(payload["n"])
+
+    for n in range(3):
+        message_queue.enqueue("+5511", {"n": n})
+    for n in range(3, 6):
+        message_queue.enqueue(f"+55{n}", {"n": n})
+    _run_worker(handler, timeout=0.5, concurrency=4)
+    assert [n for n in done if n < 3] == [0, 1, 2]
+    assert sorted(done) == list(range(6))
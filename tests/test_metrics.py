@@ -0,0 +1,39 @@
+import pytest
+from app import metrics
+from database import connection
+
+
+@pytest.fixture
+def pool_stats(monkeypatch):
+    stats = {"created": 3, "checkouts": 10, "discarded": 1, "timeouts": 0, "health_check_failures": 0,
+             "wait_seconds_total": 0.5, "wait_seconds_max": 0.2, "size": 5, "open": 3, "in_use": 1, "idle": 2}
+    monkeypatch.setattr(connection, "pool_stats", lambda: stats)
+    return stats
+
+
+def test_pool_counters_are_exported_as_counters(pool_stats):
+    text = metrics.render()
+    assert "# TYPE db_pool_checkouts_total counter" in text
+    assert "db_pool_checkouts_total 10" in text
+    assert "# TYPE db_pool_wait_seconds_total counter" in text
+    assert "# TYPE db_pool_in_use gauge" in text
+    assert "# TYPE db_pool_wait_seconds_max gauge" in text
+    assert "db_pool_checkouts " not in text
+
+
+def test_metrics_endpoint_is_hidden_without_token(flask_app, monkeypatch, pool_stats):
+    monkeypatch.delenv("METRICS_TOKEN", raising=False)
+    monkeypatch.delenv("METRICS_PUBLIC", raising=False)
+    client = flask_app.test_client()
+    assert client.get("/metrics").status_code == 404
+    monkeypatch.setenv("METRICS_PUBLIC", "1")
+    assert client.get("/metrics").status_code == 200
+
+
+def test_metrics_endpoint_requires_token(flask_app, monkeypatch, pool_stats):
+    monkeypatch.setenv("METRICS_TOKEN", "segredo")
+    client = flask_app.test_client()
+    assert client.get("/metrics").status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer segredo"})
+    assert response.status_code == 200
+    assert "db_pool_created_total 3" in response.get_data(as_text=True)
@@ -0,0 +1,43 @@
+from app.product_index import ProductIndex, tokenize
+
+CATALOGO = [
+    {"codigo": "CAF-01", "produto": "Café torrado 500g", "unidade_medida": "pct", "valor_venda": 18.9},
+    {"codigo": "CAF-02", "produto": "Café em cápsulas", "unidade_medida": "cx", "valor_venda": 32.0},
+    {"codigo": "ACU-01", "produto": "Açúcar refinado", "unidade_medida": "kg", "valor_venda": 5.5},
+    {"codigo": "LEI-01", "produto": "Leite integral", "unidade_medida": "l", "valor_venda": 6.2},
+]
+
+
+def _codigos(resultados):
+    return [produto["codigo"] for produto in resultados]
+
+
+def test_tokenize_folds_accents_plurals_and_stopwords():
+    assert tokenize("Quanto custa os Cafés?") == ["cafe"]
+    assert tokenize("Cápsulas de 10,5") == ["capsula", "10,5"]
+
+
+def test_search_ranks_matching_products():
+    index = ProductIndex()
+    index.upsert(CATALOGO)
+    assert set(_codigos(index.search("tem café?"))) == {"CAF-01", "CAF-02"}
+    assert _codigos(index.search("café em cápsulas", k=1)) == ["CAF-02"]
+    assert index.search("pneu de bicicleta") == []
+
+
+def test_search_by_full_code():
+    index = ProductIndex()
+    index.upsert(CATALOGO)
+    assert _codigos(index.search("acu-01", k=1)) == ["ACU-01"]
+
+
+def test_upsert_replaces_and_remove_drops_products():
+    index = ProductIndex()
+    index.upsert(CATALOGO)
+    index.upsert([{"codigo": "LEI-01", "produto": "Leite desnatado", "unidade_medida": "l"}])
+    assert len(index) == 4
+    assert index.search("integral") == []
+    assert _codigos(index.search("desnatado")) == ["LEI-01"]
+    index.remove(["LEI-01"])
+    assert index.search("leite") == []
+    assert index.stats()["produtos"] == 3
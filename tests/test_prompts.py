@@ -0,0 +1,46 @@
+from app import data_versions, prompts
+
+PERSONA = {
+    "nome_agente": "Ana",
+    "funcao_agente": "vendedora",
+    "idioma": "português",
+    "tom_voz": "Amigável",
+    "tamanho_resposta": "Curta",
+    "diretrizes_1": "Não ofereça descontos",
+    "diretrizes_2": "  ",
+}
+
+
+def test_compile_prompt_from_persona():
+    compiled = prompts.compile_prompt(PERSONA)
+    assert compiled.system_prompt.startswith("Você é Ana, vendedora")
+    assert "tom de voz amigável" in compiled.system_prompt
+    assert "- Não ofereça descontos" in compiled.system_prompt
+    assert compiled.max_tokens == prompts.MAX_TOKENS_BY_TAMANHO["Curta"]
+
+
+def test_compile_prompt_without_persona_uses_default():
+    compiled = prompts.compile_prompt(None)
+    assert compiled.system_prompt == prompts.DEFAULT_SYSTEM_PROMPT
+    assert compiled.max_tokens == prompts.DEFAULT_MAX_TOKENS
+
+
+def test_prompt_is_recompiled_only_when_company_data_changes(monkeypatch):
+    calls = []
+    monkeypatch.setattr(prompts, "get_persona_by_empresa", lambda empresa_id: calls.append(empresa_id) or PERSONA)
+    prompts.get_prompt(201)
+    prompts.get_prompt(201)
+    assert calls == [201]
+    data_versions.bump(201)
+    prompts.get_prompt(201)
+    assert calls == [201, 201]
+
+
+def test_build_messages_adds_products_and_history():
+    compiled = prompts.compile_prompt(PERSONA)
+    history = [{"role": "user", "content": "oi"}, {"role": "assistant", "content": "olá"}]
+    produtos = [{"codigo": "C1", "produto": "Café", "valor_venda": 1234.5, "unidade_medida": "kg"}]
+    messages = prompts.build_messages(compiled, "quanto custa?", produtos, history)
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+    assert "- C1: Café — R$ 1.234,50/kg" in messages[0]["content"]
+    assert messages[-1]["content"] == "quanto custa?"
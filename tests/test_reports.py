@@ -0,0 +1,181 @@
+import copy
+from datetime import datetime, timedelta
+import pytest
+from reports import generate_reports
+from tests.conftest import FakeConnection
+
+AGORA = datetime(2026, 10, 17, 12, 0, 0)
+
+
+# MySQL em memória só com o que o job de agregação usa: marca d'água, eventos e agregados
+# (ON DUPLICATE KEY soma). As escritas só valem depois do commit, como numa transação
+class RollupDB:
+    def __init__(self):
+        self.now = AGORA
+        self.state = {"watermark": {}, "eventos": [], "rollup": {}}
+        self.fail_next_rollup = False
+        self.conns = []
+
+    def add_evento(self, empresa_id, recebido_em, criado_em=None, sucesso=1, cache_hit=0, latencia_ms=100, produtos=0):
+        evento_id = len(self.state["eventos"]) + 1
+        self.state["eventos"].append((evento_id, empresa_id, recebido_em, criado_em or recebido_em, sucesso, cache_hit, latencia_ms, produtos))
+        return evento_id
+
+    def connect(self):
+        self.conns.append(RollupConnection(self))
+        return self.conns[-1]
+
+    def totais(self, granularidade="day"):
+        return {key[0]: valores for key, valores in self.state["rollup"].items() if key[1] == granularidade}
+
+
+class RollupConnection(FakeConnection):
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+        self.tx = None
+
+    def cursor(self, dictionary=False, **kwargs):
+        return RollupCursor(self)
+
+    def data(self):
+        if self.tx is None:
+            self.tx = copy.deepcopy(self.db.state)
+        return self.tx
+
+    def commit(self):
+        super().commit()
+        if self.tx is not None:
+            self.db.state, self.tx = self.tx, None
+
+    def rollback(self):
+        super().rollback()
+        self.tx = None
+
+
+class RollupCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._rows = []
+
+    def execute(self, statement, params=None):
+        self.conn.statements.append((statement, params))
+        data = self.conn.data()
+        if statement.startswith("INSERT IGNORE INTO rollup_watermark"):
+            data["watermark"].setdefault(params[0], 0)
+        elif "FROM rollup_watermark" in statement:
+            self._rows = [(data["watermark"][params[0]], self.conn.db.now)]
+        elif "FROM eventos_conversa" in statement:
+            watermark, limit = params
+            self._rows = [evento for evento in data["eventos"] if evento[0] > watermark][:limit]
+        elif statement.startswith("UPDATE rollup_watermark"):
+            data["watermark"][params[1]] = params[0]
+        else:
+            raise AssertionError(f"consulta inesperada: {statement}")
+
+    def executemany(self, statement, rows):
+        self.conn.statements.append((statement, rows))
+        if self.conn.db.fail_next_rollup:
+            self.conn.db.fail_next_rollup = False
+            raise ConnectionError("MySQL fora do ar")
+        rollup = self.conn.data()["rollup"]
+        for empresa_id, granularidade, periodo, *valores in rows:
+            atual = rollup.get((empresa_id, granularidade, periodo))
+            if atual is None:
+                rollup[(empresa_id, granularidade, periodo)] = list(valores)
+            else:
+                mensagens, sucessos, cache_hits, latencia_total, latencia_max, produtos = valores
+                rollup[(empresa_id, granularidade, periodo)] = [
+                    atual[0] + mensagens, atual[1] + sucessos, atual[2] + cache_hits,
+                    atual[3] + latencia_total, max(atual[4], latencia_max), atual[5] + produtos,
+                ]
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = RollupDB()
+    monkeypatch.setattr(generate_reports, "connect_db", db.connect)
+    monkeypatch.setattr(generate_reports, "SAFETY_SECONDS", 5)
+    return db
+
+
+def _antigo(minutos=10):
+    return AGORA - timedelta(minutes=minutos)
+
+
+def test_batch_aggregates_events_and_advances_watermark(db):
+    db.add_evento(1, _antigo(), latencia_ms=100, produtos=2)
+    db.add_evento(1, _antigo(), sucesso=0, cache_hit=1, latencia_ms=300)
+    db.add_evento(2, _antigo())
+    db.add_evento(None, _antigo())
+    assert generate_reports.rollup_batch() == 4
+    assert db.state["watermark"][generate_reports.WATERMARK] == 4
+    assert set(db.totais("day")) == {1, 2, generate_reports.SEM_EMPRESA}
+    dia = AGORA.replace(hour=0, minute=0)
+    assert db.state["rollup"][(1, "day", dia)] == [2, 1, 1, 400, 300, 2]
+    assert db.state["rollup"][(1, "hour", _antigo().replace(minute=0))] == [2, 1, 1, 400, 300, 2]
+
+
+def test_recent_events_wait_for_the_safety_window(db):
+    db.add_evento(1, _antigo())
+    db.add_evento(1, _antigo())
+    db.add_evento(1, AGORA - timedelta(seconds=1))
+    # Confirmado depois do anterior, mas com horário antigo: fica para o próximo lote mesmo assim
+    db.add_evento(1, _antigo())
+    assert generate_reports.rollup_batch() == 2
+    assert db.state["watermark"][generate_reports.WATERMARK] == 2
+    assert db.state["rollup"][(1, "day", AGORA.replace(hour=0, minute=0))][0] == 2
+
+    db.now = AGORA + timedelta(seconds=10)
+    assert generate_reports.rollup_batch() == 2
+    assert db.state["watermark"][generate_reports.WATERMARK] == 4
+    assert db.state["rollup"][(1, "day", AGORA.replace(hour=0, minute=0))][0] == 4
+
+
+def test_only_recent_events_leave_watermark_untouched(db):
+    db.add_evento(1, AGORA - timedelta(seconds=1))
+    assert generate_reports.rollup_batch() == 0
+    assert db.state["watermark"][generate_reports.WATERMARK] == 0
+    assert db.state["rollup"] == {}
+    assert db.conns[-1].rollbacks == 1
+
+
+def test_rerunning_does_not_count_events_twice(db):
+    for _ in range(3):
+        db.add_evento(1, _antigo())
+    assert generate_reports.run_rollups() == 3
+    antes = copy.deepcopy(db.state["rollup"])
+    assert generate_reports.run_rollups() == 0
+    assert db.state["rollup"] == antes
+
+
+def test_failed_batch_is_rolled_back_and_retried_once(db):
+    for _ in range(3):
+        db.add_evento(1, _antigo())
+    db.fail_next_rollup = True
+    with pytest.raises(ConnectionError):
+        generate_reports.rollup_batch()
+    assert db.state["watermark"][generate_reports.WATERMARK] == 0
+    assert db.state["rollup"] == {}
+    assert generate_reports.rollup_batch() == 3
+    assert db.state["rollup"][(1, "day", AGORA.replace(hour=0, minute=0))][0] == 3
+
+
+def test_run_rollups_processes_every_batch(db):
+    for i in range(5):
+        db.add_evento(1 + i % 2, _antigo())
+    assert generate_reports.run_rollups(batch_size=2) == 5
+    assert db.state["watermark"][generate_reports.WATERMARK] == 5
+    assert {empresa_id: linha[0] for empresa_id, linha in db.totais().items()} == {1: 3, 2: 2}
+    # Três lotes: 2 + 2 + 1 (o último, menor que o lote, encerra)
+    assert sum(conn.commits for conn in db.conns) == 6
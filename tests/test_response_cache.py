@@ -0,0 +1,41 @@
+from app import response_cache
+
+
+def test_normalize_message_ignores_case_accents_and_punctuation():
+    assert response_cache.normalize_message("Qual o PREÇO??") == response_cache.normalize_message("qual o preco")
+
+
+def test_store_and_lookup_from_memory_and_shared_layer():
+    response_cache.store(101, "Qual o horário?", "Das 8h às 18h")
+    assert response_cache.lookup(101, "qual o horario") == "Das 8h às 18h"
+    # Outro processo (memória vazia) encontra a resposta no SQLite
+    response_cache._memory.clear()
+    assert response_cache.lookup(101, "Qual o horário?") == "Das 8h às 18h"
+    assert response_cache.lookup(102, "Qual o horário?") is None
+
+
+def test_invalidate_drops_only_the_company_scope():
+    response_cache.store(103, "entrega?", "Sim")
+    response_cache.store(104, "entrega?", "Não")
+    response_cache.invalidate(103)
+    assert response_cache.lookup(103, "entrega?") is None
+    assert response_cache.lookup(104, "entrega?") == "Não"
+
+
+def test_long_messages_are_not_cached():
+    message = "a " * response_cache.MAX_MESSAGE_LENGTH
+    response_cache.store(105, message, "resposta")
+    assert response_cache.lookup(105, message) is None
+
+
+def test_expired_rows_are_purged_from_the_shared_layer(monkeypatch):
+    monkeypatch.setattr(response_cache, "PURGE_EVERY", 2)
+    monkeypatch.setattr(response_cache, "CACHE_TTL", 0)
+    response_cache._stats["stores"] = 0
+    response_cache.store(106, "frete?", "Grátis")
+    response_cache.store(106, "pix?", "Sim")
+    monkeypatch.setattr(response_cache, "CACHE_TTL", 3600)
+    response_cache.store(106, "cartão?", "Sim")
+    rows = response_cache._db().execute("SELECT key FROM responses WHERE scope = '106'").fetchall()
+    assert len(rows) == 1
+    assert response_cache.purge_expired() == 0
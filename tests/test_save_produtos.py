@@ -0,0 +1,60 @@
+import pytest
+from app import models
+from tests.conftest import FakeConnection
+
+
+def produto(codigo, nome="Produto", valor="10.50", **extra):
+    return dict({"codigo": codigo, "produto": nome, "valor_unitario": valor, "unidade_medida": "UN"}, **extra)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    conn = FakeConnection()
+    monkeypatch.setattr(models, "connect_db", lambda: conn)
+    return conn
+
+
+def _writes(conn):
+    return [rows for statement, rows in conn.statements if "INSERT INTO produtos" in statement]
+
+
+def test_invalid_rows_are_ignored_and_valid_ones_inserted(db):
+    result = models.save_produtos(1, [
+        produto("A1"), produto("A2", valor="abc"), produto("", nome="Sem código"), "não é dict", produto("A3"),
+    ])
+    assert result["success"]
+    assert result["inserted"] == 2
+    assert [row[1] for row in _writes(db)[0]] == ["A1", "A3"]
+    assert db.commits == 1
+
+
+def test_valor_venda_defaults_to_unit_price_minus_discount(db):
+    result = models.save_produtos(1, [produto("A1", valor="10", desconto="2.5")])
+    assert result["data"][0]["valor_venda"] == pytest.approx(7.5)
+
+
+def test_duplicates_without_update_reject_the_list(db):
+    db.results = [[("A1",)]]
+    result = models.save_produtos(1, [produto("A1"), produto("A2")])
+    assert not result["success"]
+    assert result["duplicates"] == ["A1"]
+    assert _writes(db) == []
+
+
+def test_skip_duplicates_inserts_only_new_codes(db):
+    db.results = [[("A1",)]]
+    result = models.save_produtos(1, [produto("A1"), produto("A2")], skip_duplicates=True)
+    assert result["success"]
+    assert result["inserted"] == 1
+    assert result["duplicates"] == ["A1"]
+    assert [row[1] for row in _writes(db)[0]] == ["A2"]
+
+
+def test_update_counts_each_code_once(db):
+    db.results = [[("A1",)]]
+    result = models.save_produtos(1, [produto("A1"), produto("A2"), produto("A2", nome="Novo nome")], update=True)
+    assert result["inserted"] == 1
+    assert result["updated"] == 1
+    rows = _writes(db)[0]
+    # Código repetido no arquivo: com update vale a última linha
+    assert [(row[1], row[2]) for row in rows] == [("A1", "Produto"), ("A2", "Novo nome")]
@@ -0,0 +1,104 @@
+import json
+from app import import_jobs, models
+
+
+def produto(codigo, nome="Produto", valor="10", **extra):
+    return dict({"codigo": codigo, "produto": nome, "valor_unitario": valor, "unidade_medida": "UN"}, **extra)
+
+
+CATALOGO = [produto("A1", "Café"), produto("A2", "Chá"), produto("A3", "Leite")]
+
+
+def _escritos(db):
+    return [row[1] for conn in db.conns for statement, rows in conn.statements if "INSERT INTO produtos" in statement for row in rows]
+
+
+def test_first_sync_inserts_everything(catalog_db):
+    result = models.sync_produtos(1, CATALOGO)
+    assert result["success"]
+    assert (result["inserted"], result["updated"], result["unchanged"], result["deleted"]) == (3, 0, 0, 0)
+    assert result["diff"]["inserted"] == ["A1", "A2", "A3"]
+    assert set(catalog_db.catalogo(1)) == {"A1", "A2", "A3"}
+
+
+def test_resync_writes_only_new_and_changed_products(catalog_db):
+    models.sync_produtos(1, CATALOGO)
+    catalog_db.conns.clear()
+    result = models.sync_produtos(1, [produto("A1", "Café"), produto("A2", "Chá", valor="12"), produto("A4", "Pão")])
+    assert (result["inserted"], result["updated"], result["unchanged"], result["deleted"]) == (1, 1, 1, 0)
+    assert result["diff"] == {"inserted": ["A4"], "updated": ["A2"], "deleted": []}
+    assert sorted(_escritos(catalog_db)) == ["A2", "A4"]
+    # Sem delete_missing, o produto que não veio continua no catálogo
+    assert set(catalog_db.catalogo(1)) == {"A1", "A2", "A3", "A4"}
+    assert catalog_db.catalogo(1)["A2"]["valor_unitario"] == 12.0
+
+
+def test_unchanged_catalog_writes_nothing_and_keeps_caches(catalog_db, monkeypatch):
+    models.sync_produtos(1, CATALOGO)
+    catalog_db.conns.clear()
+    invalidated = []
+    monkeypatch.setattr(models.response_cache, "invalidate", lambda empresa_id: invalidated.append(empresa_id))
+    result = models.sync_produtos(1, list(reversed(CATALOGO)))
+    assert (result["inserted"], result["updated"], result["unchanged"]) == (0, 0, 3)
+    assert _escritos(catalog_db) == []
+    assert invalidated == []
+
+
+def test_product_saved_without_hash_counts_as_changed(catalog_db):
+    models.save_produtos(1, [produto("A1", "Café")])
+    catalog_db.produtos[(1, "A1")]["hash_linha"] = None
+    result = models.sync_produtos(1, [produto("A1", "Café")])
+    assert (result["updated"], result["unchanged"]) == (1, 0)
+
+
+def test_delete_missing_removes_only_products_not_sent(catalog_db):
+    models.sync_produtos(1, CATALOGO)
+    models.sync_produtos(2, CATALOGO)
+    # A3 veio com valor inválido: é ignorado, mas não apagado
+    result = models.sync_produtos(1, [produto("A1", "Café"), produto("A3", "Leite", valor="abc")], delete_missing=True)
+    assert (result["unchanged"], result["deleted"], result["ignored"]) == (1, 1, 1)
+    assert result["diff"]["deleted"] == ["A2"]
+    assert "1 removidos" in result["message"]
+    assert set(catalog_db.catalogo(1)) == {"A1", "A3"}
+    assert set(catalog_db.catalogo(2)) == {"A1", "A2", "A3"}
+
+
+def test_remover_produtos_ausentes_deletes_missing_codes(catalog_db):
+    models.sync_produtos(1, CATALOGO)
+    models.sync_produtos(2, CATALOGO)
+    assert models.remover_produtos_ausentes(1, {"A2"}) == ["A1", "A3"]
+    assert set(catalog_db.catalogo(1)) == {"A2"}
+    assert set(catalog_db.catalogo(2)) == {"A1", "A2", "A3"}
+    assert models.remover_produtos_ausentes(1, {"A2"}) == []
+
+
+def _importar(tmp_path, produtos, delete_missing):
+    path = tmp_path / "catalogo.json"
+    path.write_text(json.dumps(produtos), encoding="utf-8")
+    job_id = import_jobs.create_job(1, 1, "catalogo.json", update=False, sync=True)
+    import_jobs.run_import(job_id, 1, str(path), "json", update=False, sync=True, delete_missing=delete_missing)
+    return import_jobs.get_job(job_id, 1)
+
+
+def test_import_job_reports_sync_counts(catalog_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(import_jobs, "INGEST_CHUNK_SIZE", 2)
+    models.sync_produtos(1, CATALOGO)
+    arquivo = [produto("A1", "Café"), produto("A2", "Chá verde"), produto("A4", "Pão"), produto("", "Sem código")]
+    job = _importar(tmp_path, arquivo, delete_missing=False)
+    assert job["status"] == "done" and job["sync"]
+    assert (job["inserted"], job["updated"], job["unchanged"], job["deleted"], job["failed"]) == (1, 1, 1, 0, 1)
+    assert job["written"] == 2
+    assert "1 sem alteração" in job["message"]
+    assert "removido" not in job["message"]
+    assert set(catalog_db.catalogo(1)) == {"A1", "A2", "A3", "A4"}
+
+
+def test_import_job_deletes_missing_after_every_chunk(catalog_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(import_jobs, "INGEST_CHUNK_SIZE", 2)
+    models.sync_produtos(1, CATALOGO + [produto("A5", "Sal")])
+    # Os códigos de todos os lotes contam: só A2 e A5 não vieram no arquivo
+    job = _importar(tmp_path, [produto("A1", "Café"), produto("A3", "Leite"), produto("A4", "Pão")], delete_missing=True)
+    assert job["status"] == "done"
+    assert (job["inserted"], job["unchanged"], job["deleted"]) == (1, 2, 2)
+    assert "2 removido(s)" in job["message"]
+    assert set(catalog_db.catalogo(1)) == {"A1", "A3", "A4"}
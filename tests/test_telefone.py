@@ -0,0 +1,99 @@
+import pytest
+from app import models
+from tests.conftest import FakeConnection
+
+EMPRESA = {"razao_social": "Padaria", "nome_fantasia": "Padaria", "cnpj": "1", "tipo_empresa": "ME",
+           "telefone": "(11) 98765-4321", "email_empresarial": "padaria@example.com"}
+USUARIO = {"nome": "Dono", "email": "dono@example.com", "senha": "segredo", "plano": "Plus"}
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    models._entity_caches["telefone"].clear()
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    conns = []
+    queued = []
+
+    def connect():
+        conns.append(FakeConnection(results=queued.pop(0) if queued else None))
+        return conns[-1]
+
+    monkeypatch.setattr(models, "connect_db", connect)
+    return conns, queued
+
+
+@pytest.mark.parametrize("telefone, esperado", [
+    ("+55 11 98765-4321", "+5511987654321"),
+    ("whatsapp:+5511987654321", "+5511987654321"),
+    ("(11) 98765-4321", "+5511987654321"),
+    ("011 98765-4321", "+5511987654321"),
+    ("0055 11 98765-4321", "+5511987654321"),
+    ("+1 415 555 0100", "+14155550100"),
+    ("98765", None),
+    ("", None),
+    (None, None),
+])
+def test_normalize_telefone(telefone, esperado):
+    assert models.normalize_telefone(telefone) == esperado
+
+
+def test_lookup_uses_exact_match_on_normalized_number(fake_db):
+    conns, queued = fake_db
+    queued.append([[{"id": 7}]])
+    assert models.get_empresa_id_by_telefone("whatsapp:+55 (11) 98765-4321") == 7
+    statement, params = conns[0].statements[0]
+    assert "telefone_e164 = %s" in statement
+    assert "LIKE" not in statement
+    assert params == ("+5511987654321",)
+    # A mesma empresa escrita de outro jeito cai na mesma entrada do cache
+    assert models.get_empresa_id_by_telefone("(11) 98765-4321") == 7
+    assert len(conns) == 1
+
+
+def test_suffix_of_another_number_does_not_match(fake_db):
+    conns, queued = fake_db
+    queued.append([[]])
+    assert models.get_empresa_id_by_telefone("+44 11 98765-4321") is None
+    assert conns[0].statements[0][1] == ("+4411987654321",)
+
+
+def test_invalid_number_skips_the_database(fake_db):
+    conns, _ = fake_db
+    assert models.get_empresa_id_by_telefone("1234") is None
+    assert conns == []
+
+
+def test_signup_stores_normalized_number(fake_db, monkeypatch):
+    conns, queued = fake_db
+    monkeypatch.setattr(models.auth, "hash_password", lambda senha: "hash")
+    queued.append([[], []])
+    ok, _ = models.cadastrar_usuario_empresa(USUARIO, EMPRESA)
+    assert ok
+    insert = [params for statement, params in conns[0].statements if "INSERT INTO empresas" in statement][0]
+    assert insert[7:9] == ("(11) 98765-4321", "+5511987654321")
+
+
+def test_signup_rejects_number_of_another_company(fake_db, monkeypatch):
+    conns, queued = fake_db
+    monkeypatch.setattr(models.auth, "hash_password", lambda senha: "hash")
+    queued.append([[], [{"id": 3}]])
+    ok, mensagem = models.cadastrar_usuario_empresa(USUARIO, dict(EMPRESA, telefone="+55 11 98765-4321"))
+    assert not ok
+    assert "já está registrado" in mensagem
+    assert not any("INSERT" in statement for statement, _ in conns[0].statements)
+
+
+def test_backfill_fills_valid_numbers_once(fake_db):
+    conns, queued = fake_db
+    queued.append([
+        [{"id": 1, "telefone": "(11) 98765-4321"}, {"id": 2, "telefone": "abc"},
+         {"id": 3, "telefone": "+55 11 98765-4321"}, {"id": 4, "telefone": "21 3333-4444"}],
+        [],
+    ])
+    assert models.preencher_telefones_e164() == 2
+    updates = [params for statement, params in conns[0].statements if statement.startswith("UPDATE")]
+    assert updates == [("+5511987654321", 1), ("+552133334444", 4)]
+    assert conns[0].commits == 1
@@ -0,0 +1,62 @@
+from app import models
+
+
+def produto(codigo, nome, valor="10"):
+    return {"codigo": codigo, "produto": nome, "valor_unitario": valor, "unidade_medida": "UN"}
+
+
+def test_same_code_lives_in_each_company_catalog(catalog_db):
+    assert models.save_produtos(1, [produto("A1", "Café torrado")])["inserted"] == 1
+    # Outra empresa com o mesmo código não é duplicata
+    result = models.save_produtos(2, [produto("A1", "Chá mate")])
+    assert result["success"] and result["inserted"] == 1 and result["duplicates"] == []
+    assert catalog_db.catalogo(1)["A1"]["produto"] == "Café torrado"
+    assert catalog_db.catalogo(2)["A1"]["produto"] == "Chá mate"
+
+
+def test_update_does_not_overwrite_another_company_product(catalog_db):
+    models.save_produtos(1, [produto("A1", "Café torrado", valor="18.90")])
+    models.save_produtos(2, [produto("A1", "Chá mate")])
+    result = models.save_produtos(2, [produto("A1", "Chá verde", valor="7")], update=True)
+    assert (result["inserted"], result["updated"]) == (0, 1)
+    assert catalog_db.catalogo(1)["A1"]["produto"] == "Café torrado"
+    assert catalog_db.catalogo(1)["A1"]["valor_unitario"] == 18.9
+    assert catalog_db.catalogo(2)["A1"]["produto"] == "Chá verde"
+
+
+def test_duplicates_are_checked_only_in_the_caller_catalog(catalog_db):
+    models.save_produtos(1, [produto("A1", "Café torrado")])
+    result = models.save_produtos(1, [produto("A1", "Outro café")])
+    assert not result["success"] and result["duplicates"] == ["A1"]
+    assert models.save_produtos(2, [produto("A1", "Chá mate")])["success"]
+
+
+def test_product_search_reads_only_the_caller_catalog(catalog_db):
+    models.save_produtos(1, [produto("A1", "Café torrado")])
+    models.save_produtos(2, [produto("B1", "Chá mate")])
+    assert [p["codigo"] for p in models.get_produtos_relevantes(1, "tem café?", 5)] == ["A1"]
+    assert models.get_produtos_relevantes(1, "tem chá?", 5) == []
+    assert [p["codigo"] for p in models.get_produtos_relevantes(2, "tem chá?", 5)] == ["B1"]
+
+
+def test_product_queries_are_filtered_by_empresa_id(catalog_db):
+    models.save_produtos(7, [produto("A1", "Café torrado")], update=True)
+    models.get_produtos_relevantes(7, "café", 5)
+    statements = [(statement, params) for conn in catalog_db.conns for statement, params in conn.statements]
+    for statement, params in statements:
+        assert "empresa_id" in statement
+        rows = params if isinstance(params[0], (list, tuple)) else [params]
+        assert all(row[0] == 7 for row in rows)
+
+
+def test_persona_reads_and_upserts_are_per_company(catalog_db):
+    assert models.save_persona(1, {"nome_agente": "Ana", "diretrizes": ["Sem descontos"]})
+    assert models.save_persona(2, {"nome_agente": "Beto"})
+    assert models.get_persona_by_empresa(1)["nome_agente"] == "Ana"
+    assert models.get_persona_by_empresa(2)["nome_agente"] == "Beto"
+    # A segunda gravação da empresa 2 é um UPDATE restrito a ela
+    assert models.save_persona(2, {"nome_agente": "Bia"})
+    assert catalog_db.personas[1]["nome_agente"] == "Ana"
+    assert catalog_db.personas[1]["diretrizes_1"] == "Sem descontos"
+    assert models.get_persona_by_empresa(2)["nome_agente"] == "Bia"
+    assert models.get_persona_by_empresa(3) is None
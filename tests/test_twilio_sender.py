@@ -0,0 +1,101 @@
+import asyncio
+import socket
+import pytest
+from app import twilio_sender
+from app.twilio_sender import FakeTwilioServer, PermanentSendError, SendError, TokenBucket
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(twilio_sender, "MAX_RETRIES", 2)
+    monkeypatch.setattr(twilio_sender, "RETRY_BASE", 0)
+    monkeypatch.setenv("TWILIO_ACCOUNT_SID", "ACteste")
+    monkeypatch.setenv("TWILIO_AUTH_TOKEN", "token")
+    monkeypatch.setattr(twilio_sender, "_sender", None)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    fake = FakeTwilioServer().start()
+    monkeypatch.setenv("TWILIO_API_URL", fake.url)
+    yield fake
+    fake.stop()
+
+
+def _closed_port_url():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return f"http://127.0.0.1:{port}"
+
+
+def test_split_message_prefers_sentence_breaks():
+    text = "Primeira frase. " * 10
+    segments = twilio_sender.split_message(text, limit=50)
+    assert all(len(segment) <= 50 for segment in segments)
+    assert all(segment.endswith(".") for segment in segments)
+    assert " ".join(segments) == text.strip()
+
+
+def test_token_bucket_allows_a_burst_then_waits():
+    bucket = TokenBucket(rate=100, burst=3)
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert 0 < bucket.acquire() < 0.1
+    # Sem vaga dentro do tempo limite, o envio desiste (a fila tenta de novo depois)
+    slow = TokenBucket(rate=1, burst=1)
+    slow.acquire()
+    with pytest.raises(SendError):
+        slow.acquire(timeout=0.1)
+    assert TokenBucket(rate=0, burst=1).acquire() == 0.0
+
+
+def test_rate_limited_send_is_retried(server):
+    server.error_rate = 1.0
+    with pytest.raises(SendError) as raised:
+        twilio_sender.send_whatsapp("+5511999990000", "oi")
+    assert not isinstance(raised.value, PermanentSendError)
+    assert server.errors == 3
+    server.error_rate = 0.0
+    assert len(twilio_sender.send_whatsapp("+5511999990000", "oi")) == 1
+    assert server.messages[-1]["To"] == "whatsapp:+5511999990000"
+
+
+def test_client_errors_are_permanent(server):
+    server.error_rate = 1.0
+    server.error_status = 400
+    with pytest.raises(PermanentSendError):
+        twilio_sender.send_whatsapp("+5511999990000", "oi")
+    assert server.errors == 1
+
+
+def test_async_connection_refused_is_retryable_and_closes_the_session(monkeypatch):
+    monkeypatch.setenv("TWILIO_API_URL", _closed_port_url())
+
+    async def send():
+        with pytest.raises(SendError) as raised:
+            await twilio_sender.send_whatsapp_async("+5511999990000", "oi")
+        sender = twilio_sender.get_sender()
+        return raised.value, dict(sender._async_clients)
+
+    error, clients = asyncio.run(send())
+    assert not isinstance(error, PermanentSendError)
+    assert "3 tentativas" in str(error)
+    assert clients == {}
+
+
+def test_async_send_resumes_after_sent_segments(server):
+    body = "\n\n".join(letra * 1000 for letra in "abc")
+    sent = []
+
+    async def on_sent(count):
+        sent.append(count)
+
+    async def send():
+        sids = await twilio_sender.send_whatsapp_async("+5511999990000", body, skip=1, on_sent=on_sent)
+        await twilio_sender.get_sender().close_async()
+        return sids
+
+    assert len(asyncio.run(send())) == 2
+    assert sent == [2, 3]
+    assert [message["Body"] for message in server.messages] == ["b" * 1000, "c" * 1000]
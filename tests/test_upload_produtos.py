@@ -0,0 +1,58 @@
+import json
+import pytest
+from app import import_jobs, models, routes
+from tests.conftest import FakeConnection
+
+PRODUTOS = [
+    {"codigo": "A1", "produto": "Existente", "valor_unitario": 10, "unidade_medida": "UN"},
+    {"codigo": "A2", "produto": "Novo", "valor_unitario": 12, "unidade_medida": "UN"},
+]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    # O catálogo da empresa já tem o código A1
+    conns = []
+
+    def connect():
+        conns.append(FakeConnection(results=[[("A1",)]]))
+        return conns[-1]
+
+    monkeypatch.setattr(models, "connect_db", connect)
+    return conns
+
+
+def _inserted(conns):
+    return [row[1] for conn in conns for statement, rows in conn.statements if "INSERT INTO produtos" in statement for row in rows]
+
+
+def test_small_list_skips_existing_codes(logged_client, db):
+    response = logged_client.post("/upload_produtos", json={"produtos": PRODUTOS})
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body["success"]
+    assert body["inserted"] == 1
+    assert body["duplicates"] == ["A1"]
+    assert _inserted(db) == ["A2"]
+
+
+def test_background_import_uses_the_same_duplicate_policy(db, tmp_path):
+    path = tmp_path / "produtos.json"
+    path.write_text(json.dumps(PRODUTOS), encoding="utf-8")
+    job_id = import_jobs.create_job(1, 1, "produtos.json", update=False)
+    import_jobs.run_import(job_id, 1, str(path), "json", update=False)
+    job = import_jobs.get_job(job_id, 1)
+    assert job["status"] == "done"
+    assert job["inserted"] == 1
+    assert job["duplicates"] == ["A1"]
+    assert _inserted(db) == ["A2"]
+
+
+def test_large_list_goes_to_background_job(logged_client, monkeypatch, tmp_path):
+    started = []
+    monkeypatch.setattr(routes, "IMPORT_ASYNC_THRESHOLD", 1)
+    monkeypatch.setattr(routes, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr(import_jobs, "start_import", lambda job_id, *args: started.append(args))
+    response = logged_client.post("/upload_produtos", json={"produtos": PRODUTOS})
+    assert response.status_code == 202
+    assert len(started) == 1
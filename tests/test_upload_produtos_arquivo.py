@@ -0,0 +1,43 @@
+import io
+import pytest
+from app import import_jobs, routes
+
+
+@pytest.fixture
+def started(monkeypatch, tmp_path):
+    jobs = []
+    monkeypatch.setattr(routes, "UPLOAD_FOLDER", str(tmp_path))
+    monkeypatch.setattr(routes, "MAX_IMPORT_FILE_SIZE", 1024)
+    monkeypatch.setattr(import_jobs, "start_import", lambda job_id, *args: jobs.append((job_id, args)))
+    return jobs
+
+
+def _csv(size):
+    header = b"codigo,produto,valor_unitario,unidade_medida\n"
+    return header + b"A1,Produto,10,UN\n" * max(1, (size - len(header)) // 16)
+
+
+def test_small_file_starts_import(logged_client, started, tmp_path):
+    response = logged_client.post("/upload_produtos_arquivo", data={"file": (io.BytesIO(_csv(200)), "produtos.csv")})
+    assert response.status_code == 202
+    assert len(started) == 1
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_oversized_upload_is_rejected_before_reading_the_body(logged_client, started, tmp_path):
+    response = logged_client.post("/upload_produtos_arquivo", data={"file": (io.BytesIO(_csv(4096)), "produtos.csv")})
+    assert response.status_code == 413
+    assert started == []
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_oversized_chunked_upload_stops_while_streaming(logged_client, started, tmp_path):
+    from werkzeug.test import EnvironBuilder
+    builder = EnvironBuilder(path="/upload_produtos_arquivo", method="POST", data={"file": (io.BytesIO(_csv(4096)), "produtos.csv")})
+    environ = builder.get_environ()
+    # Sem Content-Length (transfer-encoding chunked): o limite vale durante a leitura
+    del environ["CONTENT_LENGTH"]
+    environ["wsgi.input_terminated"] = True
+    response = logged_client.open(environ)
+    assert response.status_code == 413
+    assert started == []